@@ -7,23 +7,43 @@ Instrucciones:
 2. BUSCA AUTOMÁTICAMENTE el archivo 'mapa_clasificacion_k*.nc' más
    reciente en la carpeta '../data_kmeans'.
 3. EXTRAE el valor 'k' del nombre de ese archivo.
-4. Carga el archivo .nc e identifica los clústeres usando puntos de muestra.
-5. Genera el mapa final de hábitats.
+4. Carga el archivo .nc e identifica los clústeres usando puntos de muestra
+   (todos en una sola búsqueda vectorizada; con --tierra-cercana, los que
+   caen en océano toman la celda de tierra más cercana).
+   Con --ocurrencias archivo.csv|.parquet, en lugar de los puntos de muestra
+   se usan todos los registros del archivo: cada especie se asocia a los
+   clústeres con al menos --umbral de sus registros (ver 'ocurrencias_especies.py').
+5. Aplica los filtros geográficos de '../data_auxiliar/filtros_habitat.json'
+   (ver 'filtros_habitat.py') y genera el mapa final de hábitats
+   (con --vista-previa, a baja resolución).
+   Si la figura ya está al día no se redibuja, salvo con --forzar.
+6. Con --todos-k se analizan a la vez TODOS los 'mapa_clasificacion_k*.nc':
+   se cargan una vez en un cubo (k x lat x lon), los puntos (o las celdas
+   de las ocurrencias) se resuelven contra todos los k con una sola
+   indexación, se guarda la tabla especie x k en
+   '../data_kmeans/habitats_por_k.csv' y las figuras de cada k se dibujan
+   en paralelo (--procesos N).
 """
 
 # 1. Importar librerías
 import matplotlib
 matplotlib.use('Agg') # Modo no interactivo
 
-import xarray as xr
+import argparse
 import os
 import glob
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-from cartopy.util import add_cyclic_point
 import warnings
 import re # Para extraer el número del nombre
+from mapas_clases import VALOR_RELLENO, leer_mapa_clases
+from busqueda_puntos import LocalizadorClases
+from filtros_habitat import RUTA_FILTROS, cargar_filtros, compilar_mascaras, aplicar_habitats
+from ocurrencias_especies import (tabla_frecuencias, celdas_por_especie, frecuencias_por_k,
+                                  zonas_por_frecuencia, UMBRAL_FRACCION)
+from cache_figuras import huella_figura, figura_al_dia
+from renderizado_mapas import crear_figura_mapas, dibujar_clases, dibujar_costas, guardar_figura, renderizar_en_paralelo
 
 # =============================================================================
 # >> CONFIGURACIÓN DE PUNTOS DE MUESTRA <<
@@ -52,6 +72,13 @@ PUNTOS_MUESTRA = {
     }
 }
 
+# Si un punto cae en océano, usar la celda de tierra más cercana (hasta esta distancia)
+BUSCAR_TIERRA_CERCANA = False
+DISTANCIA_MAXIMA_TIERRA_KM = 300
+
+# Procesos para dibujar las figuras de cada k con --todos-k
+N_PROCESOS = os.cpu_count() or 1
+
 # Rutas
 RUTA_KMEANS = "../data_kmeans"
 RUTA_FIGURES = "../figures"
@@ -86,10 +113,159 @@ def encontrar_nc_mas_reciente():
     return archivo_mas_reciente, k_extraido
 
 
-def identificar_habitats_reciente():
+def encontrar_todos_los_nc():
+    """Lista [(archivo, k), ...] de todos los 'mapa_clasificacion_k*.nc', ordenada por k."""
+    archivos = []
+    for ruta in glob.glob(os.path.join(RUTA_KMEANS, 'mapa_clasificacion_k*.nc')):
+        match = re.search(r'mapa_clasificacion_k(\d+)\.nc', os.path.basename(ruta))
+        if match:
+            archivos.append((ruta, int(match.group(1))))
+    return sorted(archivos, key=lambda archivo: archivo[1])
+
+
+def cargar_cubo_clases(archivos):
+    """
+    Carga todos los mapas en un único cubo entero (n_k x lat x lon, -1 = sin
+    datos). Devuelve (cubo, lats, lons, lista_k); los mapas con un grid
+    distinto al del primero se descartan con un aviso.
+    """
+    mapas, lista_k = [], []
+    lats = lons = None
+    for ruta, k in archivos:
+        clases = leer_mapa_clases(ruta)['climate_class'].transpose('lat', 'lon')
+        if lats is None:
+            lats, lons = clases['lat'].values, clases['lon'].values
+        elif not (np.array_equal(clases['lat'].values, lats) and np.array_equal(clases['lon'].values, lons)):
+            print(f"¡AVISO! {os.path.basename(ruta)} usa otro grid; se omite.")
+            continue
+        mapas.append(clases.values)
+        lista_k.append(k)
+    tipo = np.result_type(*[m.dtype for m in mapas])
+    return np.stack(mapas).astype(tipo), lats, lons, lista_k
+
+
+def zonas_desde_puntos_muestra(localizador, tierra_cercana=BUSCAR_TIERRA_CERCANA):
+    """Clústeres de cada especie a partir de los PUNTOS_MUESTRA."""
+    print("\n--- Extrayendo clústeres de los puntos de muestra ---")
+    registros = [(oso, nombre_loc, lat, lon)
+                 for oso, puntos in PUNTOS_MUESTRA.items()
+                 for nombre_loc, (lat, lon) in puntos.items()]
+    clusters_puntos = localizador.clases_en_puntos(
+        [r[2] for r in registros], [r[3] for r in registros],
+        tierra_cercana=tierra_cercana, distancia_maxima_km=DISTANCIA_MAXIMA_TIERRA_KM
+    )
+
+    zonas_por_habitat = {oso: set() for oso in PUNTOS_MUESTRA}
+    oso_actual = None
+    for (oso, nombre_loc, lat, lon), cluster_id in zip(registros, clusters_puntos.tolist()):
+        if oso != oso_actual:
+            print(f"\nProcesando: {oso}")
+            oso_actual = oso
+        if cluster_id != VALOR_RELLENO:
+            print(f"  -> {nombre_loc} ({lat}N, {lon}E): Clúster {cluster_id}")
+            zonas_por_habitat[oso].add(cluster_id)
+        else:
+            print(f"  -> {nombre_loc} ({lat}N, {lon}E): Sin datos (océano)")
+
+    return {oso: sorted(zonas) for oso, zonas in zonas_por_habitat.items()}
+
+
+def zonas_desde_ocurrencias(ruta_ocurrencias, localizador, k, tierra_cercana=BUSCAR_TIERRA_CERCANA,
+                            umbral=UMBRAL_FRACCION):
+    """
+    Clústeres de cada especie a partir de un archivo de ocurrencias: los que
+    reúnen al menos 'umbral' de sus registros. Guarda la tabla de frecuencias.
+    """
+    print("\n--- Asignando registros de ocurrencia a clústeres ---")
+    tabla = tabla_frecuencias(ruta_ocurrencias, localizador, k, tierra_cercana, DISTANCIA_MAXIMA_TIERRA_KM)
+    return zonas_desde_tabla(tabla, k, umbral)
+
+
+def zonas_desde_tabla(tabla, k, umbral=UMBRAL_FRACCION, mostrar=True):
+    """
+    Guarda la tabla de frecuencias (especie x clúster) de un k y devuelve los
+    clústeres de cada especie (los que reúnen al menos 'umbral' de sus registros).
+    """
+    ruta_tabla = os.path.join(RUTA_KMEANS, f"frecuencias_especies_k{k}.csv")
+    tabla.to_csv(ruta_tabla, float_format='%.6g')
+    zonas_por_habitat = zonas_por_frecuencia(tabla, umbral)
+    if not mostrar:
+        return zonas_por_habitat
+
+    print(f"  Tabla especie x clúster guardada en: {ruta_tabla}")
+    for especie, fila in tabla.iterrows():
+        en_tierra = fila.drop('sin_datos').sum()
+        zonas = zonas_por_habitat.get(especie)
+        detalle = f"Clústeres {zonas}" if zonas is not None else "descartada (pocos registros en tierra)"
+        print(f"  -> {especie}: {en_tierra:.0f} registros en tierra, {fila['sin_datos']:.0f} sin datos | {detalle}")
+    return zonas_por_habitat
+
+
+def huella_mapa_habitats(clases, lats, lons, k, zonas_por_habitat, filtros, vista_previa=False):
+    """
+    Huella de la figura de hábitats: clases, coordenadas, filtros y las
+    máscaras que generan en este grid (quedan en caché para el dibujo).
+    """
+    mascaras = compilar_mascaras(filtros, lats, lons)
+    return huella_figura('mapa_clusters_osos_pandaversion', (clases, lats, lons) + tuple(mascaras.values()),
+                         k=k, zonas=zonas_por_habitat, filtros=filtros, especies_filtradas=list(mascaras),
+                         vista_previa=vista_previa)
+
+
+def dibujar_mapa_habitats(clases, lats, lons, k, zonas_por_habitat, filtros, ruta_salida,
+                          vista_previa=False, huella=None):
+    """
+    Figura de hábitats de un mapa: 1 panel global + 1 por especie, en 2
+    columnas. Está a nivel de módulo para poder dibujarse en otro proceso.
+    """
+    # --- 2 columnas: 1 panel global + 1 por especie (3x2 para las 4 especies de muestra) ---
+    # (proyección, costas y malla se calculan una vez para todos los paneles)
+    n_filas = (len(zonas_por_habitat) + 2) // 2
+    fig, axes = crear_figura_mapas(nrows=n_filas, ncols=2, figsize=(20, 6 * n_filas))
+
+    # --- Panel 0: Mapa Global de Referencia ---
+    ax = axes[0]
+    ax.set_title(f"Clima Global (k={k}) - Referencia")
+    dibujar_clases(ax, lats, lons, clases, k, alpha_costas=0.6, rejilla_alpha=0.3)
+    
+    # --- Paneles 1..N: Hábitats por Clúster ---
+    # Clústeres + filtros geográficos de todas las especies en una sola pasada
+    # (p. ej. el Oso Perezoso solo en Asia y el Oso Panda solo en el centro de China)
+    especies = list(zonas_por_habitat.keys())
+    mascaras = compilar_mascaras(filtros, lats, lons)
+    habitats = aplicar_habitats(clases, zonas_por_habitat, mascaras, k)
+    
+    for i in range(len(axes) - 1):
+        ax = axes[i+1]
+        if i < len(especies):
+            oso = especies[i]
+            zonas = zonas_por_habitat[oso]
+            
+            if not zonas:
+                ax.set_title(f"Hábitat: {oso} (¡Ningún clúster encontrado!)")
+                dibujar_costas(ax, alpha=0.6)
+                ax.set_global()
+                continue
+
+            ax.set_title(f"Hábitat: {oso} (Clústeres: {zonas})")
+            dibujar_clases(ax, lats, lons, habitats[i], k,
+                           alpha_costas=0.6, rejilla_alpha=0.3)
+        else:
+            # Oculta el panel sobrante (si el número de especies es par)
+            ax.set_visible(False)
+
+    plt.tight_layout(pad=2.0)
+    
+    guardar_figura(fig, ruta_salida, vista_previa, huella)
+    return ruta_salida
+
+
+def identificar_habitats_reciente(vista_previa=False, forzar=False, tierra_cercana=BUSCAR_TIERRA_CERCANA,
+                                  ruta_ocurrencias=None, umbral=UMBRAL_FRACCION, ruta_filtros=RUTA_FILTROS):
     """
     Función principal que encuentra el 'k' más reciente, carga el mapa
-    e identifica los clústeres de osos.
+    e identifica los clústeres de osos (con los PUNTOS_MUESTRA o, si se da
+    'ruta_ocurrencias', con las frecuencias de un archivo de ocurrencias).
     """
     print("===========================================================")
     print(f"Identificando Hábitats por Clúster (Archivo más reciente)")
@@ -109,7 +285,8 @@ def identificar_habitats_reciente():
 
     # --- 2. Cargar el mapa de clasificación correspondiente ---
     try:
-        ds = xr.open_dataset(archivo_nc)
+        # Clases enteras con -1 en las celdas sin datos (ver 'mapas_clases.py')
+        ds = leer_mapa_clases(archivo_nc)
         mapa_climas = ds['climate_class']
     except Exception as e:
         print(f"¡ERROR! No se pudo abrir el archivo: {archivo_nc}")
@@ -118,130 +295,165 @@ def identificar_habitats_reciente():
 
     print(f"Mapa '{os.path.basename(archivo_nc)}' cargado con éxito.")
 
-    # --- 3. Identificar clústeres en los puntos de muestra ---
-    print("\n--- Extrayendo clústeres de los puntos de muestra ---")
-    zonas_por_habitat = {}
-    
-    for oso, puntos in PUNTOS_MUESTRA.items():
-        zonas_encontradas = set()
-        print(f"\nProcesando: {oso}")
-        
-        for nombre_loc, (lat, lon) in puntos.items():
-            try:
-                data_punto = mapa_climas.sel(lat=lat, lon=lon, method='nearest')
-                # 1. Obtenemos el valor como float primero
-                cluster_id_float = data_punto.item() 
-                
-                # 2. Comprobamos si es NaN ANTES de convertir a int
-                if not np.isnan(cluster_id_float):
-                    cluster_id = int(cluster_id_float)
-                    print(f"  -> {nombre_loc} ({lat}N, {lon}E): Clúster {cluster_id}")
-                    zonas_encontradas.add(cluster_id)
-                else:
-                    # 3. Informamos del NaN correctamente
-                    print(f"  -> {nombre_loc} ({lat}N, {lon}E): Sin datos (NaN)")
-            except Exception as e:
-                print(f"  -> Error procesando {nombre_loc}: {e}")
-        
-        zonas_por_habitat[oso] = sorted(list(zonas_encontradas))
+    # --- 3. Identificar clústeres de cada especie ---
+    # Todos los puntos se resuelven en una sola llamada (ver 'busqueda_puntos.py')
+    localizador = LocalizadorClases.desde_mapa(mapa_climas)
+    if ruta_ocurrencias:
+        zonas_por_habitat = zonas_desde_ocurrencias(ruta_ocurrencias, localizador, k_automatico,
+                                                    tierra_cercana, umbral)
+    else:
+        zonas_por_habitat = zonas_desde_puntos_muestra(localizador, tierra_cercana)
     
     print("\n--- Resumen de Clústeres por Especie ---")
     print(zonas_por_habitat)
 
     # --- 4. Generar el mapa ---
     print("\n--- Generando mapa de hábitats por clúster ---")
+    ruta_salida = os.path.join(RUTA_FIGURES, f"mapa_clusters_osos_pandaversion_k{k_automatico}.png")
+    filtros = cargar_filtros(ruta_filtros)
+    lats, lons = mapa_climas['lat'].values, mapa_climas['lon'].values
+    huella = huella_mapa_habitats(mapa_climas.values, lats, lons, k_automatico, zonas_por_habitat,
+                                  filtros, vista_previa)
+    if figura_al_dia(ruta_salida, huella, forzar):
+        print("===========================================================")
+        return
     
-    lats = mapa_climas['lat'].values
-    data_ciclica, lon_ciclica = add_cyclic_point(mapa_climas.values, coord=mapa_climas['lon'])
-    
-    # --- Ajustado a 3x2 (6 paneles) para 1 global + 4 especies ---
-    fig, axes = plt.subplots(
-        nrows=3, ncols=2, 
-        figsize=(20, 18),
-        subplot_kw={'projection': ccrs.Robinson()}
-    )
-    
-    axes = axes.flatten()
-    
-    levels = np.arange(-0.5, k_automatico, 1)
-    # Usamos tab20 para hasta 20 clústeres
-    cmap = plt.get_cmap('tab20', k_automatico) 
+    dibujar_mapa_habitats(mapa_climas.values, lats, lons,
+                          k_automatico, zonas_por_habitat, filtros, ruta_salida, vista_previa, huella)
+    print(f"\n¡Mapa de clústeres guardado en: {ruta_salida}!")
+    print("===========================================================")
 
-    # --- Panel 0: Mapa Global de Referencia ---
-    ax = axes[0]
-    ax.set_title(f"Clima Global (k={k_automatico}) - Referencia")
-    ax.coastlines(alpha=0.6)
-    ax.gridlines(linestyle='--', alpha=0.3)
-    ax.contourf(lon_ciclica, lats, data_ciclica,
-    levels=levels, transform=ccrs.PlateCarree(), cmap=cmap)
-    
-    # --- Paneles 1-4: Hábitats por Clúster ---
-    especies = list(zonas_por_habitat.keys())
-    
-    for i in range(5):
-        ax = axes[i+1]
-        if i < len(especies):
-            oso = especies[i]
-            zonas = zonas_por_habitat[oso]
-            
-            if not zonas:
-                ax.set_title(f"Hábitat: {oso} (¡Ningún clúster encontrado!)")
-                ax.coastlines(alpha=0.6)
-                ax.set_global()
-                continue
 
-            mapa_mascara = mapa_climas.where(mapa_climas.isin(zonas))
-
-            # --- ¡FILTRO GEOGRÁFICO PARA OSO PEREZOSO! ---
-            # El Clúster 6 (Tropical Seco) es correcto para India,
-            # pero un falso positivo en Australia y África.
-            # Le decimos que SÓLO muestre el Clúster 6 en el continente Asiático
-            # (ej. Longitud > 40°E y Latitud > 0°N)
-            if oso == "Oso Perezoso" and zonas:
-                # 'zonas' contiene los clústeres de este oso (p.ej. [6] para k=9, o [4] para k=7)
-                # Donde el clúster sea uno de los de 'zonas' Y esté fuera de Asia...
-                mapa_mascara = mapa_mascara.where(
-                    ~((mapa_mascara.isin(zonas)) & ((mapa_mascara.lon < 40) | (mapa_mascara.lat < 0)))
-                )
-            # --- FIN DEL FILTRO ---
-            
-            # <--- MODIFICACIÓN: Añadido filtro geográfico para Oso Panda --->
-            # El clúster del panda puede aparecer en otros lugares (falsos positivos).
-            # Restringimos el clúster SÓLO a la región de China donde habita.
-            if oso == "Oso Panda" and zonas: # Si se encontró algún clúster para el panda
-                # Definimos el "cuadro" geográfico del hábitat del panda
-                lat_min, lat_max = 28, 35
-                lon_min, lon_max = 102, 109
-                
-                # Mantenemos los datos SÓLO si están dentro del cuadro geográfico.
-                # Todo lo demás (falsos positivos) se convierte en NaN.
-                mapa_mascara = mapa_mascara.where(
-                    (mapa_mascara.lat >= lat_min) & (mapa_mascara.lat <= lat_max) &
-                    (mapa_mascara.lon >= lon_min) & (mapa_mascara.lon <= lon_max)
-                )
-            # <--- FIN DE LA MODIFICACIÓN --->
-            
-            data_mascara_ciclica, _ = add_cyclic_point(
-                mapa_mascara.values, coord=mapa_climas['lon']
-            )
-            
-            ax.set_title(f"Hábitat: {oso} (Clústeres: {zonas})")
-            ax.coastlines(alpha=0.6)
-            ax.gridlines(linestyle='--', alpha=0.3)
-            ax.set_global()
-            ax.contourf(lon_ciclica, lats, data_mascara_ciclica,
-                        levels=levels, transform=ccrs.PlateCarree(), cmap=cmap)
-        else:
-            # Oculta los paneles sobrantes (en este caso, el panel 6 o axes[5])
-            ax.set_visible(False)
+def zonas_todos_k_desde_puntos(cubo, lats, lons, lista_k, tierra_cercana=BUSCAR_TIERRA_CERCANA):
+    """
+    {k: {especie: [clústeres]}} de los PUNTOS_MUESTRA en todos los mapas:
+    una búsqueda de celdas y una sola indexación del cubo para todos los k.
+    """
+    registros = [(oso, lat, lon) for oso, puntos in PUNTOS_MUESTRA.items() for lat, lon in puntos.values()]
+    # Las celdas con datos son las mismas en todos los k (las de tierra del PCA)
+    localizador = LocalizadorClases.desde_mascara(lats, lons, (cubo != VALOR_RELLENO).any(axis=0))
+    celdas = localizador.indices_planos([r[1] for r in registros], [r[2] for r in registros],
+                                        tierra_cercana, DISTANCIA_MAXIMA_TIERRA_KM)
+    clases = cubo.reshape(len(lista_k), -1)[:, np.maximum(celdas, 0)] # n_k x n_puntos
+    clases[:, celdas < 0] = VALOR_RELLENO
 
-    plt.tight_layout(pad=2.0)
-    
-    ruta_salida = os.path.join(RUTA_FIGURES, f"mapa_clusters_osos_pandaversion_k{k_automatico}.png")
-    plt.savefig(ruta_salida, dpi=300)
-    print(f"\n¡Mapa de clústeres guardado en: {ruta_salida}!")
+    zonas_por_k = {}
+    for i, k in enumerate(lista_k):
+        zonas = {oso: set() for oso in PUNTOS_MUESTRA}
+        for (oso, _, _), cluster_id in zip(registros, clases[i].tolist()):
+            if cluster_id != VALOR_RELLENO:
+                zonas[oso].add(cluster_id)
+        zonas_por_k[k] = {oso: sorted(z) for oso, z in zonas.items()}
+    return zonas_por_k
+
+
+def zonas_todos_k_desde_ocurrencias(ruta_ocurrencias, cubo, lats, lons, lista_k,
+                                    tierra_cercana=BUSCAR_TIERRA_CERCANA, umbral=UMBRAL_FRACCION):
+    """
+    {k: {especie: [clústeres]}} a partir de un archivo de ocurrencias, leído
+    una sola vez. Guarda la tabla de frecuencias de cada k.
+    """
+    print("\n--- Asignando registros de ocurrencia a clústeres ---")
+    localizador = LocalizadorClases.desde_mascara(lats, lons, (cubo != VALOR_RELLENO).any(axis=0))
+    celdas = celdas_por_especie(ruta_ocurrencias, localizador, tierra_cercana, DISTANCIA_MAXIMA_TIERRA_KM)
+    print(f"  Registros de {len(celdas)} especies leídos de {os.path.basename(ruta_ocurrencias)}")
+    tablas = frecuencias_por_k(celdas, cubo.reshape(len(lista_k), -1), lista_k)
+    return {k: zonas_desde_tabla(tabla, k, umbral, mostrar=False) for k, tabla in tablas.items()}
+
+
+def tabla_habitats_por_k(zonas_por_k):
+    """DataFrame especie x k con los clústeres de hábitat ('' si no hay ninguno)."""
+    especies = list(dict.fromkeys(e for zonas in zonas_por_k.values() for e in zonas))
+    tabla = pd.DataFrame(index=pd.Index(especies, name='especie'),
+                         columns=pd.Index(list(zonas_por_k), name='k'), dtype=object)
+    for k, zonas in zonas_por_k.items():
+        for especie in especies:
+            tabla.loc[especie, k] = ' '.join(str(c) for c in zonas.get(especie, []))
+    return tabla
+
+
+def identificar_habitats_todos_k(vista_previa=False, forzar=False, tierra_cercana=BUSCAR_TIERRA_CERCANA,
+                                 ruta_ocurrencias=None, umbral=UMBRAL_FRACCION, ruta_filtros=RUTA_FILTROS,
+                                 n_procesos=N_PROCESOS):
+    """
+    Igual que 'identificar_habitats_reciente', pero para todos los mapas
+    'mapa_clasificacion_k*.nc' a la vez: tabla especie x k y una figura por k.
+    """
+    print("===========================================================")
+    print("Identificando Hábitats por Clúster (todos los k)")
+    print("===========================================================")
+    os.makedirs(RUTA_FIGURES, exist_ok=True)
+    warnings.filterwarnings("ignore", category=FutureWarning)
+
+    # --- 1. Cargar todos los mapas en un cubo k x lat x lon ---
+    archivos = encontrar_todos_los_nc()
+    if not archivos:
+        print(f"¡ERROR! No se encontró ningún archivo 'mapa_clasificacion_k*.nc' en {RUTA_KMEANS}")
+        return
+    try:
+        cubo, lats, lons, lista_k = cargar_cubo_clases(archivos)
+    except Exception as e:
+        print(f"¡ERROR! No se pudieron abrir los mapas de clasificación: {e}")
+        return
+    print(f"\n--- {len(lista_k)} mapas cargados (k = {', '.join(map(str, lista_k))}) ---")
+
+    # --- 2. Identificar clústeres de cada especie en todos los k ---
+    if ruta_ocurrencias:
+        zonas_por_k = zonas_todos_k_desde_ocurrencias(ruta_ocurrencias, cubo, lats, lons, lista_k,
+                                                      tierra_cercana, umbral)
+    else:
+        zonas_por_k = zonas_todos_k_desde_puntos(cubo, lats, lons, lista_k, tierra_cercana)
+
+    tabla = tabla_habitats_por_k(zonas_por_k)
+    ruta_tabla = os.path.join(RUTA_KMEANS, 'habitats_por_k.csv')
+    tabla.to_csv(ruta_tabla)
+    print("\n--- Clústeres de hábitat por especie y k ---")
+    print(tabla.to_string())
+    print(f"Tabla guardada en: {ruta_tabla}")
+
+    # --- 3. Figuras de cada k (solo las que no están al día), en paralelo ---
+    filtros = cargar_filtros(ruta_filtros)
+    tareas = []
+    for i, k in enumerate(lista_k):
+        ruta_salida = os.path.join(RUTA_FIGURES, f"mapa_clusters_osos_pandaversion_k{k}.png")
+        huella = huella_mapa_habitats(cubo[i], lats, lons, k, zonas_por_k[k], filtros, vista_previa)
+        if figura_al_dia(ruta_salida, huella, forzar):
+            continue
+        tareas.append((dibujar_mapa_habitats, dict(clases=cubo[i], lats=lats, lons=lons, k=k,
+                                                   zonas_por_habitat=zonas_por_k[k], filtros=filtros,
+                                                   ruta_salida=ruta_salida, vista_previa=vista_previa,
+                                                   huella=huella)))
+    print(f"\n--- Dibujando {len(tareas)} figuras ({n_procesos} proceso(s)) ---")
+    for ruta_salida in renderizar_en_paralelo(tareas, n_procesos):
+        print(f"  -> {ruta_salida}")
     print("===========================================================")
 
 # --- Ejecutar el script ---
 if __name__ == "__main__":
-    identificar_habitats_reciente()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Identifica los hábitats en el mapa K-means más reciente.")
+    parser.add_argument('--vista-previa', action='store_true',
+                        help="Guarda la figura a baja resolución (mucho más rápido).")
+    parser.add_argument('--forzar', action='store_true',
+                        help="Redibuja la figura aunque ya esté al día.")
+    parser.add_argument('--tierra-cercana', action='store_true', default=BUSCAR_TIERRA_CERCANA,
+                        help="Asigna los puntos en océano a la celda de tierra más cercana.")
+    parser.add_argument('--ocurrencias', default=None,
+                        help="Archivo CSV o Parquet de ocurrencias (especie, lat, lon[, peso]) "
+                             "que sustituye a los PUNTOS_MUESTRA.")
+    parser.add_argument('--umbral', type=float, default=UMBRAL_FRACCION,
+                        help="Fracción mínima de registros para que un clúster sea hábitat de una especie.")
+    parser.add_argument('--filtros', default=RUTA_FILTROS,
+                        help="Archivo JSON con los filtros geográficos de hábitat de cada especie.")
+    parser.add_argument('--todos-k', action='store_true',
+                        help="Analiza todos los mapas 'mapa_clasificacion_k*.nc' en lugar del más reciente.")
+    parser.add_argument('--procesos', type=int, default=N_PROCESOS,
+                        help="Número de procesos para dibujar las figuras (con --todos-k).")
+    args = parser.parse_args()
+    if args.todos_k:
+        identificar_habitats_todos_k(vista_previa=args.vista_previa, forzar=args.forzar,
+                                     tierra_cercana=args.tierra_cercana, ruta_ocurrencias=args.ocurrencias,
+                                     umbral=args.umbral, ruta_filtros=args.filtros, n_procesos=args.procesos)
+    else:
+        identificar_habitats_reciente(vista_previa=args.vista_previa, forzar=args.forzar,
+                                      tierra_cercana=args.tierra_cercana, ruta_ocurrencias=args.ocurrencias,
+                                      umbral=args.umbral, ruta_filtros=args.filtros)
\ No newline at end of file
@@ -7,10 +7,16 @@ Instrucciones:
 2. Carga todas las variables de la carpeta 'data_ensemble'.
 3. Prepara los datos: los combina, aplana y estandariza.
 4. Aplica PCA para reducir la dimensionalidad.
-5. Guarda los componentes principales y el modelo PCA entrenado.
+5. Guarda los componentes principales y el modelo PCA entrenado
+   (como arrays planos .npz, ver 'modelo_portable.py').
+6. Con --conjunto se elige el conjunto de características (ver
+   'features_derivados.py'); por defecto, pr/tasmax/tasmin x 12 meses:
+       python aplicar_pca.py --conjunto extendido
+       python aplicar_pca.py --conjunto pr tas dtr amplitud_tas
 """
 
 # 1. Importar librerías
+import argparse
 import xarray as xr
 import os
 import glob
@@ -18,61 +24,47 @@ import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
-import joblib # Para guardar el modelo PCA
+from modelo_portable import guardar_modelo_pca # Para guardar el modelo PCA
+from matriz_features import RUTA_ENSEMBLE
+from features_derivados import CONJUNTOS_FEATURES, CONJUNTO_POR_DEFECTO, resolver_conjunto, matriz_conjunto
 
 # ==============================================================================
 # >> CONFIGURACIÓN <<
 # ==============================================================================
-VARIABLES_CLIMATICAS = ["pr", "tasmax", "tasmin"]
+# Conjuntos de características: CONJUNTOS_FEATURES de 'features_derivados.py'
 VARIANZA_EXPLICADA_OBJETIVO = 0.90 # 90%
 # ==============================================================================
 
-# 2. Definir rutas
-RUTA_ENSEMBLE = "../data_ensemble"
+# 2. Definir rutas (RUTA_ENSEMBLE en 'matriz_features.py')
 RUTA_PCA_SALIDA = "../data_pca"
 
 # 3. Función principal
-def ejecutar_pca():
+def ejecutar_pca(conjunto=CONJUNTO_POR_DEFECTO):
     """
     Orquesta todo el proceso de carga, preparación y aplicación de PCA.
+    'conjunto' es un nombre de CONJUNTOS_FEATURES o una lista de variables.
     """
     print("==========================================================")
     print("Iniciando Reducción de Dimensionalidad con PCA")
     print("==========================================================")
     os.makedirs(RUTA_PCA_SALIDA, exist_ok=True)
 
-    # 4. Cargar y combinar todos los datasets de ensemble
-    print(f"\n--- 1. Cargando datos de las variables: {VARIABLES_CLIMATICAS} ---")
-    
-
-    # Cargamos cada dataset, seleccionamos ÚNICAMENTE la variable de datos
-    # principal y descartamos el resto (como las 'bnds').
-    datasets = []
-    for var in VARIABLES_CLIMATICAS:
-        ruta_archivo = os.path.join(RUTA_ENSEMBLE, f"{var}_ensemble_climatologia.nc")
-        with xr.open_dataset(ruta_archivo) as ds:
-            # Nos aseguramos de quedarnos solo con la variable principal
-            datasets.append(ds[[var]])
-    
-    # Fusionamos los datasets ya limpios.
-    datos_combinados = xr.merge(datasets, compat='override')
-    datos_combinados = datos_combinados.sortby('lon')
+    # 4. Cargar las climatologías y calcular las variables del conjunto
+    # (las derivadas se leen de la caché de 'features_derivados.py' si están al día)
+    try:
+        variables = resolver_conjunto(conjunto)
+    except ValueError as e:
+        print(f"¡ERROR! {e}")
+        return
+    print(f"\n--- 1. Cargando datos de las variables: {variables} ---")
+    print("\n--- 2. Preparando la matriz de características ---")
+    datos_combinados, datos_apilados, matriz_limpia, indices_validos, columnas = \
+        matriz_conjunto(variables, RUTA_ENSEMBLE)
+    n_puntos = datos_apilados.shape[0]
     
     print("¡Datos cargados y combinados!")
     print("\nDataset combinado:")
     print(datos_combinados)
-
-    # 5. Preparar los datos para PCA
-    print("\n--- 2. Preparando la matriz de características ---")
-    datos_apilados = datos_combinados.to_array(dim='variable').stack(punto=('lat', 'lon'))
-    datos_apilados = datos_apilados.transpose('punto', 'variable', 'month')
-    
-    n_puntos, n_vars, n_meses = datos_apilados.shape
-    matriz_features = datos_apilados.values.reshape(n_puntos, n_vars * n_meses)
-    
-    indices_validos = ~np.isnan(matriz_features).any(axis=1)
-    matriz_limpia = matriz_features[indices_validos]
-    
     print(f"Matriz creada. Forma: {matriz_limpia.shape} (puntos x características)")
 
     # 6. Estandarizar los datos
@@ -112,14 +104,35 @@ def ejecutar_pca():
     pca_ds = mapa_componentes.to_dataset(dim='componente')
     # Renombramos las variables para que sean más claras
     pca_ds = pca_ds.rename({i: f'CP_{i}' for i in range(1, n_componentes + 1)})
+    pca_ds.attrs['variables'] = ' '.join(variables)
 
     ruta_salida_netcdf = os.path.join(RUTA_PCA_SALIDA, 'componentes_principales.nc')
     pca_ds.to_netcdf(ruta_salida_netcdf)
     print(f"Componentes guardados en: {ruta_salida_netcdf}")
     
-    ruta_salida_modelo = os.path.join(RUTA_PCA_SALIDA, 'pca_model.joblib')
-    joblib.dump({'pca': pca, 'scaler': scaler, 'indices_validos': indices_validos}, ruta_salida_modelo)
+    # Guardamos el modelo como arrays planos: se carga solo con NumPy y no
+    # depende de la versión de sklearn.
+    ruta_salida_modelo = os.path.join(RUTA_PCA_SALIDA, 'modelo_pca.npz')
+    guardar_modelo_pca(
+        ruta_salida_modelo,
+        scaler_media=scaler.mean_,
+        scaler_escala=scaler.scale_,
+        pca_media=pca.mean_,
+        pca_componentes=pca.components_,
+        varianza_explicada=pca.explained_variance_,
+        ratio_varianza_explicada=pca.explained_variance_ratio_,
+        indices_validos=indices_validos,
+        forma_grid=(datos_combinados.sizes['lat'], datos_combinados.sizes['lon']),
+        lat=datos_combinados['lat'].values,
+        lon=datos_combinados['lon'].values,
+        variables=variables,
+    )
     print(f"Modelo PCA, scaler e índices guardados en: {ruta_salida_modelo}")
 
 if __name__ == "__main__":
-    ejecutar_pca()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Estandariza las características y aplica PCA.")
+    parser.add_argument('--conjunto', nargs='+', default=[CONJUNTO_POR_DEFECTO],
+                        help=f"Conjunto de características ({', '.join(CONJUNTOS_FEATURES)}) "
+                             "o lista de variables (ver 'features_derivados.py').")
+    args = parser.parse_args()
+    ejecutar_pca(args.conjunto)
\ No newline at end of file
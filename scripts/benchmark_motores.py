@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+BENCHMARK DE LOS MOTORES DE CLUSTERING
+
+Instrucciones:
+1. Se ejecuta después de 'aplicar_pca.py'.
+2. Ajusta cada motor de 'motor_clustering.py' sobre la matriz de CPs para
+   varios k y mide el tiempo, el pico de memoria (tracemalloc) y la inercia
+   (recalculada igual para todos los motores).
+3. Con --replicas N se simula una grid N veces más fina replicando los
+   puntos con un pequeño ruido, para ver cómo escala cada motor.
+4. Guarda la tabla en '../data_kmeans/benchmark_motores.csv' y recomienda,
+   para cada tamaño, el motor más rápido cuya inercia no supere la mejor
+   en más de TOLERANCIA_INERCIA.
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from utilidades_kmeans import cargar_matriz_pca, inercia_por_bloques
+from motor_clustering import MOTORES, SEMILLA, crear_motor
+
+# --- CONFIGURACIÓN ---
+K_BENCHMARK = [5, 8, 10]
+REPETICIONES = 3
+REPLICAS = [1]
+TOLERANCIA_INERCIA = 0.02 # 2% por encima de la mejor inercia
+RUIDO_REPLICAS = 0.01 # Desviación del ruido, relativa a la de cada CP
+
+# --- RUTAS ---
+RUTA_PCA_IN = "../data_pca"
+RUTA_KMEANS_OUT = "../data_kmeans"
+
+
+def replicar_matriz(matriz, replicas, semilla=SEMILLA):
+    """Repite la matriz 'replicas' veces añadiendo ruido gaussiano pequeño."""
+    if replicas <= 1:
+        return matriz
+    rng = np.random.default_rng(semilla)
+    copia = np.tile(matriz, (replicas, 1))
+    return copia + rng.normal(scale=RUIDO_REPLICAS * matriz.std(axis=0), size=copia.shape)
+
+
+def medir_motor(nombre, matriz, k, repeticiones):
+    """Devuelve (tiempo medio, pico de memoria en MB, inercia) de un motor."""
+    tiempos, picos = [], []
+    for _ in range(repeticiones):
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        motor = crear_motor(nombre, k).ajustar(matriz)
+        tiempos.append(time.perf_counter() - inicio)
+        picos.append(tracemalloc.get_traced_memory()[1] / 1024 ** 2)
+        tracemalloc.stop()
+    # Misma definición de inercia para todos (la del GMM no es la de sklearn)
+    inercia, _ = inercia_por_bloques(matriz, motor.centroides, motor.predecir(matriz))
+    return float(np.mean(tiempos)), float(np.max(picos)), inercia
+
+
+def ejecutar_benchmark(lista_k=K_BENCHMARK, repeticiones=REPETICIONES, replicas=REPLICAS,
+                       motores=tuple(MOTORES)):
+    print("==========================================================")
+    print("Benchmark de motores de clustering")
+    print("==========================================================")
+    _, _, matriz_limpia = cargar_matriz_pca(RUTA_PCA_IN)
+
+    filas = []
+    for n_replicas in replicas:
+        matriz = replicar_matriz(matriz_limpia, n_replicas)
+        print(f"\n--- Matriz de {matriz.shape[0]} puntos x {matriz.shape[1]} CPs ---")
+        # Ajuste de calentamiento (carga de librerías, hilos de BLAS...) fuera de la medida
+        crear_motor(motores[0], lista_k[0]).ajustar(matriz)
+        for k in lista_k:
+            for nombre in motores:
+                tiempo, memoria, inercia = medir_motor(nombre, matriz, k, repeticiones)
+                print(f"  k={k:2d} {nombre:>13}: {tiempo*1000:9.1f} ms | {memoria:8.2f} MB | inercia {inercia:.2f}")
+                filas.append({'n_puntos': matriz.shape[0], 'k': k, 'motor': nombre,
+                              'tiempo_s': tiempo, 'memoria_mb': memoria, 'inercia': inercia})
+
+    tabla = pd.DataFrame(filas)
+    mejor = tabla.groupby(['n_puntos', 'k'])['inercia'].transform('min')
+    tabla['inercia_relativa'] = tabla['inercia'] / mejor
+    os.makedirs(RUTA_KMEANS_OUT, exist_ok=True)
+    ruta_tabla = os.path.join(RUTA_KMEANS_OUT, 'benchmark_motores.csv')
+    tabla.to_csv(ruta_tabla, index=False, float_format='%.6g')
+    print(f"\nTabla guardada en: {ruta_tabla}")
+
+    print(f"\n--- Motor recomendado por tamaño (inercia <= mejor + {TOLERANCIA_INERCIA*100:.0f}%) ---")
+    aceptables = tabla[tabla['inercia_relativa'] <= 1.0 + TOLERANCIA_INERCIA]
+    resumen = aceptables.groupby(['n_puntos', 'motor'])['tiempo_s'].sum().reset_index()
+    for n_puntos, grupo in resumen.groupby('n_puntos'):
+        # Solo cuentan los motores aceptables para todos los k
+        completos = aceptables[aceptables['n_puntos'] == n_puntos].groupby('motor')['k'].nunique()
+        grupo = grupo[grupo['motor'].isin(completos[completos == len(lista_k)].index)]
+        if grupo.empty:
+            print(f"  {n_puntos} puntos: ningún motor cumple la tolerancia en todos los k")
+            continue
+        ganador = grupo.loc[grupo['tiempo_s'].idxmin()]
+        print(f"  {n_puntos} puntos: {ganador['motor']} ({ganador['tiempo_s']*1000:.1f} ms en total)")
+    return tabla
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara los motores de clustering sobre la matriz de CPs.")
+    parser.add_argument('--k', type=int, nargs='+', default=K_BENCHMARK, help="Valores de k a probar.")
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES)
+    parser.add_argument('--replicas', type=int, nargs='+', default=REPLICAS,
+                        help="Factores de replicación de la matriz (simulan grids más finas).")
+    parser.add_argument('--motores', nargs='+', choices=list(MOTORES), default=list(MOTORES))
+    args = parser.parse_args()
+    ejecutar_benchmark(args.k, args.repeticiones, args.replicas, args.motores)
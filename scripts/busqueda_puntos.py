@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+BÚSQUEDA VECTORIZADA DE LA CLASE CLIMÁTICA EN PUNTOS (LAT, LON)
+
+Instrucciones:
+1. 'LocalizadorClases' se construye una sola vez a partir de un mapa de
+   clases (lat x lon, -1 = sin datos) y resuelve arrays enteros de
+   coordenadas en una sola llamada, sin un .sel() por punto: a clases
+   ('clases_en_puntos') o a índices de celda ('indices_planos').
+2. En grids regulares la celda más cercana se obtiene con aritmética de
+   índices; en grids irregulares, con np.searchsorted en cada eje.
+3. Los puntos que caen en océano devuelven VALOR_RELLENO (-1). Con
+   'tierra_cercana=True' se asigna en su lugar la celda de tierra más
+   cercana, buscada en un KD-tree sobre la esfera (vectores unitarios 3-D)
+   que se construye solo la primera vez que hace falta. Opcionalmente se
+   limita la distancia máxima en km.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from mapas_clases import VALOR_RELLENO
+
+RADIO_TIERRA_KM = 6371.0
+
+
+def a_vectores_unitarios(lat, lon):
+    """Convierte lat/lon en grados a vectores unitarios (N x 3) en la esfera."""
+    lat_rad = np.radians(np.asarray(lat, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat_rad)
+    return np.column_stack([cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)])
+
+
+def _indice_mas_cercano(coordenada, valores):
+    """Índice del valor de 'coordenada' (1-D, ordenada) más cercano a cada valor."""
+    paso = np.diff(coordenada)
+    if len(coordenada) > 1 and np.allclose(paso, paso[0]):
+        # Grid regular: aritmética de índices directa
+        indices = np.rint((valores - coordenada[0]) / paso[0]).astype(np.int64)
+        return np.clip(indices, 0, len(coordenada) - 1)
+    derecha = np.clip(np.searchsorted(coordenada, valores), 1, len(coordenada) - 1)
+    izquierda = derecha - 1
+    mas_cerca_izquierda = (valores - coordenada[izquierda]) <= (coordenada[derecha] - valores)
+    return np.where(mas_cerca_izquierda, izquierda, derecha)
+
+
+class LocalizadorClases:
+    """Resuelve arrays de (lat, lon) a clases de un mapa lat x lon."""
+
+    def __init__(self, lats, lons, clases):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.clases = np.asarray(clases)
+        # Las coordenadas se ordenan de forma creciente para buscar en ellas
+        self._orden_lat = np.argsort(self.lats)
+        self._orden_lon = np.argsort(self.lons)
+        self._arbol = None
+
+    @classmethod
+    def desde_mascara(cls, lats, lons, validas):
+        """Localizador sin clases: solo distingue celdas con datos (0) y sin datos."""
+        return cls(lats, lons, np.where(validas, 0, VALOR_RELLENO))
+
+    @classmethod
+    def desde_mapa(cls, mapa_da):
+        """Crea el localizador a partir de un DataArray (lat x lon) de clases."""
+        return cls(mapa_da['lat'].values, mapa_da['lon'].values, mapa_da.transpose('lat', 'lon').values)
+
+    def celdas(self, lat, lon):
+        """Índices (i_lat, i_lon) de la celda más cercana a cada punto."""
+        lat = np.asarray(lat, dtype=np.float64)
+        # Longitudes a [-180, 180), como las del grid
+        lon = (np.asarray(lon, dtype=np.float64) + 180.0) % 360.0 - 180.0
+        i_lat = self._orden_lat[_indice_mas_cercano(self.lats[self._orden_lat], lat)]
+        i_lon = self._orden_lon[_indice_mas_cercano(self.lons[self._orden_lon], lon)]
+        return i_lat, i_lon
+
+    def _arbol_tierra(self):
+        """KD-tree (construido una vez) de los centros de las celdas con datos."""
+        if self._arbol is None:
+            i_lat, i_lon = np.nonzero(self.clases != VALOR_RELLENO)
+            self._arbol = (cKDTree(a_vectores_unitarios(self.lats[i_lat], self.lons[i_lon])),
+                           i_lat * len(self.lons) + i_lon)
+        return self._arbol
+
+    def indices_planos(self, lat, lon, tierra_cercana=False, distancia_maxima_km=None):
+        """
+        Índice plano (i_lat * n_lon + i_lon, el orden de stack(punto=('lat', 'lon')))
+        de la celda de cada punto, o -1 si cae en una celda sin datos. Con
+        'tierra_cercana', esos puntos toman la celda de tierra más cercana
+        (si está a menos de 'distancia_maxima_km', cuando se indica).
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        i_lat, i_lon = self.celdas(lat, lon)
+        resultado = np.where(self.clases[i_lat, i_lon] == VALOR_RELLENO, -1, i_lat * len(self.lons) + i_lon)
+
+        sin_datos = np.flatnonzero(resultado < 0)
+        if tierra_cercana and len(sin_datos):
+            arbol, indices_tierra = self._arbol_tierra()
+            # Distancia de cuerda máxima equivalente a la distancia sobre la esfera
+            limite = np.inf if distancia_maxima_km is None else \
+                2.0 * np.sin(min(distancia_maxima_km / RADIO_TIERRA_KM, np.pi) / 2.0)
+            distancias, vecinos = arbol.query(a_vectores_unitarios(lat[sin_datos], lon[sin_datos]),
+                                              distance_upper_bound=limite)
+            encontrados = np.isfinite(distancias)
+            resultado[sin_datos[encontrados]] = indices_tierra[vecinos[encontrados]]
+        return resultado
+
+    def clases_en_puntos(self, lat, lon, tierra_cercana=False, distancia_maxima_km=None):
+        """
+        Clase de cada punto (VALOR_RELLENO en océano). Con 'tierra_cercana',
+        los puntos en océano toman la clase de la celda de tierra más
+        cercana (si está a menos de 'distancia_maxima_km', cuando se indica).
+        """
+        indices = self.indices_planos(lat, lon, tierra_cercana, distancia_maxima_km)
+        return np.where(indices < 0, VALOR_RELLENO, self.clases.ravel()[np.maximum(indices, 0)]).astype(self.clases.dtype)
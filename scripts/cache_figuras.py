@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+CACHÉ DE FIGURAS: NO REDIBUJAR PNG QUE YA ESTÁN AL DÍA
+
+Instrucciones:
+1. Antes de dibujar, cada figura calcula una huella (hash) de sus arrays de
+   entrada y de sus parámetros de dibujo (k, título, resolución...).
+2. La huella se guarda como metadato de texto dentro del propio PNG, así
+   que no hace falta ningún archivo índice aparte.
+3. Si el PNG ya existe y su huella coincide, no se vuelve a dibujar.
+   Los scripts aceptan --forzar para redibujar siempre.
+4. Si se cambia el código de dibujo, hay que subir VERSION_FIGURAS para
+   invalidar todas las figuras guardadas.
+"""
+
+import hashlib
+import json
+
+import numpy as np
+from PIL import Image
+
+VERSION_FIGURAS = 1
+CLAVE_METADATO = 'huella_figura'
+
+
+def huella_figura(nombre, arrays=(), **parametros):
+    """
+    Hash SHA-256 del nombre de la figura, de la forma, el tipo y el contenido
+    de cada array y de los parámetros (que deben poder pasarse a JSON).
+    """
+    h = hashlib.sha256()
+    h.update(f"{nombre}|v{VERSION_FIGURAS}".encode())
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        h.update(str(array.shape).encode())
+        h.update(str(array.dtype).encode())
+        h.update(array.tobytes())
+    h.update(json.dumps(parametros, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def leer_huella(ruta):
+    """Huella guardada en el PNG, o None si no existe o no tiene huella."""
+    try:
+        with Image.open(ruta) as imagen:
+            return imagen.info.get(CLAVE_METADATO)
+    except (OSError, ValueError):
+        return None
+
+
+def figura_al_dia(ruta, huella, forzar=False):
+    """True (y lo indica por pantalla) si el PNG existe con la misma huella."""
+    if forzar or leer_huella(ruta) != huella:
+        return False
+    print(f"Figura al día, no se vuelve a dibujar: {ruta}")
+    return True
+
+
+def metadatos_huella(huella):
+    """Metadatos para 'savefig(..., metadata=...)' que guardan la huella en el PNG."""
+    return {CLAVE_METADATO: huella} if huella else None
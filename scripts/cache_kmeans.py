@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+CACHÉ PERSISTENTE DE AJUSTES K-MEANS
+
+Instrucciones:
+1. Cada ajuste se identifica por una huella (hash) de la matriz de CPs, el
+   número de clústeres k, la semilla y el algoritmo.
+2. Se guardan centroides, etiquetas e inercia en '../data_kmeans/cache/'
+   como archivos .npz, así que cualquier script que vuelva a pedir el mismo
+   ajuste (codo, mapa automático, k fijos) lo lee en lugar de reentrenar.
+3. El tamaño total está acotado: al superar el límite se eliminan las
+   entradas usadas hace más tiempo (LRU por fecha de modificación).
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+RUTA_CACHE = "../data_kmeans/cache"
+TAM_MAXIMO_CACHE_MB = 256
+
+
+def huella_matriz(matriz):
+    """Hash SHA-256 de la forma, el tipo y el contenido de la matriz."""
+    matriz = np.ascontiguousarray(matriz)
+    h = hashlib.sha256()
+    h.update(str(matriz.shape).encode())
+    h.update(str(matriz.dtype).encode())
+    h.update(matriz.tobytes())
+    return h.hexdigest()
+
+
+def clave_ajuste(huella, k, semilla, algoritmo):
+    texto = f"{huella}|k={k}|semilla={semilla}|algoritmo={algoritmo}"
+    return hashlib.sha256(texto.encode()).hexdigest()[:32]
+
+
+def _ruta_entrada(clave, ruta_cache):
+    return os.path.join(ruta_cache, f"ajuste_{clave}.npz")
+
+
+def leer_ajuste(clave, ruta_cache=RUTA_CACHE):
+    """Devuelve el ajuste guardado o None si no está en la caché."""
+    ruta = _ruta_entrada(clave, ruta_cache)
+    try:
+        with np.load(ruta, allow_pickle=False) as datos:
+            resultado = {
+                'k': int(datos['k']),
+                'inercia': float(datos['inercia']),
+                'centroides': datos['centroides'],
+                'etiquetas': datos['etiquetas'].astype(np.int64),
+            }
+    except (OSError, KeyError, ValueError):
+        return None
+    # Marcamos la entrada como usada recientemente (para la política LRU)
+    try:
+        os.utime(ruta)
+    except OSError:
+        pass
+    return resultado
+
+
+def guardar_ajuste(clave, resultado, semilla, algoritmo, ruta_cache=RUTA_CACHE,
+                   tam_maximo_mb=TAM_MAXIMO_CACHE_MB):
+    """
+    Guarda un ajuste en la caché. La escritura es atómica (archivo temporal
+    + renombrado) para que varios procesos puedan escribir a la vez.
+    """
+    os.makedirs(ruta_cache, exist_ok=True)
+    etiquetas = np.asarray(resultado['etiquetas'])
+    tipo_etiquetas = np.int16 if resultado['k'] <= np.iinfo(np.int16).max else np.int32
+
+    descriptor, ruta_temporal = tempfile.mkstemp(dir=ruta_cache, suffix='.npz.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            np.savez(
+                f,
+                k=np.int32(resultado['k']),
+                inercia=np.float64(resultado['inercia']),
+                centroides=np.asarray(resultado['centroides'], dtype=np.float64),
+                etiquetas=etiquetas.astype(tipo_etiquetas),
+                semilla=np.int64(semilla),
+                algoritmo=np.asarray(algoritmo, dtype=str),
+            )
+        os.replace(ruta_temporal, _ruta_entrada(clave, ruta_cache))
+    except BaseException:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+
+    podar_cache(ruta_cache, tam_maximo_mb)
+
+
+def podar_cache(ruta_cache=RUTA_CACHE, tam_maximo_mb=TAM_MAXIMO_CACHE_MB, prefijo='ajuste_', sufijo='.npz'):
+    """
+    Elimina las entradas menos usadas hasta quedar por debajo del límite.
+    'prefijo' y 'sufijo' identifican las entradas (también se usa para la
+    caché de variables derivadas).
+    """
+    entradas = []
+    for nombre in os.listdir(ruta_cache):
+        if nombre.startswith(prefijo) and nombre.endswith(sufijo):
+            ruta = os.path.join(ruta_cache, nombre)
+            try:
+                estado = os.stat(ruta)
+            except OSError:
+                continue # Otro proceso la ha eliminado
+            entradas.append((estado.st_mtime, estado.st_size, ruta))
+
+    limite = tam_maximo_mb * 1024 * 1024
+    total = sum(tamano for _, tamano, _ in entradas)
+    for _, tamano, ruta in sorted(entradas):
+        if total <= limite:
+            break
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+        total -= tamano
+
+
+def ajustar_con_cache(matriz, k, semilla, algoritmo, funcion_ajuste, huella=None,
+                      ruta_cache=RUTA_CACHE):
+    """
+    Devuelve el ajuste de la caché si existe; si no, llama a
+    'funcion_ajuste()' (que debe devolver un diccionario con 'k', 'inercia',
+    'centroides' y 'etiquetas'), lo guarda y lo devuelve.
+    """
+    if huella is None:
+        huella = huella_matriz(matriz)
+    clave = clave_ajuste(huella, k, semilla, algoritmo)
+
+    resultado = leer_ajuste(clave, ruta_cache)
+    if resultado is not None:
+        resultado['desde_cache'] = True
+        return resultado
+
+    resultado = funcion_ajuste()
+    guardar_ajuste(clave, resultado, semilla, algoritmo, ruta_cache)
+    resultado['desde_cache'] = False
+    return resultado
@@ -4,23 +4,163 @@ CALCULA Y GUARDA EL K ÓPTIMO (MÉTODO DEL CODO)
 
 Guarda el 'k' óptimo detectado en un archivo para que el
         siguiente script pueda usarlo automáticamente.
+
+Los ajustes de cada k se reparten entre varios procesos (--procesos N).
+Con --en-caliente, cada k se inicializa con los centroides del k anterior
+más una división (secuencial, pero cada ajuste converge mucho antes).
+
+Para grids grandes, --modo minibatch (MiniBatchKMeans) o --modo submuestra
+(ajuste sobre una submuestra estratificada por latitud) evitan los ajustes
+exactos; la inercia se evalúa siempre sobre la matriz completa.
+Con --comparar-exacto se informa de cuánto se aleja el codo estimado del exacto.
+
+Además del codo, con los mismos modelos ajustados se calculan la silueta
+(muestreada), Calinski-Harabasz, Davies-Bouldin y el estadístico gap.
+Se guardan en '../data_kmeans/metricas_k.csv' y '../figures/metricas_k.png'
+(se puede desactivar con --sin-metricas).
+
+Las figuras solo se redibujan si cambian sus datos (ver 'cache_figuras.py');
+--forzar las redibuja siempre.
 """
-import xarray as xr
+import matplotlib
+matplotlib.use('Agg')
+
+import argparse
 import os
 import numpy as np
-from sklearn.cluster import KMeans
+import pandas as pd
 import matplotlib.pyplot as plt
 from kneed import KneeLocator
+from cache_figuras import huella_figura, figura_al_dia, metadatos_huella
+from utilidades_kmeans import cargar_matriz_pca, barrido_k, MODOS_BARRIDO
+from motor_clustering import MOTORES, MOTOR_POR_DEFECTO
+from metricas_clustering import (silueta_muestreada, calinski_harabasz, davies_bouldin,
+                                 estadistico_gap, k_optimo_gap, N_REFERENCIAS_GAP)
 
 # --- CONFIGURACIÓN ---
 K_RANGE = range(2, 21)
+N_PROCESOS = os.cpu_count() or 1
+ARRANQUE_EN_CALIENTE = False
+MODO_BARRIDO = 'exacto' # 'exacto', 'minibatch' o 'submuestra'
+FRACCION_SUBMUESTRA = 0.1
+MOTOR = MOTOR_POR_DEFECTO # Ver 'motor_clustering.MOTORES'
+CALCULAR_METRICAS = True
 
 # --- RUTAS ---
 RUTA_PCA_IN = "../data_pca"
 RUTA_KMEANS_OUT = "../data_kmeans" # Carpeta para guardar el k y los datos
 RUTA_FIGURES = "../figures"
 
-def calcular_y_guardar_codo():
+def detectar_codo(inercias):
+    kneedle = KneeLocator(list(K_RANGE), inercias, S=1.0, curve='convex', direction='decreasing')
+    return kneedle.elbow
+
+
+def comparar_con_exacto(matriz_limpia, inercias, k_estimado, n_procesos, motor=MOTOR):
+    """
+    Repite el barrido en modo exacto e informa de la diferencia en el codo
+    y en la curva de inercia respecto al modo escalable.
+    """
+    print("\n--- Comparando con el barrido exacto ---")
+    resultados_exactos = barrido_k(matriz_limpia, K_RANGE, n_procesos=n_procesos, motor=motor)
+    inercias_exactas = np.array([r['inercia'] for r in resultados_exactos])
+    k_exacto = detectar_codo(list(inercias_exactas))
+
+    diferencia_relativa = (np.asarray(inercias) - inercias_exactas) / inercias_exactas
+    print(f"  Codo exacto: {k_exacto} | Codo estimado: {k_estimado}")
+    if k_exacto and k_estimado:
+        print(f"  Diferencia en k: {k_estimado - k_exacto:+d}")
+    print(f"  Diferencia de inercia (estimada vs exacta): media {diferencia_relativa.mean()*100:+.2f}%, "
+          f"máxima {np.abs(diferencia_relativa).max()*100:.2f}%")
+
+
+def calcular_metricas_k(matriz_limpia, resultados, n_procesos, n_referencias=N_REFERENCIAS_GAP,
+                        modo=MODO_BARRIDO, motor=MOTOR, fraccion_submuestra=FRACCION_SUBMUESTRA, latitudes=None,
+                        en_caliente=ARRANQUE_EN_CALIENTE):
+    """
+    Calcula las métricas de cada k reutilizando los ajustes del barrido
+    y devuelve una tabla (DataFrame) indexada por k. Las referencias del gap
+    se ajustan con el mismo modo/motor/submuestra/arranque que el barrido.
+    """
+    lista_k = [r['k'] for r in resultados]
+    inercias = [r['inercia'] for r in resultados]
+
+    print("\n--- Calculando métricas adicionales (silueta, CH, DB) ---")
+    tabla = pd.DataFrame({
+        'k': lista_k,
+        'inercia': inercias,
+        'silueta': [silueta_muestreada(matriz_limpia, r['etiquetas']) for r in resultados],
+        'calinski_harabasz': [calinski_harabasz(matriz_limpia, r['etiquetas'], r['centroides']) for r in resultados],
+        'davies_bouldin': [davies_bouldin(matriz_limpia, r['etiquetas'], r['centroides']) for r in resultados],
+    })
+
+    print(f"\n--- Calculando el estadístico gap ({n_referencias} referencias) ---")
+    gap, desviacion = estadistico_gap(matriz_limpia, inercias, lista_k,
+                                      n_referencias=n_referencias, n_procesos=n_procesos,
+                                      modo=modo, motor=motor, fraccion_submuestra=fraccion_submuestra,
+                                      latitudes=latitudes, en_caliente=en_caliente)
+    tabla['gap'] = gap
+    tabla['gap_desviacion'] = desviacion
+    return tabla.set_index('k')
+
+
+def guardar_metricas_k(tabla, k_codo, forzar=False):
+    """Guarda la tabla de métricas y un gráfico con los cinco criterios."""
+    lista_k = list(tabla.index)
+    k_sugeridos = {
+        'codo (inercia)': k_codo,
+        'silueta (máx.)': int(tabla['silueta'].idxmax()),
+        'Calinski-Harabasz (máx.)': int(tabla['calinski_harabasz'].idxmax()),
+        'Davies-Bouldin (mín.)': int(tabla['davies_bouldin'].idxmin()),
+        'gap (Tibshirani)': k_optimo_gap(lista_k, tabla['gap'].values, tabla['gap_desviacion'].values),
+    }
+
+    ruta_tabla = os.path.join(RUTA_KMEANS_OUT, 'metricas_k.csv')
+    tabla.to_csv(ruta_tabla, float_format='%.6g')
+    print(f"Tabla de métricas guardada en: {ruta_tabla}")
+
+    ruta_figura = os.path.join(RUTA_FIGURES, 'metricas_k.png')
+    huella = huella_figura('metricas_k', (tabla.reset_index().to_numpy(dtype=np.float64),),
+                           k_sugeridos=k_sugeridos)
+    if not figura_al_dia(ruta_figura, huella, forzar):
+        dibujar_metricas_k(tabla, k_sugeridos, ruta_figura, huella)
+
+    print("\nk sugerido por cada criterio:")
+    for criterio, k in k_sugeridos.items():
+        print(f"  {criterio}: {k}")
+
+
+def dibujar_metricas_k(tabla, k_sugeridos, ruta_figura, huella=None):
+    """Gráfico 2x2 con la silueta, Calinski-Harabasz, Davies-Bouldin y gap."""
+    lista_k = list(tabla.index)
+    fig, axes = plt.subplots(2, 2, figsize=(14, 9), sharex=True)
+    paneles = [
+        ('silueta', 'Silueta (muestreada)', 'silueta (máx.)'),
+        ('calinski_harabasz', 'Calinski-Harabasz', 'Calinski-Harabasz (máx.)'),
+        ('davies_bouldin', 'Davies-Bouldin', 'Davies-Bouldin (mín.)'),
+        ('gap', 'Estadístico gap', 'gap (Tibshirani)'),
+    ]
+    for ax, (columna, titulo, criterio) in zip(axes.flatten(), paneles):
+        if columna == 'gap':
+            ax.errorbar(lista_k, tabla['gap'], yerr=tabla['gap_desviacion'], fmt='bo-', capsize=3)
+        else:
+            ax.plot(lista_k, tabla[columna], 'bo-', markersize=6)
+        ax.axvline(k_sugeridos[criterio], color='r', linestyle='--', label=f"k = {k_sugeridos[criterio]}")
+        ax.set_title(titulo); ax.legend(); ax.grid(True, linestyle='--', alpha=0.6)
+        ax.set_xticks(lista_k)
+    for ax in axes[1]:
+        ax.set_xlabel('Número de Clústeres (k)')
+    fig.suptitle('Criterios para elegir k')
+    fig.tight_layout()
+    fig.savefig(ruta_figura, dpi=300, metadata=metadatos_huella(huella))
+    plt.close(fig)
+    print(f"Gráfico de métricas guardado en: {ruta_figura}")
+
+
+def calcular_y_guardar_codo(n_procesos=N_PROCESOS, en_caliente=ARRANQUE_EN_CALIENTE,
+                            modo=MODO_BARRIDO, fraccion_submuestra=FRACCION_SUBMUESTRA,
+                            comparar_exacto=False, calcular_metricas=CALCULAR_METRICAS, motor=MOTOR,
+                            forzar=False):
     print("==========================================================")
     print("Paso 1: Calculando y guardando el k óptimo")
     print("==========================================================")
@@ -28,29 +168,43 @@ def calcular_y_guardar_codo():
     os.makedirs(RUTA_FIGURES, exist_ok=True)
 
     print("\n--- Cargando Componentes Principales ---")
-    pca_ds = xr.open_dataset(os.path.join(RUTA_PCA_IN, 'componentes_principales.nc'))
-    
-    datos_apilados = pca_ds.to_array(dim='componente').stack(punto=('lat', 'lon')).transpose('punto', 'componente')
-    indices_validos = ~np.isnan(datos_apilados).any(axis=1)
-    matriz_limpia = datos_apilados.values[indices_validos]
+    datos_apilados, indices_validos, matriz_limpia = cargar_matriz_pca(RUTA_PCA_IN)
+    latitudes = datos_apilados['lat'].values[indices_validos]
 
     print(f"\n--- Probando k desde {K_RANGE.start} hasta {K_RANGE.stop-1} ---")
-    inercias = [
-        KMeans(n_clusters=k, random_state=42, n_init='auto').fit(matriz_limpia).inertia_
-        for k in K_RANGE
-    ]
+    if en_caliente:
+        print("Modo en caliente: cada k parte de los centroides del k anterior.")
+    else:
+        print(f"Repartiendo los ajustes entre {n_procesos} proceso(s).")
+    print(f"Modo de ajuste: {modo} | Motor: {motor}")
+    resultados = barrido_k(matriz_limpia, K_RANGE, n_procesos=n_procesos, en_caliente=en_caliente,
+                           modo=modo, fraccion_submuestra=fraccion_submuestra, latitudes=latitudes,
+                           motor=motor)
+    inercias = [r['inercia'] for r in resultados]
         
     print("\n--- Generando el gráfico del codo ---")
-    plt.figure(figsize=(12, 7))
-    plt.plot(K_RANGE, inercias, 'bo-', markersize=8, linewidth=2)
-    plt.xlabel('Número de Clústeres (k)'); plt.ylabel('Inercia')
-    plt.title('Método del Codo para Determinar k Óptimo')
-    plt.xticks(K_RANGE); plt.grid(True, linestyle='--', alpha=0.6)
-    plt.savefig(os.path.join(RUTA_FIGURES, 'metodo_del_codo.png'), dpi=300)
+    ruta_codo = os.path.join(RUTA_FIGURES, 'metodo_del_codo.png')
+    huella = huella_figura('metodo_del_codo', (np.asarray(inercias),), k=list(K_RANGE))
+    if not figura_al_dia(ruta_codo, huella, forzar):
+        plt.figure(figsize=(12, 7))
+        plt.plot(K_RANGE, inercias, 'bo-', markersize=8, linewidth=2)
+        plt.xlabel('Número de Clústeres (k)'); plt.ylabel('Inercia')
+        plt.title('Método del Codo para Determinar k Óptimo')
+        plt.xticks(K_RANGE); plt.grid(True, linestyle='--', alpha=0.6)
+        plt.savefig(ruta_codo, dpi=300, metadata=metadatos_huella(huella))
+        plt.close()
     
     print("\n--- Detectando y guardando el 'k' óptimo ---")
-    kneedle = KneeLocator(list(K_RANGE), inercias, S=1.0, curve='convex', direction='decreasing')
-    k_optimo = kneedle.elbow
+    k_optimo = detectar_codo(inercias)
+
+    if comparar_exacto and modo != 'exacto':
+        comparar_con_exacto(matriz_limpia, inercias, k_optimo, n_procesos, motor)
+
+    if calcular_metricas:
+        tabla = calcular_metricas_k(matriz_limpia, resultados, n_procesos, modo=modo, motor=motor,
+                                    fraccion_submuestra=fraccion_submuestra, latitudes=latitudes,
+                                    en_caliente=en_caliente)
+        guardar_metricas_k(tabla, k_optimo, forzar)
 
     if k_optimo:
         # Guardar el valor en un archivo de texto
@@ -66,4 +220,26 @@ def calcular_y_guardar_codo():
         print("\nNo se pudo determinar un 'k' óptimo. Revisa el gráfico manualmente.")
 
 if __name__ == "__main__":
-    calcular_y_guardar_codo()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Calcula el k óptimo con el método del codo.")
+    parser.add_argument('--procesos', type=int, default=N_PROCESOS,
+                        help="Número de procesos para el barrido de k.")
+    parser.add_argument('--en-caliente', action='store_true', default=ARRANQUE_EN_CALIENTE,
+                        help="Inicializa cada k con los centroides del k anterior más una división.")
+    parser.add_argument('--modo', choices=MODOS_BARRIDO, default=MODO_BARRIDO,
+                        help="Tipo de ajuste: exacto, minibatch o submuestra.")
+    parser.add_argument('--fraccion', type=float, default=FRACCION_SUBMUESTRA,
+                        help="Fracción de puntos usada en el modo 'submuestra'.")
+    parser.add_argument('--comparar-exacto', action='store_true',
+                        help="Compara el codo estimado con el del barrido exacto.")
+    parser.add_argument('--motor', choices=list(MOTORES), default=MOTOR,
+                        help="Motor de clustering (ver motor_clustering.py).")
+    parser.add_argument('--sin-metricas', action='store_true',
+                        help="No calcula silueta, Calinski-Harabasz, Davies-Bouldin ni gap.")
+    parser.add_argument('--forzar', action='store_true',
+                        help="Redibuja las figuras aunque ya estén al día.")
+    args = parser.parse_args()
+    calcular_y_guardar_codo(n_procesos=args.procesos, en_caliente=args.en_caliente,
+                            modo=args.modo, fraccion_submuestra=args.fraccion,
+                            comparar_exacto=args.comparar_exacto,
+                            calcular_metricas=CALCULAR_METRICAS and not args.sin_metricas,
+                            motor=args.motor, forzar=args.forzar)
\ No newline at end of file
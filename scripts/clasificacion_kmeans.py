@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+FUNCIONES COMUNES PARA GENERAR LOS MAPAS DE CLASIFICACIÓN K-MEANS
+
+Instrucciones:
+1. Lo usan 'generar_mapa_kmeans.py' (k automático) y 'clasificar_multi_k.py'
+   (varios k en una sola ejecución).
+2. Para un ajuste ya hecho (etiquetas + centroides) guarda:
+   - '../data_kmeans/mapa_clasificacion_k[N].nc'
+   - '../data_kmeans/centroides_k[N].npz'
+   - '../figures/scatter_clasificacion_k[N].png' (o '..._cpA_cpB.png' con otro par de CPs)
+   - '../figures/mapa_clasificacion_k[N].png'
+3. Las figuras se dibujan con 'renderizado_mapas.py'; con varios k,
+   'tareas_figuras' permite reunirlas y renderizarlas en paralelo.
+4. Las figuras cuyo PNG ya está al día no se redibujan (ver 'cache_figuras.py').
+5. Si el ajuste ya se renumeró con 'linaje_clusters.py' (o hay una
+   permutación guardada para esas mismas etiquetas), todo se guarda y se
+   dibuja con los IDs del linaje.
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.cm import ScalarMappable
+
+from modelo_portable import guardar_centroides
+from motor_clustering import SEMILLA, MOTOR_POR_DEFECTO
+from utilidades_kmeans import desapilar_a_mapa
+from mapas_clases import VALOR_RELLENO, crear_dataset_clases, guardar_mapa_clases
+from linaje_clusters import ATRIBUTO_PERMUTACION, permutacion_guardada, renumerar_ajuste, renumerar_estabilidad
+from cache_figuras import huella_figura, figura_al_dia
+from renderizado_mapas import (crear_figura_mapas, dibujar_clases, barra_clases, guardar_figura,
+                               colores_clases, renderizar_en_paralelo)
+from dispersion_densidad import dibujar_densidad, N_BINS
+
+# Par de CPs (empezando en 1) del gráfico de dispersión
+COMPONENTES_SCATTER = (1, 2)
+
+RUTA_KMEANS_OUT = "../data_kmeans"
+RUTA_FIGURES = "../figures"
+
+
+def nombre_scatter(k, componentes=COMPONENTES_SCATTER):
+    """Nombre del PNG del scatter ('scatter_clasificacion_k[N].png' para CP1 vs CP2)."""
+    sufijo = '' if tuple(componentes) == COMPONENTES_SCATTER else f"_cp{componentes[0]}_cp{componentes[1]}"
+    return f'scatter_clasificacion_k{k}{sufijo}.png'
+
+
+def generar_scatter(matriz_limpia, clusters, k, ruta_figures=RUTA_FIGURES, vista_previa=False, forzar=False,
+                    componentes=COMPONENTES_SCATTER):
+    """
+    Gráfico de densidad de dos CPs (por defecto CP1 vs CP2) coloreado por
+    clúster. Se dibuja como imagen (ver 'dispersion_densidad.py'), así que
+    el tiempo no depende del número de puntos.
+    """
+    ruta_figura_scatter = os.path.join(ruta_figures, nombre_scatter(k, componentes))
+    cp_x, cp_y = componentes
+    if not (1 <= cp_x <= matriz_limpia.shape[1] and 1 <= cp_y <= matriz_limpia.shape[1]):
+        print(f"\n¡ERROR AL GENERAR EL SCATTER PLOT! Componentes {componentes} fuera de rango "
+              f"(hay {matriz_limpia.shape[1]} CPs).")
+        return
+    # matriz_limpia tiene forma (n_puntos_validos, n_componentes)
+    x = matriz_limpia[:, cp_x - 1]
+    y = matriz_limpia[:, cp_y - 1]
+    huella = huella_figura('scatter_clasificacion', (x, y, clusters), k=k, vista_previa=vista_previa,
+                           componentes=list(componentes), n_bins=N_BINS)
+    if figura_al_dia(ruta_figura_scatter, huella, forzar):
+        return
+    try:
+        fig, ax = plt.subplots(figsize=(12, 8))
+
+        # Mismos colores que el mapa
+        cmap, norm = colores_clases(k)
+        dibujar_densidad(ax, x, y, clusters, k, cmap(np.arange(k)))
+
+        cbar = fig.colorbar(ScalarMappable(norm=norm, cmap=cmap), ax=ax, ticks=np.arange(k))
+        cbar.set_label('ID del Clúster')
+
+        ax.set_title(f'Visualización de Clústeres K-means (k={k})')
+        ax.set_xlabel(f'Componente Principal {cp_x}')
+        ax.set_ylabel(f'Componente Principal {cp_y}')
+        ax.grid(True, linestyle='--', alpha=0.5)
+
+        # Cerramos la figura para liberar memoria y no interferir con el mapa
+        guardar_figura(fig, ruta_figura_scatter, vista_previa, huella, bbox_inches='tight')
+
+        print(f"¡Imagen del scatter plot guardada en: {ruta_figura_scatter}!")
+
+    except Exception as e:
+        plt.close('all')
+        print(f"\n¡ERROR AL GENERAR EL SCATTER PLOT! {e}")
+
+
+def guardar_mapa_netcdf(datos_apilados, indices_validos, clusters, k, ruta_kmeans_out=RUTA_KMEANS_OUT,
+                        centroides=None, permutacion=None):
+    """
+    Devuelve el mapa de clases (lat x lon) como Dataset y lo guarda en NetCDF
+    como enteros compactos (ver 'mapas_clases.py'), con los centroides y, si
+    se pasa, la permutación del linaje aplicada a las etiquetas.
+    """
+    mapa_da = desapilar_a_mapa(datos_apilados, indices_validos, clusters, relleno=VALOR_RELLENO)
+    mapa_ds = crear_dataset_clases(
+        mapa_da, k, centroides=centroides,
+        descripcion=f'Mapa de clasificación climática global con {k} clústeres (K-means).'
+    )
+    if permutacion is not None:
+        mapa_ds.attrs[ATRIBUTO_PERMUTACION] = np.asarray(permutacion, dtype=np.int32)
+
+    ruta_salida_netcdf = os.path.join(ruta_kmeans_out, f'mapa_clasificacion_k{k}.nc')
+    guardar_mapa_clases(mapa_ds, ruta_salida_netcdf)
+    print(f"Mapa de datos guardado en: {ruta_salida_netcdf}")
+    return mapa_ds
+
+
+def generar_imagen_mapa(mapa_ds, k, ruta_figures=RUTA_FIGURES, vista_previa=False, forzar=False):
+    """Mapa global (proyección Robinson) de las zonas climáticas."""
+    ruta_figura_mapa = os.path.join(ruta_figures, f'mapa_clasificacion_k{k}.png')
+    huella = huella_figura('mapa_clasificacion',
+                           (mapa_ds['climate_class'].values, mapa_ds['lat'].values, mapa_ds['lon'].values),
+                           k=k, vista_previa=vista_previa)
+    if figura_al_dia(ruta_figura_mapa, huella, forzar):
+        return
+    try:
+        fig, (ax,) = crear_figura_mapas(figsize=(15, 8))
+        # Las celdas sin datos (-1) se enmascaran para que no se pinten
+        malla = dibujar_clases(ax, mapa_ds['lat'].values, mapa_ds['lon'].values,
+                               mapa_ds['climate_class'].values, k)
+        barra_clases(malla, ax, k, shrink=0.8)
+        ax.set_title(f'Clasificación Climática Global (k={k})', fontsize=16)
+
+        guardar_figura(fig, ruta_figura_mapa, vista_previa, huella, bbox_inches='tight')
+        print(f"¡Imagen del mapa guardada en: {ruta_figura_mapa}!")
+
+    except Exception as e:
+        plt.close('all')
+        print(f"\n¡ERROR AL GENERAR LA IMAGEN! Ocurrió un problema durante el ploteo: {e}")
+
+
+def tareas_figuras_k(matriz_limpia, clusters, mapa_ds, k, ruta_figures=RUTA_FIGURES, vista_previa=False,
+                     forzar=False, componentes=COMPONENTES_SCATTER):
+    """Tareas de dibujo (scatter y mapa) de un k, para 'renderizar_en_paralelo'."""
+    comunes = {'k': k, 'ruta_figures': ruta_figures, 'vista_previa': vista_previa, 'forzar': forzar}
+    return [
+        (generar_scatter, {'matriz_limpia': matriz_limpia, 'clusters': clusters,
+                           'componentes': componentes, **comunes}),
+        (generar_imagen_mapa, {'mapa_ds': mapa_ds, **comunes}),
+    ]
+
+
+def guardar_resultados_k(datos_apilados, indices_validos, matriz_limpia, ajuste,
+                         ruta_kmeans_out=RUTA_KMEANS_OUT, ruta_figures=RUTA_FIGURES,
+                         vista_previa=False, tareas_figuras=None, forzar=False,
+                         componentes_scatter=COMPONENTES_SCATTER):
+    """
+    Guarda todas las salidas de un ajuste K-means ('k', 'etiquetas',
+    'centroides', 'inercia'): NetCDF, centroides, scatter e imagen del mapa.
+    Si se pasa la lista 'tareas_figuras', las figuras no se dibujan aquí:
+    se añaden a la lista para renderizarlas después (p. ej. en paralelo).
+    Las figuras que ya están al día no se redibujan salvo con 'forzar'.
+    """
+    k = ajuste['k']
+    if 'permutacion' not in ajuste:
+        # Ajuste sin renumerar (p. ej. leído de la caché): reaplicamos el último linaje
+        permutacion = permutacion_guardada(k, ajuste['etiquetas'], ruta_kmeans_out)
+        if permutacion is not None:
+            print(f"[k={k}] Aplicando la renumeración guardada del linaje")
+            ajuste = renumerar_ajuste(ajuste, permutacion)
+    permutacion = ajuste.get('permutacion')
+    clusters = ajuste['etiquetas']
+    os.makedirs(ruta_kmeans_out, exist_ok=True)
+    os.makedirs(ruta_figures, exist_ok=True)
+
+    print(f"\n--- [k={k}] Guardando el mapa NetCDF final ---")
+    mapa_ds = guardar_mapa_netcdf(datos_apilados, indices_validos, clusters, k, ruta_kmeans_out,
+                                  centroides=ajuste['centroides'], permutacion=permutacion)
+    # La clase de consenso de la estabilidad queda con la misma numeración que el mapa
+    renumerar_estabilidad(ruta_kmeans_out, k, permutacion if permutacion is not None else np.arange(k))
+
+    # Guardamos los centroides para poder asignar datos nuevos sin reentrenar
+    ruta_centroides = os.path.join(ruta_kmeans_out, f'centroides_k{k}.npz')
+    guardar_centroides(ruta_centroides, k, ajuste['centroides'],
+                       inercia=ajuste['inercia'], semilla=SEMILLA,
+                       algoritmo=ajuste.get('algoritmo', MOTOR_POR_DEFECTO))
+    print(f"Centroides guardados en: {ruta_centroides}")
+
+    tareas = tareas_figuras_k(matriz_limpia, clusters, mapa_ds, k, ruta_figures, vista_previa, forzar,
+                              componentes_scatter)
+    if tareas_figuras is not None:
+        tareas_figuras.extend(tareas)
+    else:
+        print(f"\n--- [k={k}] Generando el scatter y la imagen del mapa ---")
+        renderizar_en_paralelo(tareas)
+    return mapa_ds
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+CLASIFICACIÓN DE ESCENARIOS FUTUROS (SSP) Y MATRICES DE TRANSICIÓN DE CLASES
+
+Instrucciones:
+1. Se ejecuta después de 'aplicar_pca.py' y de generar los mapas de cada k.
+2. Las climatologías futuras se preparan igual que las históricas (mismos
+   scripts de remallado, unión, climatología y ensemble) y se guardan en
+       '../data_escenarios/<escenario>/<periodo>/<var>_ensemble_climatologia.nc'
+   p. ej. '../data_escenarios/ssp585/2071-2100/tasmax_ensemble_climatologia.nc'.
+3. Cada combinación escenario/periodo pasa por el scaler/PCA de
+   'modelo_pca.npz' y los centroides 'centroides_k[N].npz' YA GUARDADOS
+   (sin reentrenar nada), así que las clases futuras son comparables con las
+   del mapa histórico 'mapa_clasificacion_k[N].nc'.
+4. Para cada k, la matriz de transición histórica -> futura (celdas y km²)
+   se calcula con un único np.bincount sobre los pares de etiquetas.
+5. Guarda, por combinación y k:
+   - '../data_escenarios/<escenario>/<periodo>/clasificacion_k[N].nc'
+     (clase futura y 'cambio': 1 cambia, 0 igual, -1 sin datos).
+   - '../figures/escenario_<escenario>_<periodo>_k[N].png' (mapa futuro y
+     celdas que cambian), dibujadas en paralelo.
+   y todas las transiciones en '../data_escenarios/transiciones.csv':
+       python clasificar_escenarios.py
+       python clasificar_escenarios.py --escenarios ssp245 ssp585 --k 7 8
+"""
+
+import matplotlib
+matplotlib.use('Agg') # Modo no interactivo
+
+import argparse
+import glob
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import matplotlib.pyplot as plt
+
+from mapas_clases import VALOR_RELLENO, crear_dataset_clases, guardar_mapa_clases, leer_mapa_clases
+from matriz_features import VARIABLES_CLIMATICAS
+from features_derivados import matriz_conjunto, variables_base
+from modelo_portable import cargar_modelo_pca, cargar_centroides, transformar_a_componentes, asignar_clases
+from estadisticas_zonales import areas_celdas
+from utilidades_kmeans import interpretar_lista_k
+from analizar_y_mapear_habitats_pandaversion import encontrar_todos_los_nc
+from cache_figuras import huella_figura, figura_al_dia
+from renderizado_mapas import (crear_figura_mapas, dibujar_clases, dibujar_campo, barra_clases, guardar_figura,
+                               renderizar_en_paralelo)
+
+# --- CONFIGURACIÓN ---
+N_PROCESOS = os.cpu_count() or 1
+
+# --- RUTAS ---
+RUTA_PCA_IN = "../data_pca"
+RUTA_KMEANS = "../data_kmeans"
+RUTA_ESCENARIOS = "../data_escenarios"
+RUTA_FIGURES = "../figures"
+
+
+def descubrir_escenarios(ruta_base=RUTA_ESCENARIOS, escenarios=None, periodos=None, variables=VARIABLES_CLIMATICAS):
+    """[(escenario, periodo, carpeta), ...] con las climatologías de todas las 'variables'."""
+    combinaciones = []
+    for carpeta in sorted(glob.glob(os.path.join(ruta_base, '*', '*'))):
+        if not os.path.isdir(carpeta):
+            continue
+        periodo = os.path.basename(carpeta)
+        escenario = os.path.basename(os.path.dirname(carpeta))
+        if (escenarios and escenario not in escenarios) or (periodos and periodo not in periodos):
+            continue
+        faltan = [var for var in variables
+                  if not os.path.exists(os.path.join(carpeta, f"{var}_ensemble_climatologia.nc"))]
+        if faltan:
+            print(f"¡AVISO! {escenario}/{periodo}: faltan {faltan}; se omite.")
+            continue
+        combinaciones.append((escenario, periodo, carpeta))
+    return combinaciones
+
+
+def componentes_futuros(modelo, carpeta):
+    """
+    (validas, componentes): máscara plana de las celdas con datos en el
+    escenario y sus CPs con el scaler/PCA guardados (sin reentrenar). Las
+    características son las del conjunto con el que se entrenó el modelo.
+    """
+    climatologias, _, matriz_limpia, validas, _ = matriz_conjunto([str(v) for v in modelo['variables']], carpeta)
+    lats, lons = climatologias['lat'].values, climatologias['lon'].values
+    if not (np.allclose(lats, modelo['lat']) and np.allclose(lons, modelo['lon'])):
+        raise ValueError("el grid no coincide con el del modelo PCA (remallar al mismo grid fijo)")
+    return validas, transformar_a_componentes(modelo, matriz_limpia)
+
+
+def matriz_transicion(historica, futura, k, pesos=None):
+    """
+    Matriz k x k: [i, j] = celdas (o suma de 'pesos') que pasan de la clase i
+    a la j. Un solo np.bincount sobre los pares (i, j) de las celdas con
+    clase en ambos periodos.
+    """
+    validas = (historica != VALOR_RELLENO) & (futura != VALOR_RELLENO)
+    pares = historica[validas].astype(np.int64) * k + futura[validas].astype(np.int64)
+    return np.bincount(pares, weights=None if pesos is None else pesos[validas],
+                       minlength=k * k).reshape(k, k)
+
+
+def tabla_transiciones(conteos, areas, k, escenario, periodo):
+    """Tabla larga (desde, hacia, n_celdas, area_km2) con las transiciones no vacías."""
+    desde, hacia = np.nonzero(conteos)
+    return pd.DataFrame({
+        'escenario': escenario, 'periodo': periodo, 'k': k,
+        'desde': desde, 'hacia': hacia,
+        'n_celdas': conteos[desde, hacia],
+        'area_km2': areas[desde, hacia],
+    })
+
+
+def dibujar_escenario(futura, cambio, lats, lons, k, titulo, ruta_salida, vista_previa=False, huella=None):
+    """Dos paneles: clases futuras y celdas que cambian de clase."""
+    fig, axes = crear_figura_mapas(nrows=1, ncols=2, figsize=(20, 6))
+    axes[0].set_title(f"{titulo}: clases (k={k})")
+    malla = dibujar_clases(axes[0], lats, lons, futura, k, alpha_costas=0.6, rejilla_alpha=0.3)
+    barra_clases(malla, axes[0], k, shrink=0.7)
+    fraccion = np.mean(cambio[cambio != VALOR_RELLENO]) if (cambio != VALOR_RELLENO).any() else 0.0
+    axes[1].set_title(f"{titulo}: celdas que cambian de clase ({fraccion * 100:.1f}%)")
+    dibujar_campo(axes[1], lats, lons, np.where(cambio == VALOR_RELLENO, np.nan, cambio).astype(np.float32),
+                  cmap='Reds', vmin=-0.6, vmax=1.2, alpha_costas=0.6, rejilla_alpha=0.3)
+    plt.tight_layout(pad=2.0)
+    guardar_figura(fig, ruta_salida, vista_previa, huella)
+    return ruta_salida
+
+
+def clasificar_escenarios(escenarios=None, periodos=None, lista_k=None, vista_previa=False, forzar=False,
+                          n_procesos=N_PROCESOS):
+    print("==========================================================")
+    print("Clasificación de escenarios futuros (sin reentrenar)")
+    print("==========================================================")
+    os.makedirs(RUTA_FIGURES, exist_ok=True)
+
+    print("\n--- 1. Cargando modelo PCA, centroides y mapas históricos ---")
+    try:
+        modelo = cargar_modelo_pca(os.path.join(RUTA_PCA_IN, 'modelo_pca.npz'))
+    except (OSError, ValueError) as e:
+        print(f"¡ERROR! No se pudo cargar el modelo PCA: {e}")
+        return
+    lats, lons = modelo['lat'], modelo['lon']
+    forma = tuple(int(n) for n in modelo['forma_grid'])
+    areas = areas_celdas(lats, lons).ravel()
+
+    historicos = {}
+    for ruta_mapa, k in encontrar_todos_los_nc():
+        ruta_centroides = os.path.join(RUTA_KMEANS, f'centroides_k{k}.npz')
+        if (lista_k and k not in lista_k) or not os.path.exists(ruta_centroides):
+            continue
+        mapa = leer_mapa_clases(ruta_mapa)['climate_class'].transpose('lat', 'lon')
+        historicos[k] = (mapa.values.ravel(), cargar_centroides(ruta_centroides)['centroides'])
+    if not historicos:
+        print(f"¡ERROR! No hay mapas con centroides en {RUTA_KMEANS} para los k pedidos.")
+        return
+    print(f"k: {sorted(historicos)}")
+
+    necesarias = variables_base([str(v) for v in modelo['variables']])
+    combinaciones = descubrir_escenarios(RUTA_ESCENARIOS, escenarios, periodos, necesarias)
+    if not combinaciones:
+        print(f"¡ERROR! No se encontró ninguna carpeta <escenario>/<periodo> completa en {RUTA_ESCENARIOS}")
+        return
+    print(f"Escenarios: {', '.join(f'{e}/{p}' for e, p, _ in combinaciones)}")
+
+    print("\n--- 2. Clasificando y calculando transiciones ---")
+    transiciones, resumen, tareas = [], [], []
+    for escenario, periodo, carpeta in combinaciones:
+        try:
+            validas, componentes = componentes_futuros(modelo, carpeta)
+        except Exception as e:
+            print(f"¡ERROR! {escenario}/{periodo}: {e}")
+            continue
+
+        for k, (historica, centroides) in sorted(historicos.items()):
+            futura = np.full(validas.shape, VALOR_RELLENO, dtype=historica.dtype)
+            futura[validas] = asignar_clases(componentes, centroides)
+            conteos = matriz_transicion(historica, futura, k)
+            areas_k = matriz_transicion(historica, futura, k, areas)
+            transiciones.append(tabla_transiciones(conteos, areas_k, k, escenario, periodo))
+
+            con_datos = (historica != VALOR_RELLENO) & (futura != VALOR_RELLENO)
+            cambio = np.where(con_datos, (historica != futura).astype(np.int8), VALOR_RELLENO).astype(np.int8)
+            area_cambio = areas_k.sum() - np.trace(areas_k)
+            resumen.append({'escenario': escenario, 'periodo': periodo, 'k': k,
+                            'celdas_cambian': int(conteos.sum() - np.trace(conteos)),
+                            'fraccion_area_cambia': area_cambio / areas_k.sum() if areas_k.sum() else np.nan})
+
+            futura_da = xr.DataArray(futura.reshape(forma), coords={'lat': lats, 'lon': lons}, dims=('lat', 'lon'))
+            ds = crear_dataset_clases(futura_da, k, centroides=centroides,
+                                      descripcion=f"Clasificación del escenario {escenario} ({periodo}) "
+                                                  f"con los centroides históricos de k={k}.")
+            ds['cambio'] = xr.DataArray(cambio.reshape(forma), coords=futura_da.coords, dims=('lat', 'lon'),
+                                        attrs={'long_name': 'Cambio de clase respecto al mapa histórico',
+                                               'description': '1 = cambia, 0 = igual, -1 = sin datos'})
+            ds.attrs.update({'escenario': escenario, 'periodo': periodo})
+            guardar_mapa_clases(ds, os.path.join(carpeta, f'clasificacion_k{k}.nc'))
+
+            ruta_figura = os.path.join(RUTA_FIGURES, f"escenario_{escenario}_{periodo}_k{k}.png")
+            huella = huella_figura('escenario', (futura, cambio), k=k, escenario=escenario, periodo=periodo,
+                                   vista_previa=vista_previa)
+            if not figura_al_dia(ruta_figura, huella, forzar):
+                tareas.append((dibujar_escenario, dict(futura=futura.reshape(forma), cambio=cambio.reshape(forma),
+                                                       lats=lats, lons=lons, k=k, titulo=f"{escenario} {periodo}",
+                                                       ruta_salida=ruta_figura, vista_previa=vista_previa,
+                                                       huella=huella)))
+
+    if not resumen:
+        print("¡ERROR! No se pudo clasificar ningún escenario.")
+        return
+    ruta_transiciones = os.path.join(RUTA_ESCENARIOS, 'transiciones.csv')
+    pd.concat(transiciones, ignore_index=True).to_csv(ruta_transiciones, index=False, float_format='%.6g')
+    print(pd.DataFrame(resumen).to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+    print(f"Transiciones guardadas en: {ruta_transiciones}")
+
+    print(f"\n--- 3. Dibujando {len(tareas)} figuras ({n_procesos} proceso(s)) ---")
+    for ruta_figura in renderizar_en_paralelo(tareas, n_procesos):
+        print(f"  -> {ruta_figura}")
+    print("==========================================================")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clasifica climatologías futuras con el modelo ya entrenado.")
+    parser.add_argument('--escenarios', nargs='+', default=None,
+                        help="Escenarios a procesar (p. ej. ssp245 ssp585). Por defecto, todos.")
+    parser.add_argument('--periodos', nargs='+', default=None,
+                        help="Periodos a procesar (p. ej. 2041-2070). Por defecto, todos.")
+    parser.add_argument('--k', nargs='+', default=None,
+                        help="Valores de k (p. ej. 5-7 10). Por defecto, todos los mapas con centroides.")
+    parser.add_argument('--procesos', type=int, default=N_PROCESOS,
+                        help="Número de procesos para dibujar las figuras.")
+    parser.add_argument('--vista-previa', action='store_true',
+                        help="Guarda las figuras a baja resolución (mucho más rápido).")
+    parser.add_argument('--forzar', action='store_true',
+                        help="Redibuja las figuras aunque ya estén al día.")
+    args = parser.parse_args()
+    clasificar_escenarios(escenarios=args.escenarios, periodos=args.periodos,
+                          lista_k=interpretar_lista_k(args.k) if args.k else None,
+                          vista_previa=args.vista_previa, forzar=args.forzar, n_procesos=args.procesos)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+GENERA LOS MAPAS K-MEANS PARA VARIOS k EN UNA SOLA EJECUCIÓN
+
+Sustituye a los antiguos scripts de k fijo (cinco_clusters.py, ...,
+diez_clusters.py). Carga la matriz de CPs una sola vez, ajusta todos los k
+en paralelo (pasando por la caché de ajustes) y guarda, para cada k, el
+NetCDF, los centroides, el scatter y el mapa (las figuras de todos los k
+se renderizan al final, también en paralelo).
+
+Ejemplos:
+    python clasificar_multi_k.py --k 9
+    python clasificar_multi_k.py --k 5 7 8 9 10
+    python clasificar_multi_k.py --k 5-10 --procesos 4
+    python clasificar_multi_k.py --k 5-10 --motor bisectante
+    python clasificar_multi_k.py --k 5-10 --linaje   # IDs coherentes entre k
+    python clasificar_multi_k.py --k 5-10 --vista-previa   # figuras rápidas a baja resolución
+"""
+
+import argparse
+import os
+from utilidades_kmeans import cargar_matriz_pca, barrido_k, interpretar_lista_k
+from clasificacion_kmeans import guardar_resultados_k, COMPONENTES_SCATTER
+from motor_clustering import MOTORES, MOTOR_POR_DEFECTO
+from linaje_clusters import linaje_de_ajustes, guardar_arbol
+from renderizado_mapas import renderizar_en_paralelo
+
+# --- CONFIGURACIÓN ---
+K_POR_DEFECTO = ["5-10"]
+N_PROCESOS = os.cpu_count() or 1
+MOTOR = MOTOR_POR_DEFECTO
+
+# --- RUTAS ---
+RUTA_PCA_IN = "../data_pca"
+RUTA_KMEANS_OUT = "../data_kmeans"
+RUTA_FIGURES = "../figures"
+
+
+def clasificar_multi_k(lista_k, n_procesos=N_PROCESOS, motor=MOTOR, linaje=False, vista_previa=False,
+                       forzar=False, componentes_scatter=COMPONENTES_SCATTER):
+    print("==========================================================")
+    print(f"Generando mapas de clasificación para k = {lista_k}")
+    print("==========================================================")
+
+    print("\n--- 1. Cargando Componentes Principales (una sola vez) ---")
+    datos_apilados, indices_validos, matriz_limpia = cargar_matriz_pca(RUTA_PCA_IN)
+
+    print(f"\n--- 2. Ajustando el motor '{motor}' ({n_procesos} proceso(s)) ---")
+    ajustes = barrido_k(matriz_limpia, lista_k, n_procesos=n_procesos, motor=motor)
+
+    if linaje:
+        # Antes de guardar nada: mapas, centroides, estabilidad y figuras salen ya con los IDs nuevos
+        print("\n--- 3. Renumerando las clases para que sean coherentes entre k ---")
+        ajustes, arbol = linaje_de_ajustes(ajustes)
+        guardar_arbol(arbol, RUTA_KMEANS_OUT)
+
+    print(f"\n--- {4 if linaje else 3}. Guardando mapas y centroides ---")
+    tareas_figuras = []
+    for ajuste in ajustes:
+        guardar_resultados_k(datos_apilados, indices_validos, matriz_limpia, ajuste,
+                             RUTA_KMEANS_OUT, RUTA_FIGURES, vista_previa=vista_previa,
+                             tareas_figuras=tareas_figuras, forzar=forzar,
+                             componentes_scatter=componentes_scatter)
+
+    print(f"\n--- {5 if linaje else 4}. Renderizando {len(tareas_figuras)} figuras ({n_procesos} proceso(s)) ---")
+    renderizar_en_paralelo(tareas_figuras, n_procesos)
+
+    print("\n¡Proceso de clasificación finalizado con éxito!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera los mapas K-means para una lista o rango de k.")
+    parser.add_argument('--k', nargs='+', default=K_POR_DEFECTO,
+                        help="Valores de k: lista (5 7 9), rangos (5-10) o ambos.")
+    parser.add_argument('--procesos', type=int, default=N_PROCESOS,
+                        help="Número de procesos para los ajustes.")
+    parser.add_argument('--motor', choices=list(MOTORES), default=MOTOR,
+                        help="Motor de clustering (ver motor_clustering.py).")
+    parser.add_argument('--linaje', action='store_true',
+                        help="Renumera las clases de cada k según el k anterior antes de guardar (linaje_clusters.py).")
+    parser.add_argument('--vista-previa', action='store_true',
+                        help="Guarda las figuras a baja resolución (mucho más rápido).")
+    parser.add_argument('--forzar', action='store_true',
+                        help="Redibuja las figuras aunque ya estén al día.")
+    parser.add_argument('--componentes-scatter', type=int, nargs=2, default=COMPONENTES_SCATTER,
+                        metavar=('CP_X', 'CP_Y'), help="Par de CPs del gráfico de dispersión (p. ej. 1 3).")
+    args = parser.parse_args()
+    clasificar_multi_k(interpretar_lista_k(args.k), n_procesos=args.procesos, motor=args.motor,
+                       linaje=args.linaje, vista_previa=args.vista_previa, forzar=args.forzar,
+                       componentes_scatter=tuple(args.componentes_scatter))
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+SCATTER DE DENSIDAD PARA NUBES GRANDES DE PUNTOS EN EL ESPACIO DE LAS CPs
+
+Instrucciones:
+1. En lugar de dibujar un marcador por punto (plt.scatter), el plano de dos
+   CPs se divide en N_BINS x N_BINS celdas y se cuenta cuántos puntos de
+   cada clúster caen en cada celda con un único np.bincount por bloque.
+2. Cada celda se pinta con el color del clúster dominante y una opacidad
+   que crece con el logaritmo del número de puntos, y la figura se dibuja
+   como una sola imagen (imshow). El tiempo de dibujo depende de N_BINS,
+   no del número de puntos.
+3. Lo usa 'generar_scatter' de 'clasificacion_kmeans.py'.
+"""
+
+import numpy as np
+
+# --- CONFIGURACIÓN ---
+N_BINS = 200
+MARGEN = 0.02 # Fracción del rango añadida a cada lado de los ejes
+OPACIDAD_MINIMA = 0.5 # Opacidad de las celdas con un solo punto
+TAM_BLOQUE = 1_000_000
+
+
+def limites_plano(x, y, margen=MARGEN):
+    """(xmin, xmax, ymin, ymax) del plano con un pequeño margen."""
+    limites = []
+    for valores in (x, y):
+        minimo, maximo = float(np.min(valores)), float(np.max(valores))
+        extra = (maximo - minimo) * margen or 0.5
+        limites += [minimo - extra, maximo + extra]
+    return tuple(limites)
+
+
+def _indice_bin(valores, minimo, maximo, n_bins):
+    posicion = (valores - minimo) * (n_bins / (maximo - minimo))
+    return np.clip(posicion.astype(np.int64), 0, n_bins - 1)
+
+
+def histograma_por_clase(x, y, clases, k, n_bins=N_BINS, limites=None, tam_bloque=TAM_BLOQUE):
+    """
+    Devuelve (conteos, limites): conteos[c, fila_y, columna_x] es el número
+    de puntos del clúster c en cada celda del plano.
+    """
+    if limites is None:
+        limites = limites_plano(x, y)
+    xmin, xmax, ymin, ymax = limites
+    conteos = np.zeros(k * n_bins * n_bins, dtype=np.int64)
+    for inicio in range(0, len(x), tam_bloque):
+        fin = inicio + tam_bloque
+        columna = _indice_bin(x[inicio:fin], xmin, xmax, n_bins)
+        fila = _indice_bin(y[inicio:fin], ymin, ymax, n_bins)
+        celda = (np.asarray(clases[inicio:fin], dtype=np.int64) * n_bins + fila) * n_bins + columna
+        conteos += np.bincount(celda, minlength=conteos.size)
+    return conteos.reshape(k, n_bins, n_bins), limites
+
+
+def imagen_densidad(conteos, colores, opacidad_minima=OPACIDAD_MINIMA):
+    """
+    Imagen RGBA (n_bins x n_bins x 4) con el color del clúster dominante en
+    cada celda ('colores' es un array k x 3 o k x 4) y opacidad logarítmica.
+    """
+    total = conteos.sum(axis=0)
+    dominante = conteos.argmax(axis=0)
+    imagen = np.zeros(total.shape + (4,), dtype=np.float64)
+    imagen[..., :3] = np.asarray(colores)[dominante, :3]
+
+    ocupadas = total > 0
+    densidad = np.log1p(total) / np.log1p(max(total.max(), 1))
+    imagen[..., 3] = np.where(ocupadas, opacidad_minima + (1 - opacidad_minima) * densidad, 0.0)
+    return imagen
+
+
+def dibujar_densidad(ax, x, y, clases, k, colores, n_bins=N_BINS):
+    """Pinta la nube (x, y) coloreada por clúster en 'ax' como una sola imagen."""
+    conteos, (xmin, xmax, ymin, ymax) = histograma_por_clase(x, y, clases, k, n_bins)
+    return ax.imshow(imagen_densidad(conteos, colores), origin='lower', extent=(xmin, xmax, ymin, ymax),
+                     aspect='auto', interpolation='nearest')
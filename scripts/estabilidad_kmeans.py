@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+ESTABILIDAD Y CONSENSO DEL K-MEANS ENTRE SEMILLAS / REMUESTREOS
+
+Instrucciones:
+1. Se ejecuta después de 'aplicar_pca.py' (y normalmente después de generar
+   los mapas, aunque no es obligatorio).
+2. Para cada k, repite el ajuste con muchas semillas (o, con --bootstrap,
+   sobre remuestreos con reemplazo) en paralelo.
+3. Alinea las etiquetas de cada ejecución con las del ajuste de referencia
+   (semilla 42, el mismo del mapa publicado) mediante el algoritmo húngaro
+   sobre la tabla de contingencia.
+4. Acumula votos por celda y clase (matriz N x k, nunca N x N) y obtiene:
+   - 'consenso': la clase más votada de cada celda.
+   - 'estabilidad': fracción de ejecuciones que votan por la clase de consenso.
+   - 'acuerdo_referencia': fracción de ejecuciones que coinciden con el mapa de referencia.
+5. Guarda '../data_kmeans/estabilidad_k[N].nc' junto a 'mapa_clasificacion_k[N].nc'.
+   Si el mapa se renumeró con 'linaje_clusters.py', el consenso se guarda
+   con la misma numeración.
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from utilidades_kmeans import (cargar_matriz_pca, ajustar_kmeans, interpretar_lista_k, desapilar_a_mapa,
+                               nombre_algoritmo)
+from motor_clustering import MOTORES, MOTOR_POR_DEFECTO, SEMILLA, crear_motor
+from cache_kmeans import ajustar_con_cache, huella_matriz
+from mapas_clases import VALOR_RELLENO, crear_dataset_clases, guardar_mapa_clases
+from linaje_clusters import ATRIBUTO_PERMUTACION, permutacion_guardada
+
+# --- CONFIGURACIÓN ---
+K_POR_DEFECTO = ["5-10"]
+N_EJECUCIONES = 50
+N_PROCESOS = os.cpu_count() or 1
+MOTOR = MOTOR_POR_DEFECTO
+
+# --- RUTAS ---
+RUTA_PCA_IN = "../data_pca"
+RUTA_KMEANS_OUT = "../data_kmeans"
+
+# Estado compartido por cada proceso trabajador
+_ESTADO_TRABAJADOR = {}
+
+
+def _inicializar_trabajador(matriz, huella, motor):
+    _ESTADO_TRABAJADOR['matriz'] = matriz
+    _ESTADO_TRABAJADOR['huella'] = huella
+    _ESTADO_TRABAJADOR['motor'] = motor
+
+
+def _ejecutar(tarea):
+    """Ajusta una ejecución (semilla o remuestreo) y devuelve las etiquetas de todos los puntos."""
+    k, semilla, bootstrap = tarea
+    matriz = _ESTADO_TRABAJADOR['matriz']
+    motor = _ESTADO_TRABAJADOR['motor']
+
+    if bootstrap:
+        rng = np.random.default_rng(semilla)
+        indices = rng.integers(0, matriz.shape[0], size=matriz.shape[0])
+        modelo = crear_motor(motor, k, semilla=semilla).ajustar(matriz[indices])
+        return modelo.predecir(matriz)
+
+    def ajustar():
+        modelo = crear_motor(motor, k, semilla=semilla).ajustar(matriz)
+        return {'k': k, 'inercia': modelo.inercia, 'centroides': modelo.centroides,
+                'etiquetas': modelo.etiquetas}
+
+    # Las ejecuciones por semilla son deterministas: se pueden guardar en caché
+    return ajustar_con_cache(matriz, k, semilla, nombre_algoritmo('exacto', motor=motor), ajustar,
+                             huella=_ESTADO_TRABAJADOR['huella'])['etiquetas']
+
+
+def alinear_etiquetas(etiquetas_referencia, etiquetas, k):
+    """
+    Renumera 'etiquetas' para que coincidan al máximo con las de referencia
+    (algoritmo húngaro sobre la tabla de contingencia k x k).
+    """
+    contingencia = np.bincount(etiquetas_referencia * k + etiquetas, minlength=k * k).reshape(k, k)
+    filas, columnas = linear_sum_assignment(-contingencia)
+    nueva_etiqueta = np.empty(k, dtype=np.int64)
+    nueva_etiqueta[columnas] = filas
+    return nueva_etiqueta[etiquetas]
+
+
+def calcular_estabilidad(matriz, k, n_ejecuciones=N_EJECUCIONES, bootstrap=False,
+                         n_procesos=N_PROCESOS, motor=MOTOR):
+    """
+    Devuelve (referencia, consenso, estabilidad, acuerdo_referencia) para cada
+    punto válido, a partir de 'n_ejecuciones' ajustes alineados.
+    """
+    referencia = ajustar_kmeans(matriz, k, motor=motor)['etiquetas'].astype(np.int64)
+    n_puntos = matriz.shape[0]
+    huella = huella_matriz(matriz)
+
+    # La ejecución 0 con semilla 42 sin remuestreo sería la propia referencia
+    primera = 0 if bootstrap else 1
+    tareas = [(k, SEMILLA + i, bootstrap) for i in range(primera, primera + n_ejecuciones)]
+
+    votos = np.zeros(n_puntos * k, dtype=np.int64)
+    posiciones = np.arange(n_puntos) * k
+
+    def acumular(etiquetas):
+        alineadas = alinear_etiquetas(referencia, np.asarray(etiquetas, dtype=np.int64), k)
+        votos[:] += np.bincount(posiciones + alineadas, minlength=n_puntos * k)
+
+    if n_procesos <= 1:
+        _inicializar_trabajador(matriz, huella, motor)
+        for tarea in tareas:
+            acumular(_ejecutar(tarea))
+    else:
+        with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializar_trabajador,
+                                 initargs=(matriz, huella, motor)) as ejecutor:
+            for etiquetas in ejecutor.map(_ejecutar, tareas):
+                acumular(etiquetas)
+
+    votos = votos.reshape(n_puntos, k)
+    consenso = votos.argmax(axis=1)
+    estabilidad = votos[np.arange(n_puntos), consenso] / n_ejecuciones
+    acuerdo_referencia = votos[np.arange(n_puntos), referencia] / n_ejecuciones
+    return referencia, consenso, estabilidad, acuerdo_referencia
+
+
+def analizar_estabilidad(lista_k, n_ejecuciones=N_EJECUCIONES, bootstrap=False,
+                         n_procesos=N_PROCESOS, motor=MOTOR):
+    print("==========================================================")
+    modo = "remuestreos bootstrap" if bootstrap else "semillas"
+    print(f"Estabilidad del clustering ({n_ejecuciones} {modo}, motor '{motor}')")
+    print("==========================================================")
+    os.makedirs(RUTA_KMEANS_OUT, exist_ok=True)
+
+    print("\n--- Cargando Componentes Principales ---")
+    datos_apilados, indices_validos, matriz_limpia = cargar_matriz_pca(RUTA_PCA_IN)
+
+    for k in lista_k:
+        print(f"\n--- k={k} ---")
+        referencia, consenso, estabilidad, acuerdo = calcular_estabilidad(
+            matriz_limpia, k, n_ejecuciones, bootstrap, n_procesos, motor
+        )
+        permutacion = permutacion_guardada(k, referencia, RUTA_KMEANS_OUT)
+        if permutacion is not None:
+            referencia, consenso = permutacion[referencia], permutacion[consenso]
+
+        estabilidad_por_clase = np.bincount(referencia, weights=acuerdo, minlength=k) / \
+            np.maximum(np.bincount(referencia, minlength=k), 1)
+        print(f"  Estabilidad media: {estabilidad.mean():.3f} | "
+              f"celdas con estabilidad < 0.8: {(estabilidad < 0.8).mean()*100:.1f}%")
+        print(f"  Consenso distinto de la referencia en {(consenso != referencia).sum()} celdas")
+        for clase, valor in enumerate(estabilidad_por_clase):
+            print(f"    Clase {clase}: acuerdo medio con la referencia {valor:.3f}")
+
+        estabilidad_ds = crear_dataset_clases(
+            desapilar_a_mapa(datos_apilados, indices_validos, consenso, relleno=VALOR_RELLENO),
+            k, nombre='consenso'
+        )
+        estabilidad_ds['estabilidad'] = desapilar_a_mapa(datos_apilados, indices_validos, estabilidad.astype(np.float32))
+        estabilidad_ds['acuerdo_referencia'] = desapilar_a_mapa(datos_apilados, indices_validos, acuerdo.astype(np.float32))
+        estabilidad_ds.attrs['description'] = (
+            f'Consenso y estabilidad de la clasificación con {k} clústeres '
+            f'({n_ejecuciones} {modo}, etiquetas alineadas con el mapa de referencia).'
+        )
+        estabilidad_ds.attrs['n_ejecuciones'] = n_ejecuciones
+        estabilidad_ds.attrs['bootstrap'] = int(bootstrap)
+        estabilidad_ds.attrs['motor'] = motor
+        estabilidad_ds.attrs[ATRIBUTO_PERMUTACION] = (permutacion if permutacion is not None
+                                                      else np.arange(k)).astype(np.int32)
+
+        ruta_salida = os.path.join(RUTA_KMEANS_OUT, f'estabilidad_k{k}.nc')
+        guardar_mapa_clases(estabilidad_ds, ruta_salida)
+        print(f"  Mapa de estabilidad guardado en: {ruta_salida}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estabilidad del K-means entre semillas o remuestreos.")
+    parser.add_argument('--k', nargs='+', default=K_POR_DEFECTO,
+                        help="Valores de k: lista (5 7 9), rangos (5-10) o ambos.")
+    parser.add_argument('--ejecuciones', type=int, default=N_EJECUCIONES,
+                        help="Número de semillas o remuestreos por k.")
+    parser.add_argument('--bootstrap', action='store_true',
+                        help="Ajusta sobre remuestreos con reemplazo en lugar de variar solo la semilla.")
+    parser.add_argument('--procesos', type=int, default=N_PROCESOS)
+    parser.add_argument('--motor', choices=list(MOTORES), default=MOTOR)
+    args = parser.parse_args()
+    analizar_estabilidad(interpretar_lista_k(args.k), args.ejecuciones, args.bootstrap,
+                         args.procesos, args.motor)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+ESTADÍSTICAS ZONALES PONDERADAS POR ÁREA DE CLÚSTERES Y HÁBITATS
+
+Instrucciones:
+1. Se ejecuta después de 'generar_mapa_kmeans.py' / 'clasificar_multi_k.py'.
+2. Cada celda pesa su área real (proporcional al coseno de la latitud):
+   un grado de longitud en el Ártico ocupa mucho menos que en el ecuador.
+3. Para TODAS las clases a la vez (sin un xarray .where() por clase) se
+   calculan con np.bincount: número de celdas, área (km²), fracción del
+   área de tierra, latitud mínima, máxima y media, y la media ponderada
+   de cualquier campo (por defecto, la media anual de las climatologías
+   del ensemble de '../data_ensemble').
+4. Lo mismo para el hábitat de cada especie (clústeres de los PUNTOS_MUESTRA
+   y filtros geográficos, como en 'analizar_y_mapear_habitats_pandaversion.py').
+5. Guarda '../data_kmeans/estadisticas_zonales_k[N].csv' y
+   '../data_kmeans/estadisticas_habitats_k[N].csv' para cada k:
+       python estadisticas_zonales.py            (todos los mapas)
+       python estadisticas_zonales.py --k 5-7 --sin-habitats
+"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+from mapas_clases import VALOR_RELLENO
+from busqueda_puntos import RADIO_TIERRA_KM
+from utilidades_kmeans import interpretar_lista_k
+from matriz_features import VARIABLES_CLIMATICAS, RUTA_ENSEMBLE, cargar_climatologias
+from filtros_habitat import RUTA_FILTROS, cargar_filtros, compilar_mascaras, aplicar_habitats
+from analizar_y_mapear_habitats_pandaversion import (encontrar_todos_los_nc, cargar_cubo_clases,
+                                                     zonas_todos_k_desde_puntos)
+
+# --- RUTAS ---
+RUTA_KMEANS = "../data_kmeans"
+
+
+def _bordes_latitud(lats):
+    medios = (lats[1:] + lats[:-1]) / 2.0
+    return np.clip(np.concatenate([[lats[0] - (medios[0] - lats[0])], medios,
+                                   [lats[-1] + (lats[-1] - medios[-1])]]), -90.0, 90.0)
+
+
+def areas_celdas(lats, lons):
+    """
+    Área (km²) de cada celda (lat x lon): R² · Δlon · |sen(lat_norte) - sen(lat_sur)|,
+    la integral exacta del peso cos(lat) entre los bordes de la celda.
+    Si la primera y la última longitud son el mismo meridiano (-180 y 180),
+    cada una de esas dos columnas recibe medio Δlon, así que el meridiano
+    repetido cuenta una sola vez y el total es el área de la esfera.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    orden = np.argsort(lats)
+    bordes = np.radians(_bordes_latitud(lats[orden]))
+    banda = np.empty(len(lats))
+    banda[orden] = np.abs(np.diff(np.sin(bordes)))
+    ancho_lon = np.full(len(lons), np.radians(np.abs(np.diff(lons)).mean())) # Grid regular en longitud
+    if len(lons) > 1 and np.isclose(abs(lons[-1] - lons[0]), 360.0):
+        ancho_lon[[0, -1]] /= 2.0
+    return RADIO_TIERRA_KM ** 2 * banda[:, np.newaxis] * ancho_lon[np.newaxis, :]
+
+
+def estadisticas_por_grupo(grupos, celdas, n_grupos, areas, lats_celdas, campos=None):
+    """
+    Estadísticas de n_grupos grupos con reducciones agrupadas (np.bincount).
+    'grupos' y 'celdas' son arrays paralelos: la celda 'celdas[i]' pertenece
+    al grupo 'grupos[i]' (una celda puede estar en varios grupos). 'areas',
+    'lats_celdas' y cada campo de 'campos' son arrays planos por celda; los
+    NaN de un campo no cuentan para su media.
+    """
+    campos = campos or {}
+    area = areas[celdas]
+    lat = lats_celdas[celdas]
+
+    n_celdas = np.bincount(grupos, minlength=n_grupos)
+    area_total = np.bincount(grupos, weights=area, minlength=n_grupos)
+    con_datos = n_celdas > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tabla = {
+            'n_celdas': n_celdas,
+            'area_km2': area_total,
+            # Latitudes extremas: mínimo / máximo agrupados por ordenación
+            'lat_min': np.full(n_grupos, np.nan),
+            'lat_max': np.full(n_grupos, np.nan),
+            'lat_media': np.bincount(grupos, weights=area * lat, minlength=n_grupos) / area_total,
+        }
+        if len(grupos):
+            orden = np.lexsort((lat, grupos))
+            inicios = np.searchsorted(grupos[orden], np.arange(n_grupos))
+            finales = np.searchsorted(grupos[orden], np.arange(n_grupos), side='right') - 1
+            tabla['lat_min'][con_datos] = lat[orden][inicios[con_datos]]
+            tabla['lat_max'][con_datos] = lat[orden][finales[con_datos]]
+
+        for nombre, valores in campos.items():
+            valores = valores[celdas]
+            finitos = np.isfinite(valores)
+            suma = np.bincount(grupos[finitos], weights=(area * valores)[finitos], minlength=n_grupos)
+            peso = np.bincount(grupos[finitos], weights=area[finitos], minlength=n_grupos)
+            tabla[nombre] = suma / peso
+    return pd.DataFrame(tabla)
+
+
+def estadisticas_clases(clases, k, lats, lons, campos=None):
+    """Tabla (clases 0..k-1) de un mapa de clases lat x lon (-1 = sin datos)."""
+    areas = areas_celdas(lats, lons).ravel()
+    lats_celdas = np.repeat(np.asarray(lats, dtype=np.float64), len(lons))
+    planas = clases.ravel()
+    celdas = np.flatnonzero(planas != VALOR_RELLENO)
+    tabla = estadisticas_por_grupo(planas[celdas].astype(np.int64), celdas, k, areas, lats_celdas,
+                                   {n: np.asarray(v, dtype=np.float64).ravel() for n, v in (campos or {}).items()})
+    # Fracción del área con datos (tierra), no de todo el globo
+    tabla.insert(2, 'fraccion_area', tabla['area_km2'] / tabla['area_km2'].sum())
+    tabla.index.name = 'clase'
+    return tabla
+
+
+def estadisticas_habitats(habitats, especies, lats, lons, campos=None, tierra=None):
+    """
+    Tabla (una fila por especie) del cubo de hábitats especies x lat x lon de
+    'aplicar_habitats' (clase en el hábitat, -1 fuera). Todas las especies
+    en una sola reducción, aunque sus hábitats se solapen. Con 'tierra'
+    (máscara lat x lon) se añade la fracción del área de tierra.
+    """
+    areas = areas_celdas(lats, lons).ravel()
+    lats_celdas = np.repeat(np.asarray(lats, dtype=np.float64), len(lons))
+    grupos, celdas = np.nonzero(habitats.reshape(len(especies), -1) != VALOR_RELLENO)
+    tabla = estadisticas_por_grupo(grupos, celdas, len(especies), areas, lats_celdas,
+                                   {n: np.asarray(v, dtype=np.float64).ravel() for n, v in (campos or {}).items()})
+    if tierra is not None:
+        tabla.insert(2, 'fraccion_area', tabla['area_km2'] / areas[np.ravel(tierra)].sum())
+    tabla.index = pd.Index(especies, name='especie')
+    return tabla
+
+
+def cargar_campos_climaticos(lats, lons, ruta_ensemble=RUTA_ENSEMBLE, variables=VARIABLES_CLIMATICAS):
+    """
+    {'<var>_media_anual': array lat x lon} con la media de los 12 meses de
+    cada climatología del ensemble, en el grid del mapa. {} si no existen.
+    """
+    try:
+        climatologias = cargar_climatologias(ruta_ensemble, variables)
+    except (OSError, FileNotFoundError) as e:
+        print(f"¡AVISO! No se pudieron cargar las climatologías del ensemble ({e}); se omiten.")
+        return {}
+    medias = climatologias.mean('month').sel(lat=lats, lon=lons, method='nearest')
+    return {f"{var}_media_anual": medias[var].transpose('lat', 'lon').values for var in variables}
+
+
+def estadisticas_zonales(lista_k=None, habitats=True, ruta_filtros=RUTA_FILTROS):
+    print("==========================================================")
+    print("Estadísticas zonales ponderadas por área")
+    print("==========================================================")
+
+    print("\n--- 1. Cargando mapas de clasificación ---")
+    archivos = encontrar_todos_los_nc()
+    if lista_k:
+        archivos = [(ruta, k) for ruta, k in archivos if k in lista_k]
+    if not archivos:
+        print(f"¡ERROR! No se encontró ningún mapa de clasificación en {RUTA_KMEANS}")
+        return
+    cubo, lats, lons, lista_k = cargar_cubo_clases(archivos)
+    print(f"{len(lista_k)} mapas (k = {', '.join(map(str, lista_k))}).")
+
+    print("\n--- 2. Cargando climatologías del ensemble ---")
+    campos = cargar_campos_climaticos(lats, lons)
+    print(f"Campos: {', '.join(campos) or 'ninguno'}")
+
+    if habitats:
+        zonas_por_k = zonas_todos_k_desde_puntos(cubo, lats, lons, lista_k)
+        mascaras = compilar_mascaras(cargar_filtros(ruta_filtros), lats, lons)
+
+    print("\n--- 3. Calculando estadísticas ---")
+    pd.set_option('display.width', 200)
+    for i, k in enumerate(lista_k):
+        tabla = estadisticas_clases(cubo[i], k, lats, lons, campos)
+        ruta_tabla = os.path.join(RUTA_KMEANS, f"estadisticas_zonales_k{k}.csv")
+        tabla.to_csv(ruta_tabla, float_format='%.6g')
+        print(f"\nk = {k}:")
+        print(tabla.to_string(float_format=lambda x: f'{x:.4g}'))
+        print(f"Guardado en: {ruta_tabla}")
+
+        if habitats:
+            zonas = zonas_por_k[k]
+            cubo_habitats = aplicar_habitats(cubo[i], zonas, mascaras, k)
+            tabla_h = estadisticas_habitats(cubo_habitats, list(zonas), lats, lons, campos,
+                                            tierra=cubo[i] != VALOR_RELLENO)
+            tabla_h.insert(0, 'clusteres', [' '.join(map(str, z)) for z in zonas.values()])
+            ruta_tabla = os.path.join(RUTA_KMEANS, f"estadisticas_habitats_k{k}.csv")
+            tabla_h.to_csv(ruta_tabla, float_format='%.6g')
+            print(tabla_h.to_string(float_format=lambda x: f'{x:.4g}'))
+            print(f"Guardado en: {ruta_tabla}")
+    print("==========================================================")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estadísticas zonales ponderadas por área de clústeres y hábitats.")
+    parser.add_argument('--k', nargs='+', default=None,
+                        help="Valores de k a analizar (p. ej. 5-7 10). Por defecto, todos los mapas.")
+    parser.add_argument('--sin-habitats', action='store_true',
+                        help="Omite las estadísticas de los hábitats de cada especie.")
+    parser.add_argument('--filtros', default=RUTA_FILTROS,
+                        help="Archivo JSON con los filtros geográficos de hábitat de cada especie.")
+    args = parser.parse_args()
+    estadisticas_zonales(lista_k=interpretar_lista_k(args.k) if args.k else None,
+                         habitats=not args.sin_habitats, ruta_filtros=args.filtros)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+EXPORTA LOS RESULTADOS POR CELDA A UNA TABLA CONSULTABLE (PARQUET / SQLITE)
+
+Instrucciones:
+1. Se ejecuta al final del flujo (después de los mapas y, si se quieren
+   incluir, de 'estabilidad_kmeans.py' e 'idoneidad_habitat.py').
+2. Reúne en UNA tabla con una fila por celda del grid: lat, lon, si es
+   tierra, área (km²), las CPs de 'componentes_principales.nc', la clase en
+   cada 'mapa_clasificacion_k*.nc', la estabilidad de cada
+   'estabilidad_k*.nc' y la idoneidad de cada especie de
+   'idoneidad_habitat.nc' (las que existan).
+3. Formatos (--formato):
+   - parquet: dataset en '../data_resultados/celdas/', particionado por
+     'tierra' y por banda de latitud, con grupos de filas pequeños, para
+     que los filtros solo lean las particiones y grupos que pueden cumplirse
+     (predicate pushdown). Necesita pyarrow.
+   - sqlite: '../data_resultados/celdas.sqlite', con índices en lat/lon y
+     en la clase de cada k (solo biblioteca estándar).
+4. Consultas rápidas sin escribir código:
+       python exportar_resultados.py --solo-consulta --consulta "clase_k8 == 4" "CP_1 > 2"
+   o en SQLite: SELECT lat, lon FROM celdas WHERE clase_k8 = 4 AND CP_1 > 2;
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+import unicodedata
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from mapas_clases import leer_mapa_clases
+from estadisticas_zonales import areas_celdas
+from analizar_y_mapear_habitats_pandaversion import encontrar_todos_los_nc
+
+# --- CONFIGURACIÓN ---
+FORMATOS = ('parquet', 'sqlite', 'ambos')
+BANDA_LATITUD = 30 # Grados por partición de latitud
+TAM_GRUPO_FILAS = 16_384 # Filas por grupo de Parquet (estadísticas min/max por grupo)
+NOMBRE_TABLA = 'celdas'
+
+# --- RUTAS ---
+RUTA_PCA_IN = "../data_pca"
+RUTA_KMEANS = "../data_kmeans"
+RUTA_HABITAT = "../data_habitat"
+RUTA_RESULTADOS = "../data_resultados"
+
+
+def _nombre_columna(texto):
+    """'Oso Perezoso' -> 'oso_perezoso' (sin acentos ni espacios, válido en SQL)."""
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^0-9a-zA-Z]+', '_', texto).strip('_').lower()
+
+
+def construir_tabla_celdas(ruta_pca=RUTA_PCA_IN, ruta_kmeans=RUTA_KMEANS, ruta_habitat=RUTA_HABITAT):
+    """
+    DataFrame con una fila por celda (orden stack(punto=('lat', 'lon'))) y
+    todas las columnas de resultados disponibles. Devuelve (tabla, metadatos).
+    """
+    with xr.open_dataset(os.path.join(ruta_pca, 'componentes_principales.nc')) as pca_ds:
+        pca_ds = pca_ds.transpose('lat', 'lon').load()
+    lats, lons = pca_ds['lat'].values, pca_ds['lon'].values
+    lat2d, lon2d = np.meshgrid(lats, lons, indexing='ij')
+
+    columnas = {
+        'indice': np.arange(lat2d.size, dtype=np.int32),
+        'lat': lat2d.ravel(),
+        'lon': lon2d.ravel(),
+        'area_km2': areas_celdas(lats, lons).ravel().astype(np.float32),
+    }
+    cps = sorted(pca_ds.data_vars, key=lambda v: int(v.split('_')[-1]))
+    tierra = np.ones(lat2d.size, dtype=bool)
+    for cp in cps:
+        valores = pca_ds[cp].values.ravel()
+        columnas[cp] = valores.astype(np.float32)
+        tierra &= np.isfinite(valores)
+    columnas['tierra'] = tierra.astype(np.int8) # 0/1: mismo tipo en Parquet (partición) y SQLite
+    columnas['banda_lat'] = (np.floor((columnas['lat'] + 90.0) / BANDA_LATITUD) * BANDA_LATITUD - 90.0).clip(
+        -90, 90 - BANDA_LATITUD).astype(np.int16)
+    metadatos = {'fecha': datetime.now().isoformat(timespec='seconds'), 'componentes': cps, 'k': [],
+                 'estabilidad_k': [], 'especies_idoneidad': []}
+
+    def _en_grid(da):
+        da = da.transpose('lat', 'lon')
+        if not (np.array_equal(da['lat'].values, lats) and np.array_equal(da['lon'].values, lons)):
+            return None
+        return da.values.ravel()
+
+    for ruta, k in encontrar_todos_los_nc():
+        clases = _en_grid(leer_mapa_clases(ruta)['climate_class'])
+        if clases is None:
+            print(f"¡AVISO! {os.path.basename(ruta)} usa otro grid; se omite.")
+            continue
+        columnas[f'clase_k{k}'] = clases
+        metadatos['k'].append(k)
+
+        ruta_estabilidad = os.path.join(ruta_kmeans, f'estabilidad_k{k}.nc')
+        if os.path.exists(ruta_estabilidad):
+            with xr.open_dataset(ruta_estabilidad) as ds:
+                estabilidad = _en_grid(ds['estabilidad'].load())
+            if estabilidad is not None:
+                columnas[f'estabilidad_k{k}'] = estabilidad.astype(np.float32)
+                metadatos['estabilidad_k'].append(k)
+
+    ruta_idoneidad = os.path.join(ruta_habitat, 'idoneidad_habitat.nc')
+    if os.path.exists(ruta_idoneidad):
+        with xr.open_dataset(ruta_idoneidad) as ds:
+            for especie in ds['especie'].values:
+                idoneidad = _en_grid(ds['idoneidad'].sel(especie=especie).load())
+                if idoneidad is not None:
+                    columnas[f'idoneidad_{_nombre_columna(especie)}'] = idoneidad.astype(np.float32)
+                    metadatos['especies_idoneidad'].append(str(especie))
+            metadatos['metrica_idoneidad'] = ds.attrs.get('metrica')
+
+    return pd.DataFrame(columnas), metadatos
+
+
+def guardar_parquet(tabla, metadatos, ruta_salida):
+    """Dataset Parquet particionado por 'tierra' y 'banda_lat' (se reescribe entero)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if os.path.exists(ruta_salida):
+        shutil.rmtree(ruta_salida)
+    # Dentro de cada partición, filas ordenadas por lat/lon: los grupos de filas
+    # quedan compactos en el espacio y sus estadísticas min/max son útiles
+    tabla_arrow = pa.Table.from_pandas(tabla.sort_values(['tierra', 'banda_lat', 'lat', 'lon']),
+                                       preserve_index=False)
+    tabla_arrow = tabla_arrow.replace_schema_metadata(
+        {**(tabla_arrow.schema.metadata or {}), b'resultados': json.dumps(metadatos).encode()})
+    pq.write_to_dataset(tabla_arrow, ruta_salida, partition_cols=['tierra', 'banda_lat'],
+                        row_group_size=TAM_GRUPO_FILAS)
+
+
+def guardar_sqlite(tabla, metadatos, ruta_salida):
+    """Tabla 'celdas' con índices en lat/lon, tierra y la clase de cada k (se reescribe)."""
+    if os.path.exists(ruta_salida):
+        os.remove(ruta_salida)
+    with sqlite3.connect(ruta_salida) as conexion:
+        tabla.to_sql(NOMBRE_TABLA, conexion, index=False, chunksize=50_000)
+        conexion.execute(f"CREATE INDEX idx_{NOMBRE_TABLA}_latlon ON {NOMBRE_TABLA} (lat, lon)")
+        conexion.execute(f"CREATE INDEX idx_{NOMBRE_TABLA}_tierra ON {NOMBRE_TABLA} (tierra)")
+        for columna in tabla.columns:
+            if columna.startswith('clase_k'):
+                conexion.execute(f"CREATE INDEX idx_{NOMBRE_TABLA}_{columna} ON {NOMBRE_TABLA} ({columna})")
+        conexion.execute("CREATE TABLE metadatos (clave TEXT PRIMARY KEY, valor TEXT)")
+        conexion.executemany("INSERT INTO metadatos VALUES (?, ?)",
+                             [(clave, json.dumps(valor)) for clave, valor in metadatos.items()])
+
+
+def interpretar_filtros(expresiones):
+    """['clase_k8 == 4', 'CP_1 > 2'] -> [('clase_k8', '==', 4), ('CP_1', '>', 2.0)]."""
+    filtros = []
+    for expresion in expresiones:
+        match = re.fullmatch(r'\s*(\w+)\s*(==|!=|>=|<=|>|<)\s*(\S+)\s*', expresion)
+        if not match:
+            raise ValueError(f"Filtro no válido: '{expresion}' (formato: 'columna operador valor')")
+        columna, operador, valor = match.groups()
+        if valor.lower() in ('true', 'false'):
+            valor = int(valor.lower() == 'true') # Columnas 0/1 como 'tierra'
+        else:
+            valor = float(valor)
+            valor = int(valor) if valor.is_integer() and columna.startswith('clase_k') else valor
+        filtros.append((columna, operador, valor))
+    return filtros
+
+
+def consultar_parquet(ruta_dataset, filtros, columnas=None):
+    """Lee solo las filas que cumplen 'filtros' (con predicate pushdown)."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    # Tipos explícitos de las columnas de partición (si no, se leen como diccionarios)
+    particiones = ds.partitioning(pa.schema([('tierra', pa.int8()), ('banda_lat', pa.int16())]), flavor='hive')
+    return pq.read_table(ruta_dataset, filters=filtros or None, columns=columnas,
+                         partitioning=particiones).to_pandas()
+
+
+def consultar_sqlite(ruta_sqlite, filtros, columnas=None):
+    """Misma consulta sobre la base SQLite."""
+    condiciones = ' AND '.join(f"{c} {'=' if o == '==' else o} ?" for c, o, _ in filtros) or '1'
+    seleccion = ', '.join(columnas) if columnas else '*'
+    with sqlite3.connect(ruta_sqlite) as conexion:
+        return pd.read_sql_query(f"SELECT {seleccion} FROM {NOMBRE_TABLA} WHERE {condiciones}", conexion,
+                                 params=[v for _, _, v in filtros])
+
+
+def exportar_resultados(formato=None, consulta=None, solo_consulta=False):
+    print("==========================================================")
+    print("Exportando resultados por celda")
+    print("==========================================================")
+    os.makedirs(RUTA_RESULTADOS, exist_ok=True)
+    ruta_parquet = os.path.join(RUTA_RESULTADOS, NOMBRE_TABLA)
+    ruta_sqlite = os.path.join(RUTA_RESULTADOS, f"{NOMBRE_TABLA}.sqlite")
+
+    if formato is None:
+        try:
+            import pyarrow # noqa: F401
+            formato = 'ambos'
+        except ImportError:
+            print("¡AVISO! pyarrow no está instalado; solo se exporta a SQLite.")
+            formato = 'sqlite'
+
+    if not solo_consulta:
+        print("\n--- 1. Reuniendo resultados ---")
+        try:
+            tabla, metadatos = construir_tabla_celdas()
+        except Exception as e:
+            print(f"¡ERROR! No se pudieron reunir los resultados: {e}")
+            return
+        print(f"{len(tabla)} celdas ({int(tabla['tierra'].sum())} de tierra) x {tabla.shape[1]} columnas")
+        print(f"  k: {metadatos['k']} | estabilidad: {metadatos['estabilidad_k']} | "
+              f"idoneidad: {metadatos['especies_idoneidad']}")
+
+        print("\n--- 2. Escribiendo ---")
+        if formato in ('parquet', 'ambos'):
+            guardar_parquet(tabla, metadatos, ruta_parquet)
+            print(f"Dataset Parquet guardado en: {ruta_parquet}")
+        if formato in ('sqlite', 'ambos'):
+            guardar_sqlite(tabla, metadatos, ruta_sqlite)
+            print(f"Base SQLite guardada en: {ruta_sqlite}")
+
+    if consulta:
+        print(f"\n--- Consulta: {' AND '.join(consulta)} ---")
+        try:
+            filtros = interpretar_filtros(consulta)
+        except ValueError as e:
+            print(f"¡ERROR! {e}")
+            return
+        consultas = []
+        if formato in ('parquet', 'ambos') and os.path.exists(ruta_parquet):
+            consultas.append(('Parquet', consultar_parquet, ruta_parquet))
+        if formato in ('sqlite', 'ambos') and os.path.exists(ruta_sqlite):
+            consultas.append(('SQLite', consultar_sqlite, ruta_sqlite))
+        if not consultas:
+            print("¡ERROR! No hay ninguna tabla exportada que consultar.")
+            return
+        for nombre, funcion, ruta in consultas:
+            inicio = time.perf_counter()
+            try:
+                resultado = funcion(ruta, filtros)
+            except Exception as e:
+                print(f"¡ERROR! La consulta en {nombre} falló: {str(e).splitlines()[0]}")
+                return
+            print(f"{nombre}: {len(resultado)} celdas en {(time.perf_counter() - inicio) * 1e3:.1f} ms")
+        print(resultado[['lat', 'lon'] + [c for c, _, _ in filtros if c in resultado]].head(10).to_string(index=False))
+    print("==========================================================")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta los resultados por celda a Parquet y/o SQLite.")
+    parser.add_argument('--formato', choices=FORMATOS, default=None,
+                        help="Formato de salida (por defecto, ambos si pyarrow está instalado).")
+    parser.add_argument('--consulta', nargs='+', default=None, metavar='FILTRO',
+                        help="Filtros 'columna operador valor' a aplicar tras exportar, p. ej. \"clase_k8 == 4\".")
+    parser.add_argument('--solo-consulta', action='store_true',
+                        help="No vuelve a exportar; solo consulta las tablas existentes.")
+    args = parser.parse_args()
+    exportar_resultados(formato=args.formato, consulta=args.consulta, solo_consulta=args.solo_consulta)
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+VARIABLES DERIVADAS Y CONJUNTOS DE CARACTERÍSTICAS PARA EL PCA
+
+Instrucciones:
+1. FEATURES_DERIVADOS define cada variable derivada de forma declarativa:
+   sus entradas (variables del ensemble u otras derivadas), la función
+   (operaciones de xarray sobre todo el grid a la vez), unidades y descripción.
+   Añadir una variable nueva = añadir una entrada aquí, sin tocar otros scripts.
+2. CONJUNTOS_FEATURES da nombre a listas de variables. 'base' es la matriz
+   original (pr, tasmax, tasmin x 12 meses).
+3. Cada variable derivada se guarda en '../data_features/[nombre]_[huella].nc'.
+   La huella depende del bytecode de su función (y de las funciones y
+   constantes del módulo que usa), de VERSION_FEATURES y de los datos de
+   entrada, así que si cambian las climatologías o la función se recalcula
+   sola. VERSION_FEATURES solo hace falta para invalidar a mano.
+   La caché está acotada a TAM_MAXIMO_CACHE_FEATURES_MB: al superarlo se
+   eliminan los archivos usados hace más tiempo (como la caché de k-means).
+4. 'aplicar_pca.py --conjunto extendido' (o una lista de nombres, p. ej.
+   '--conjunto pr tas dtr') entrena el PCA con ese conjunto y guarda los
+   nombres en 'modelo_pca.npz' ('variables'). Así 'clasificar_escenarios.py'
+   puede reconstruir las mismas características.
+5. Para precalcular y revisar un conjunto:
+       python features_derivados.py --conjunto estacional
+"""
+
+import argparse
+import hashlib
+import os
+import tempfile
+import types
+import numpy as np
+import xarray as xr
+
+from cache_kmeans import huella_matriz, podar_cache
+from matriz_features import VARIABLES_CLIMATICAS, RUTA_ENSEMBLE, cargar_climatologias
+
+# --- CONFIGURACIÓN ---
+VERSION_FEATURES = 1
+DIAS_POR_MES = xr.DataArray([31, 28.25, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+                            coords={'month': np.arange(1, 13)}, dims='month')
+ESTACIONES = ['DJF', 'MAM', 'JJA', 'SON']
+ESTACION_DE_MES = np.array(['DJF', 'DJF', 'MAM', 'MAM', 'MAM', 'JJA', 'JJA', 'JJA', 'SON', 'SON', 'SON', 'DJF'])
+
+
+def media_estacional(da):
+    """Media de los meses de cada estación (DJF, MAM, JJA, SON): 'month' -> 'estacion'."""
+    estacion = xr.DataArray(ESTACION_DE_MES[da['month'].values - 1], dims='month', name='estacion')
+    return da.groupby(estacion).mean('month').sel(estacion=ESTACIONES)
+
+
+def _cociente(numerador, denominador):
+    return xr.where(denominador > 0, numerador / denominador, 0.0)
+
+
+# nombre -> entradas, función (recibe las entradas en ese orden), unidades y descripción
+FEATURES_DERIVADOS = {
+    'tas': {
+        'entradas': ('tasmax', 'tasmin'),
+        'funcion': lambda tasmax, tasmin: (tasmax + tasmin) / 2.0,
+        'unidades': 'K', 'descripcion': 'Temperatura media mensual, (tasmax + tasmin) / 2',
+    },
+    'dtr': {
+        'entradas': ('tasmax', 'tasmin'),
+        'funcion': lambda tasmax, tasmin: tasmax - tasmin,
+        'unidades': 'K', 'descripcion': 'Rango térmico diario medio de cada mes',
+    },
+    'pr_mensual': {
+        'entradas': ('pr',),
+        'funcion': lambda pr: pr * 86400.0 * DIAS_POR_MES,
+        'unidades': 'mm/mes', 'descripcion': 'Precipitación acumulada de cada mes',
+    },
+    'pr_anual': {
+        'entradas': ('pr_mensual',),
+        'funcion': lambda pr_mensual: pr_mensual.sum('month'),
+        'unidades': 'mm', 'descripcion': 'Precipitación anual',
+    },
+    'amplitud_tas': {
+        'entradas': ('tas',),
+        'funcion': lambda tas: tas.max('month') - tas.min('month'),
+        'unidades': 'K', 'descripcion': 'Amplitud estacional: mes más cálido menos mes más frío',
+    },
+    'estacionalidad_pr': {
+        'entradas': ('pr_mensual',),
+        'funcion': lambda pr_mensual: 100.0 * _cociente(pr_mensual.std('month'), pr_mensual.mean('month')),
+        'unidades': '%', 'descripcion': 'Coeficiente de variación de la precipitación mensual',
+    },
+    'aridez': {
+        'entradas': ('pr_anual', 'tas'),
+        # Con T < -9 °C el índice no está definido; se limita el denominador a 1 °C
+        'funcion': lambda pr_anual, tas: pr_anual / np.maximum(tas.mean('month') - 273.15 + 10.0, 1.0),
+        'unidades': 'mm/°C', 'descripcion': 'Índice de aridez de De Martonne, P / (T + 10)',
+    },
+    'tas_estacional': {
+        'entradas': ('tas',),
+        'funcion': media_estacional,
+        'unidades': 'K', 'descripcion': 'Temperatura media de cada estación',
+    },
+    'dtr_estacional': {
+        'entradas': ('dtr',),
+        'funcion': media_estacional,
+        'unidades': 'K', 'descripcion': 'Rango térmico diario medio de cada estación',
+    },
+    'pr_estacional': {
+        'entradas': ('pr_mensual',),
+        'funcion': media_estacional,
+        'unidades': 'mm/mes', 'descripcion': 'Precipitación mensual media de cada estación',
+    },
+}
+
+CONJUNTOS_FEATURES = {
+    'base': list(VARIABLES_CLIMATICAS),
+    'tas_dtr': ['pr', 'tas', 'dtr'],
+    'extendido': ['pr', 'tas', 'dtr', 'amplitud_tas', 'pr_anual', 'estacionalidad_pr', 'aridez'],
+    'estacional': ['pr_estacional', 'tas_estacional', 'dtr_estacional', 'amplitud_tas', 'estacionalidad_pr', 'aridez'],
+}
+CONJUNTO_POR_DEFECTO = 'base'
+
+# --- RUTAS ---
+RUTA_CACHE_FEATURES = "../data_features"
+TAM_MAXIMO_CACHE_FEATURES_MB = 256
+
+
+def resolver_conjunto(conjunto):
+    """
+    Lista de variables de un conjunto: su nombre en CONJUNTOS_FEATURES o una
+    lista de variables (del ensemble o de FEATURES_DERIVADOS).
+    """
+    if isinstance(conjunto, str):
+        conjunto = [conjunto]
+    if len(conjunto) == 1 and conjunto[0] in CONJUNTOS_FEATURES:
+        return list(CONJUNTOS_FEATURES[conjunto[0]])
+    desconocidas = [nombre for nombre in conjunto
+                    if nombre not in VARIABLES_CLIMATICAS and nombre not in FEATURES_DERIVADOS]
+    if desconocidas:
+        raise ValueError(f"variables desconocidas: {desconocidas}. Conjuntos: {sorted(CONJUNTOS_FEATURES)}; "
+                         f"variables: {VARIABLES_CLIMATICAS + sorted(FEATURES_DERIVADOS)}")
+    return list(dict.fromkeys(conjunto))
+
+
+def variables_base(nombres):
+    """Variables del ensemble de las que dependen (directa o indirectamente) 'nombres'."""
+    base = []
+    pendientes = list(nombres)
+    while pendientes:
+        nombre = pendientes.pop(0)
+        if nombre in FEATURES_DERIVADOS:
+            pendientes.extend(FEATURES_DERIVADOS[nombre]['entradas'])
+        elif nombre not in base:
+            base.append(nombre)
+    return [var for var in VARIABLES_CLIMATICAS if var in base]
+
+
+def huella_funcion(funcion):
+    """
+    Hash del bytecode y las constantes de la función, incluyendo las
+    funciones y los valores globales que usa (p. ej. media_estacional o
+    DIAS_POR_MES). Cambia si se edita la definición de una variable.
+    """
+    h = hashlib.sha256()
+    vistas = set()
+
+    def visitar(codigo, globales):
+        h.update(codigo.co_code)
+        for constante in codigo.co_consts:
+            if isinstance(constante, types.CodeType):
+                visitar(constante, globales)
+            else:
+                h.update(repr(constante).encode())
+        for nombre in codigo.co_names:
+            h.update(nombre.encode())
+            valor = globales.get(nombre)
+            if isinstance(valor, types.FunctionType):
+                if valor not in vistas:
+                    vistas.add(valor)
+                    visitar(valor.__code__, valor.__globals__)
+            elif isinstance(valor, (xr.DataArray, np.ndarray)):
+                h.update(huella_matriz(np.asarray(valor)).encode())
+            elif isinstance(valor, (int, float, str, tuple, list)):
+                h.update(repr(valor).encode())
+
+    visitar(funcion.__code__, funcion.__globals__)
+    return h.hexdigest()
+
+
+def _guardar_atomico(da, ruta):
+    """Escribe el NetCDF en un temporal y lo renombra (varios procesos a la vez)."""
+    descriptor, ruta_temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.nc.tmp')
+    os.close(descriptor)
+    try:
+        da.to_netcdf(ruta_temporal)
+        os.replace(ruta_temporal, ruta)
+    except BaseException:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+
+
+def calcular_features(nombres, climatologias, ruta_cache=RUTA_CACHE_FEATURES, usar_cache=True):
+    """
+    Diccionario {nombre: DataArray (lat x lon [x month | x estacion])} con las
+    variables pedidas. Las derivadas se leen de la caché si su huella
+    coincide; si no, se calculan a partir de sus entradas y se guardan.
+    """
+    campos, huellas = {}, {}
+
+    def resolver(nombre):
+        if nombre in campos:
+            return
+        if nombre not in FEATURES_DERIVADOS:
+            if nombre not in climatologias:
+                raise ValueError(f"la variable '{nombre}' no está en las climatologías cargadas")
+            campos[nombre] = climatologias[nombre]
+            huellas[nombre] = huella_matriz(climatologias[nombre].values)
+            return
+
+        definicion = FEATURES_DERIVADOS[nombre]
+        for entrada in definicion['entradas']:
+            resolver(entrada)
+        texto = '|'.join([nombre, f"v{VERSION_FEATURES}", huella_funcion(definicion['funcion'])]
+                         + [huellas[e] for e in definicion['entradas']])
+        huellas[nombre] = hashlib.sha256(texto.encode()).hexdigest()
+        ruta = os.path.join(ruta_cache, f"{nombre}_{huellas[nombre][:16]}.nc")
+
+        if usar_cache and os.path.exists(ruta):
+            with xr.open_dataarray(ruta) as da:
+                campos[nombre] = da.load()
+            # Marcamos la entrada como usada recientemente (para la política LRU)
+            try:
+                os.utime(ruta)
+            except OSError:
+                pass
+            return
+        da = definicion['funcion'](*(campos[e] for e in definicion['entradas']))
+        da = da.rename(nombre).drop_vars([c for c in da.coords if c not in da.dims])
+        da.attrs = {'units': definicion['unidades'], 'description': definicion['descripcion'],
+                    'huella': huellas[nombre]}
+        campos[nombre] = da
+        if usar_cache:
+            os.makedirs(ruta_cache, exist_ok=True)
+            _guardar_atomico(da, ruta)
+            podar_cache(ruta_cache, TAM_MAXIMO_CACHE_FEATURES_MB, prefijo='', sufijo='.nc')
+
+    for nombre in nombres:
+        resolver(nombre)
+    return {nombre: campos[nombre] for nombre in nombres}
+
+
+def construir_matriz_conjunto(campos):
+    """
+    Devuelve (datos_apilados, matriz_limpia, indices_validos, columnas), como
+    'construir_matriz_features' pero con variables de cualquier forma: 12
+    columnas por variable mensual, 4 por estacional y 1 por anual.
+    - datos_apilados: DataArray (punto x feature), mismo orden de puntos que
+      stack(punto=('lat', 'lon')).
+    """
+    bloques, columnas, puntos = [], [], None
+    for nombre, da in campos.items():
+        otras = [dim for dim in da.dims if dim not in ('lat', 'lon')]
+        apilado = da.stack(punto=('lat', 'lon')).transpose('punto', *otras)
+        if puntos is None:
+            puntos = apilado['punto']
+        elif not apilado.indexes['punto'].equals(puntos.to_index()):
+            raise ValueError(f"la variable '{nombre}' no tiene el mismo grid que el resto")
+        bloques.append(apilado.values.reshape(apilado.shape[0], -1))
+        if 'month' in otras:
+            columnas += [f"{nombre}_m{int(mes):02d}" for mes in da['month'].values]
+        elif 'estacion' in otras:
+            columnas += [f"{nombre}_{estacion}" for estacion in da['estacion'].values]
+        else:
+            columnas.append(nombre)
+
+    matriz_features = np.hstack(bloques)
+    datos_apilados = xr.DataArray(matriz_features, coords={'punto': puntos, 'feature': columnas},
+                                  dims=('punto', 'feature'))
+    indices_validos = ~np.isnan(matriz_features).any(axis=1)
+    return datos_apilados, matriz_features[indices_validos], indices_validos, columnas
+
+
+def matriz_conjunto(conjunto, ruta_ensemble=RUTA_ENSEMBLE, ruta_cache=RUTA_CACHE_FEATURES, usar_cache=True):
+    """
+    Carga solo las climatologías necesarias y devuelve
+    (climatologias, datos_apilados, matriz_limpia, indices_validos, columnas).
+    """
+    nombres = resolver_conjunto(conjunto)
+    climatologias = cargar_climatologias(ruta_ensemble, variables_base(nombres))
+    campos = calcular_features(nombres, climatologias, ruta_cache, usar_cache)
+    return (climatologias,) + construir_matriz_conjunto(campos)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calcula (y guarda en caché) las variables de un conjunto.")
+    parser.add_argument('--conjunto', nargs='+', default=[CONJUNTO_POR_DEFECTO],
+                        help=f"Nombre del conjunto ({', '.join(CONJUNTOS_FEATURES)}) o lista de variables.")
+    parser.add_argument('--sin-cache', action='store_true',
+                        help="Recalcula todo sin leer ni escribir la caché.")
+    args = parser.parse_args()
+
+    print("Variables derivadas disponibles:")
+    for nombre, definicion in FEATURES_DERIVADOS.items():
+        print(f"  {nombre:<18} [{definicion['unidades']}] {definicion['descripcion']}")
+    try:
+        nombres = resolver_conjunto(args.conjunto)
+        _, _, matriz_limpia, _, columnas = matriz_conjunto(nombres, usar_cache=not args.sin_cache)
+    except (OSError, ValueError) as e:
+        print(f"¡ERROR! {e}")
+    else:
+        print(f"\nConjunto: {nombres}")
+        print(f"Matriz: {matriz_limpia.shape} (puntos x características)")
+        print(f"Columnas: {', '.join(columnas)}")
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+FILTROS GEOGRÁFICOS DE HÁBITAT DECLARADOS EN UN ARCHIVO DE CONFIGURACIÓN
+
+Instrucciones:
+1. Las reglas de cada especie se declaran en
+   '../data_auxiliar/filtros_habitat.json':
+       {
+         "Oso Panda": {
+           "descripcion": "...",
+           "permitir": [{"lat": [28, 35], "lon": [102, 109]}],
+           "excluir": [{"poligono": [[lon, lat], [lon, lat], ...]}]
+         }
+       }
+   - "permitir": la especie solo puede aparecer dentro de alguna de estas
+     regiones (si no se indica, en todo el mundo).
+   - "excluir": la especie nunca aparece dentro de estas regiones.
+   - Cada región es una caja {"lat": [min, max], "lon": [min, max]} (si
+     lon min > lon max, la caja cruza el antimeridiano) o un polígono
+     {"poligono": [[lon, lat], ...]}.
+2. 'compilar_mascaras' convierte las reglas en una máscara booleana
+   (lat x lon) por especie, una sola vez por grid.
+3. 'aplicar_habitats' aplica clústeres y máscaras de todas las especies en
+   una única operación vectorizada. Añadir una especie es solo editar el JSON.
+"""
+
+import json
+import os
+import numpy as np
+from matplotlib.path import Path
+
+from mapas_clases import VALOR_RELLENO
+
+RUTA_FILTROS = "../data_auxiliar/filtros_habitat.json"
+
+# Máscaras ya compiladas, por (grid, reglas)
+_MASCARAS = {}
+
+
+def cargar_filtros(ruta=RUTA_FILTROS):
+    """Devuelve {especie: reglas} o {} si el archivo no existe."""
+    if not ruta or not os.path.exists(ruta):
+        print(f"¡AVISO! No se encontró el archivo de filtros de hábitat '{ruta}'; no se aplican filtros.")
+        return {}
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def mascara_region(region, lat2d, lon2d):
+    """Máscara booleana de las celdas cuyo centro está dentro de la región."""
+    if 'poligono' in region:
+        vertices = np.asarray(region['poligono'], dtype=np.float64)
+        puntos = np.column_stack([lon2d.ravel(), lat2d.ravel()])
+        return Path(vertices).contains_points(puntos).reshape(lat2d.shape)
+
+    lat_min, lat_max = region.get('lat', (-90, 90))
+    lon_min, lon_max = region.get('lon', (-180, 180))
+    dentro_lat = (lat2d >= lat_min) & (lat2d <= lat_max)
+    if lon_min <= lon_max:
+        dentro_lon = (lon2d >= lon_min) & (lon2d <= lon_max)
+    else:
+        dentro_lon = (lon2d >= lon_min) | (lon2d <= lon_max)
+    return dentro_lat & dentro_lon
+
+
+def _mascara_especie(reglas, lat2d, lon2d):
+    permitidas = reglas.get('permitir')
+    if permitidas:
+        mascara = np.zeros(lat2d.shape, dtype=bool)
+        for region in permitidas:
+            mascara |= mascara_region(region, lat2d, lon2d)
+    else:
+        mascara = np.ones(lat2d.shape, dtype=bool)
+    for region in reglas.get('excluir', []):
+        mascara &= ~mascara_region(region, lat2d, lon2d)
+    return mascara
+
+
+def compilar_mascaras(filtros, lats, lons):
+    """{especie: máscara lat x lon} para las especies con reglas (una vez por grid)."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    clave = (lats.tobytes(), lons.tobytes(), json.dumps(filtros, sort_keys=True))
+    if clave not in _MASCARAS:
+        lon2d, lat2d = np.meshgrid(lons, lats)
+        _MASCARAS[clave] = {especie: _mascara_especie(reglas, lat2d, lon2d)
+                            for especie, reglas in filtros.items()}
+    return _MASCARAS[clave]
+
+
+def aplicar_habitats(clases, zonas_por_especie, mascaras, k):
+    """
+    Devuelve un cubo (especies x lat x lon) con la clase de cada celda donde
+    está el hábitat de la especie (clase en sus zonas y dentro de su máscara)
+    y VALOR_RELLENO en el resto. Todas las especies en una sola pasada.
+    """
+    especies = list(zonas_por_especie)
+    # Tabla especie x clase: True si la clase es hábitat de la especie
+    tabla = np.zeros((len(especies), k + 1), dtype=bool)
+    for i, especie in enumerate(especies):
+        tabla[i, zonas_por_especie[especie]] = True
+    # La última columna corresponde a las celdas sin datos (nunca hábitat)
+    indices = np.where(clases == VALOR_RELLENO, k, clases)
+
+    sin_filtro = np.ones(clases.shape, dtype=bool)
+    mascara = np.stack([mascaras.get(especie, sin_filtro) for especie in especies]) if especies else \
+        np.zeros((0,) + clases.shape, dtype=bool)
+    en_habitat = tabla[:, indices] & mascara
+    return np.where(en_habitat, clases[np.newaxis], VALOR_RELLENO).astype(clases.dtype)
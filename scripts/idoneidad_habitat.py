@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+IDONEIDAD CONTINUA DEL HÁBITAT EN EL ESPACIO DE LAS COMPONENTES PRINCIPALES
+
+Instrucciones:
+1. Se ejecuta después de 'aplicar_pca.py' (no depende de ningún k).
+2. Las celdas de referencia de cada especie son las de los PUNTOS_MUESTRA
+   de 'analizar_y_mapear_habitats_pandaversion.py' o, con
+   --ocurrencias archivo.csv|.parquet, las celdas con registros de cada
+   especie (ponderadas por su número de registros).
+3. Para cada celda de tierra se calcula la distancia, en el espacio de las
+   CPs de '../data_pca/componentes_principales.nc', a la nube de referencia
+   de la especie, por bloques de TAM_BLOQUE celdas y con productos de
+   matrices (BLAS):
+   - 'mahalanobis' (por defecto): distancia al centro de la nube con su
+     covarianza (regularizada hacia la de todas las celdas de tierra, para
+     especies con pocas celdas). Idoneidad = probabilidad chi-cuadrado de
+     una distancia igual o mayor.
+   - 'euclidea': distancia a la celda de referencia más cercana.
+     Idoneidad = exp(-d² / 2h²), con h el ancho de banda de Scott.
+4. Guarda '../data_habitat/idoneidad_habitat.nc' (especie x lat x lon,
+   variables 'idoneidad' en [0, 1] y 'distancia') y la figura
+   '../figures/idoneidad_habitat_<metrica>.png' (un panel por especie).
+   Con --vista-previa, a baja resolución; si ya está al día no se redibuja,
+   salvo con --forzar.
+"""
+
+import matplotlib
+matplotlib.use('Agg') # Modo no interactivo
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import matplotlib.pyplot as plt
+from scipy.linalg import cho_factor, solve_triangular
+from scipy.stats import chi2
+
+from utilidades_kmeans import cargar_matriz_pca
+from busqueda_puntos import LocalizadorClases
+from ocurrencias_especies import celdas_por_especie
+from analizar_y_mapear_habitats_pandaversion import (PUNTOS_MUESTRA, BUSCAR_TIERRA_CERCANA,
+                                                     DISTANCIA_MAXIMA_TIERRA_KM)
+from cache_figuras import huella_figura, figura_al_dia
+from renderizado_mapas import crear_figura_mapas, dibujar_campo, guardar_figura
+
+# --- CONFIGURACIÓN ---
+METRICAS = ('mahalanobis', 'euclidea')
+METRICA = 'mahalanobis'
+TAM_BLOQUE = 50_000 # Celdas de tierra por bloque de productos de matrices
+MAX_ELEMENTOS_BLOQUE = 10_000_000 # Tamaño máximo de la matriz celdas x referencias (euclídea)
+MAPA_COLORES_IDONEIDAD = 'YlGn'
+
+# --- RUTAS ---
+RUTA_PCA_IN = "../data_pca"
+RUTA_HABITAT_OUT = "../data_habitat"
+RUTA_FIGURES = "../figures"
+
+
+def referencias_desde_puntos_muestra(localizador, tierra_cercana=BUSCAR_TIERRA_CERCANA):
+    """{especie: (indices_planos, pesos)} con las celdas de los PUNTOS_MUESTRA."""
+    referencias = {}
+    for especie, puntos in PUNTOS_MUESTRA.items():
+        lat, lon = np.array(list(puntos.values()), dtype=np.float64).T
+        celdas = localizador.indices_planos(lat, lon, tierra_cercana, DISTANCIA_MAXIMA_TIERRA_KM)
+        celdas, repeticiones = np.unique(celdas[celdas >= 0], return_counts=True)
+        referencias[especie] = (celdas, repeticiones.astype(np.float64))
+    return referencias
+
+
+def _covarianza_ponderada(matriz, pesos, media):
+    centrada = matriz - media
+    return (centrada * pesos[:, np.newaxis]).T @ centrada / pesos.sum()
+
+
+def distancias_mahalanobis(matriz, referencia, pesos, covarianza_global, tam_bloque=TAM_BLOQUE):
+    """
+    Distancia de Mahalanobis de cada fila de 'matriz' al centro (ponderado)
+    de 'referencia'. La covarianza de la referencia se encoge hacia
+    'covarianza_global' con un peso equivalente a p + 2 celdas, así que
+    sigue siendo invertible con una sola celda de referencia.
+    """
+    p = matriz.shape[1]
+    media = pesos @ referencia / pesos.sum()
+    n_ref = len(referencia)
+    n_previo = p + 2
+    covarianza = (n_ref * _covarianza_ponderada(referencia, pesos, media)
+                  + n_previo * covarianza_global) / (n_ref + n_previo)
+
+    # Blanqueo: con covarianza = L Lᵀ, d² = |L⁻¹ (x - media)|² = |(x - media) W|², W = L⁻ᵀ
+    triangular, _ = cho_factor(covarianza, lower=True)
+    blanqueo = solve_triangular(np.tril(triangular), np.eye(p), lower=True).T
+
+    distancias = np.empty(len(matriz), dtype=np.float64)
+    for inicio in range(0, len(matriz), tam_bloque):
+        bloque = (matriz[inicio:inicio + tam_bloque] - media) @ blanqueo
+        distancias[inicio:inicio + tam_bloque] = np.sqrt(np.einsum('ij,ij->i', bloque, bloque))
+    return distancias
+
+
+def distancias_euclideas(matriz, referencia, tam_bloque=TAM_BLOQUE):
+    """
+    Distancia euclídea de cada fila de 'matriz' a la fila más cercana de
+    'referencia', con |x|² + |r|² - 2 x·r calculado por bloques (el bloque
+    se reduce si hay muchas referencias, para acotar la memoria).
+    """
+    tam_bloque = max(1, min(tam_bloque, MAX_ELEMENTOS_BLOQUE // len(referencia)))
+    normas_ref = np.einsum('ij,ij->i', referencia, referencia)
+    distancias = np.empty(len(matriz), dtype=np.float64)
+    for inicio in range(0, len(matriz), tam_bloque):
+        bloque = matriz[inicio:inicio + tam_bloque]
+        d2 = np.einsum('ij,ij->i', bloque, bloque)[:, np.newaxis] + normas_ref - 2.0 * (bloque @ referencia.T)
+        distancias[inicio:inicio + tam_bloque] = np.sqrt(np.maximum(d2.min(axis=1), 0.0))
+    return distancias
+
+
+def idoneidad(distancias, metrica, p, escala=None):
+    """Convierte distancias en una idoneidad en [0, 1] (1 = clima idéntico)."""
+    if metrica == 'mahalanobis':
+        return chi2.sf(distancias ** 2, df=p)
+    return np.exp(-0.5 * (distancias / escala) ** 2)
+
+
+def calcular_idoneidad(matriz_limpia, posiciones, referencias, metrica=METRICA, tam_bloque=TAM_BLOQUE):
+    """
+    Devuelve (idoneidad, distancias, n_celdas_ref): arrays especies x celdas
+    de tierra y el número de celdas de referencia de cada especie.
+    'posiciones' traduce índices planos del grid a filas de 'matriz_limpia'.
+    """
+    matriz = np.ascontiguousarray(matriz_limpia, dtype=np.float64)
+    p = matriz.shape[1]
+    covarianza_global = np.cov(matriz, rowvar=False)
+    desviacion_global = np.sqrt(np.trace(covarianza_global) / p)
+
+    n_especies = len(referencias)
+    resultado = np.full((n_especies, len(matriz)), np.nan, dtype=np.float64)
+    distancias = np.full((n_especies, len(matriz)), np.nan, dtype=np.float64)
+    n_celdas = np.zeros(n_especies, dtype=np.int64)
+
+    for i, (especie, (celdas, pesos)) in enumerate(referencias.items()):
+        # Celda -1 = registros sin datos (ver 'celdas_por_especie')
+        filas = np.where(celdas < 0, -1, posiciones[np.maximum(celdas, 0)])
+        pesos = np.asarray(pesos, dtype=np.float64)[filas >= 0]
+        filas = filas[filas >= 0]
+        n_celdas[i] = len(filas)
+        if not len(filas):
+            print(f"  -> {especie}: ¡AVISO! ninguna celda de referencia con datos; se omite.")
+            continue
+        referencia = matriz[filas]
+
+        if metrica == 'mahalanobis':
+            distancias[i] = distancias_mahalanobis(matriz, referencia, pesos, covarianza_global, tam_bloque)
+            resultado[i] = idoneidad(distancias[i], metrica, p)
+        else:
+            distancias[i] = distancias_euclideas(matriz, referencia, tam_bloque)
+            # Ancho de banda de Scott: se estrecha cuantas más celdas de referencia hay
+            escala = desviacion_global * len(filas) ** (-1.0 / (p + 4))
+            resultado[i] = idoneidad(distancias[i], metrica, p, escala)
+        print(f"  -> {especie}: {len(filas)} celdas de referencia | "
+              f"idoneidad media {np.mean(resultado[i]):.3f}, "
+              f"celdas con idoneidad >= 0.5: {int(np.sum(resultado[i] >= 0.5))}")
+    return resultado, distancias, n_celdas
+
+
+def guardar_idoneidad_netcdf(lats, lons, indices_validos, especies, valores, distancias,
+                             n_celdas, metrica, ruta_salida):
+    """Guarda idoneidad y distancia (especie x lat x lon, NaN en océano) en un .nc."""
+    forma = (len(especies), len(lats), len(lons))
+    variables = {}
+    for nombre, validos in (('idoneidad', valores), ('distancia', distancias)):
+        completo = np.full((len(especies), len(indices_validos)), np.nan, dtype=np.float32)
+        completo[:, indices_validos] = validos
+        variables[nombre] = (('especie', 'lat', 'lon'), completo.reshape(forma))
+    variables['celdas_referencia'] = (('especie',), n_celdas)
+
+    ds = xr.Dataset(
+        variables,
+        coords={'especie': list(especies), 'lat': lats, 'lon': lons},
+        attrs={'metrica': metrica,
+               'descripcion': "Idoneidad climática del hábitat en el espacio de las CPs (1 = clima de referencia)"},
+    )
+    ds.to_netcdf(ruta_salida)
+    return ds
+
+
+def generar_figura_idoneidad(ds, ruta_salida, vista_previa=False, forzar=False):
+    """Un panel por especie con la idoneidad continua."""
+    especies = [str(e) for e in ds['especie'].values]
+    huella = huella_figura('idoneidad_habitat', (ds['idoneidad'].values, ds['lat'].values, ds['lon'].values),
+                           especies=especies, metrica=ds.attrs['metrica'], vista_previa=vista_previa)
+    if figura_al_dia(ruta_salida, huella, forzar):
+        return
+
+    lats = ds['lat'].values
+    lons = ds['lon'].values
+    n_filas = (len(especies) + 1) // 2
+    fig, axes = crear_figura_mapas(nrows=n_filas, ncols=2, figsize=(20, 6 * n_filas))
+    for i, ax in enumerate(axes):
+        if i >= len(especies):
+            ax.set_visible(False)
+            continue
+        ax.set_title(f"Idoneidad: {especies[i]} ({ds.attrs['metrica']})")
+        malla = dibujar_campo(ax, lats, lons, ds['idoneidad'].values[i], cmap=MAPA_COLORES_IDONEIDAD,
+                              vmin=0.0, vmax=1.0, alpha_costas=0.6, rejilla_alpha=0.3)
+        plt.colorbar(malla, ax=ax, orientation='vertical', shrink=0.7, label='Idoneidad')
+
+    plt.tight_layout(pad=2.0)
+    guardar_figura(fig, ruta_salida, vista_previa, huella)
+    print(f"Figura de idoneidad guardada en: {ruta_salida}")
+
+
+def idoneidad_habitat(metrica=METRICA, ruta_ocurrencias=None, tierra_cercana=BUSCAR_TIERRA_CERCANA,
+                      vista_previa=False, forzar=False):
+    print("===========================================================")
+    print(f"Idoneidad del hábitat en el espacio de las CPs ({metrica})")
+    print("===========================================================")
+    os.makedirs(RUTA_HABITAT_OUT, exist_ok=True)
+    os.makedirs(RUTA_FIGURES, exist_ok=True)
+
+    print("\n--- 1. Cargando Componentes Principales ---")
+    try:
+        datos_apilados, indices_validos, matriz_limpia = cargar_matriz_pca(RUTA_PCA_IN)
+    except Exception as e:
+        print(f"¡ERROR! No se pudieron cargar las CPs de {RUTA_PCA_IN}: {e}")
+        return
+    # El orden de 'punto' es el de stack(punto=('lat', 'lon')): índice plano i_lat * n_lon + i_lon
+    lats = pd.unique(datos_apilados['lat'].values)
+    lons = pd.unique(datos_apilados['lon'].values)
+    print(f"{len(matriz_limpia)} celdas de tierra y {matriz_limpia.shape[1]} CPs.")
+
+    # Índice plano del grid -> fila de 'matriz_limpia' (-1 en océano)
+    posiciones = np.full(len(indices_validos), -1, dtype=np.int64)
+    posiciones[indices_validos] = np.arange(len(matriz_limpia))
+    localizador = LocalizadorClases.desde_mascara(lats, lons, indices_validos.reshape(len(lats), len(lons)))
+
+    print("\n--- 2. Celdas de referencia de cada especie ---")
+    if ruta_ocurrencias:
+        referencias = celdas_por_especie(ruta_ocurrencias, localizador, tierra_cercana, DISTANCIA_MAXIMA_TIERRA_KM)
+    else:
+        referencias = referencias_desde_puntos_muestra(localizador, tierra_cercana)
+    if not referencias:
+        print("¡ERROR! No hay celdas de referencia para ninguna especie.")
+        return
+
+    print(f"\n--- 3. Calculando distancias ({metrica}) por bloques de {TAM_BLOQUE} celdas ---")
+    valores, distancias, n_celdas = calcular_idoneidad(matriz_limpia, posiciones, referencias, metrica)
+
+    print("\n--- 4. Guardando resultados ---")
+    ruta_nc = os.path.join(RUTA_HABITAT_OUT, 'idoneidad_habitat.nc')
+    ds = guardar_idoneidad_netcdf(lats, lons, indices_validos, list(referencias), valores, distancias,
+                                  n_celdas, metrica, ruta_nc)
+    print(f"Mapa de idoneidad guardado en: {ruta_nc}")
+    generar_figura_idoneidad(ds, os.path.join(RUTA_FIGURES, f"idoneidad_habitat_{metrica}.png"),
+                             vista_previa, forzar)
+    print("===========================================================")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calcula la idoneidad continua del hábitat de cada especie.")
+    parser.add_argument('--metrica', choices=METRICAS, default=METRICA,
+                        help="Distancia en el espacio de las CPs.")
+    parser.add_argument('--ocurrencias', default=None,
+                        help="Archivo CSV o Parquet de ocurrencias (especie, lat, lon[, peso]) "
+                             "que sustituye a los PUNTOS_MUESTRA.")
+    parser.add_argument('--tierra-cercana', action='store_true', default=BUSCAR_TIERRA_CERCANA,
+                        help="Asigna los puntos en océano a la celda de tierra más cercana.")
+    parser.add_argument('--vista-previa', action='store_true',
+                        help="Guarda la figura a baja resolución (mucho más rápido).")
+    parser.add_argument('--forzar', action='store_true',
+                        help="Redibuja la figura aunque ya esté al día.")
+    args = parser.parse_args()
+    idoneidad_habitat(metrica=args.metrica, ruta_ocurrencias=args.ocurrencias,
+                      tierra_cercana=args.tierra_cercana, vista_previa=args.vista_previa, forzar=args.forzar)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+CLASIFICACIÓN CLIMÁTICA DE KÖPPEN-GEIGER (REFERENCIA PARA LOS MAPAS K-MEANS)
+
+Instrucciones:
+1. Usa las climatologías del ensemble de '../data_ensemble' (ver
+   'matriz_features.py'): pr (kg m-2 s-1 -> mm/mes) y tas = (tasmax +
+   tasmin) / 2 (K -> °C).
+2. Aplica los umbrales de Beck et al. (2018) a todas las celdas a la vez
+   (operaciones de NumPy sobre arrays 12 x celdas, sin bucles por celda):
+   - El "verano" es el semestre (abr-sep u oct-mar) más cálido de cada celda.
+   - E (Thot < 10 °C) tiene prioridad sobre B, y B sobre A, C y D.
+   - En C y D, 's' se comprueba antes que 'w'.
+3. Guarda '../data_kmeans/mapa_koppen_geiger.nc' en el mismo formato que
+   'mapa_clasificacion_k*.nc' (30 clases, nombres en 'flag_meanings') y la
+   figura '../figures/mapa_koppen_geiger.png' (colores de Beck et al.).
+4. Compara la clasificación con cada mapa K-means (tablas de contingencia con
+   un único np.bincount) a nivel de clase (30) y de grupo principal (A-E):
+   índice de Rand ajustado, información mutua normalizada, V de Cramér y
+   pureza. Guarda '../data_kmeans/concordancia_koppen.csv' y la tabla de
+   contingencia de cada k en '../data_kmeans/contingencia_koppen_k[N].csv':
+       python koppen_geiger.py
+       python koppen_geiger.py --k 7 8 --vista-previa
+"""
+
+import matplotlib
+matplotlib.use('Agg') # Modo no interactivo
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
+
+from mapas_clases import VALOR_RELLENO, crear_dataset_clases, guardar_mapa_clases, leer_mapa_clases
+from matriz_features import cargar_climatologias
+from linaje_clusters import contingencia
+from utilidades_kmeans import interpretar_lista_k
+from analizar_y_mapear_habitats_pandaversion import encontrar_todos_los_nc
+from cache_figuras import huella_figura, figura_al_dia
+from renderizado_mapas import crear_figura_mapas, dibujar_campo, guardar_figura
+
+# --- CONFIGURACIÓN ---
+# Clases en el orden de Beck et al. (2018); el índice es el valor del mapa
+CLASES_KOPPEN = [
+    'Af', 'Am', 'Aw',
+    'BWh', 'BWk', 'BSh', 'BSk',
+    'Csa', 'Csb', 'Csc', 'Cwa', 'Cwb', 'Cwc', 'Cfa', 'Cfb', 'Cfc',
+    'Dsa', 'Dsb', 'Dsc', 'Dsd', 'Dwa', 'Dwb', 'Dwc', 'Dwd', 'Dfa', 'Dfb', 'Dfc', 'Dfd',
+    'ET', 'EF',
+]
+GRUPOS_KOPPEN = ['A', 'B', 'C', 'D', 'E']
+# Grupo principal (índice en GRUPOS_KOPPEN) de cada clase
+GRUPO_DE_CLASE = np.array([GRUPOS_KOPPEN.index(nombre[0]) for nombre in CLASES_KOPPEN])
+COLORES_KOPPEN = np.array([
+    [0, 0, 255], [0, 120, 255], [70, 170, 250],
+    [255, 0, 0], [255, 150, 150], [245, 165, 0], [255, 220, 100],
+    [255, 255, 0], [200, 200, 0], [150, 150, 0], [150, 255, 150], [100, 200, 100], [50, 150, 50],
+    [200, 255, 80], [100, 255, 80], [50, 200, 0],
+    [255, 0, 255], [200, 0, 200], [150, 50, 150], [150, 100, 150],
+    [170, 175, 255], [90, 120, 220], [75, 80, 180], [50, 0, 135],
+    [0, 255, 255], [55, 200, 255], [0, 125, 125], [0, 70, 95],
+    [178, 178, 178], [102, 102, 102],
+]) / 255.0
+DIAS_POR_MES = np.array([31, 28.25, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+MESES_ABR_SEP = np.arange(3, 9) # índices 0-based de abril a septiembre
+
+# --- RUTAS ---
+RUTA_KMEANS = "../data_kmeans"
+RUTA_FIGURES = "../figures"
+
+
+def variables_koppen(datos_combinados):
+    """
+    Devuelve (T, P) con forma (12, lat, lon): temperatura media mensual en °C
+    y precipitación mensual en mm, a partir de pr, tasmax y tasmin.
+    """
+    datos = datos_combinados.transpose('month', 'lat', 'lon')
+    temperatura = (datos['tasmax'].values + datos['tasmin'].values) / 2.0 - 273.15
+    precipitacion = datos['pr'].values * 86400.0 * DIAS_POR_MES[:, np.newaxis, np.newaxis]
+    return temperatura, precipitacion
+
+
+def clasificar_koppen(temperatura, precipitacion):
+    """
+    Clase de Köppen-Geiger (índice en CLASES_KOPPEN) de cada celda.
+    'temperatura' (°C) y 'precipitacion' (mm/mes) tienen forma (12, ...);
+    devuelve un array con la forma del resto de ejes y -1 donde falten datos.
+    """
+    forma = temperatura.shape[1:]
+    T = temperatura.reshape(12, -1)
+    P = precipitacion.reshape(12, -1)
+    validas = np.isfinite(T).all(axis=0) & np.isfinite(P).all(axis=0)
+    T, P = T[:, validas], P[:, validas]
+
+    MAT = T.mean(axis=0)
+    MAP = P.sum(axis=0)
+    Thot = T.max(axis=0)
+    Tcold = T.min(axis=0)
+    Tmon10 = (T > 10).sum(axis=0)
+    Pdry = P.min(axis=0)
+
+    # Verano = semestre más cálido de cada celda (funciona en ambos hemisferios)
+    abr_sep = np.zeros((12, 1), dtype=bool)
+    abr_sep[MESES_ABR_SEP] = True
+    verano_abr_sep = T[MESES_ABR_SEP].mean(axis=0) >= np.delete(T, MESES_ABR_SEP, axis=0).mean(axis=0)
+    es_verano = abr_sep == verano_abr_sep[np.newaxis, :]
+    P_verano = np.where(es_verano, P, np.nan)
+    P_invierno = np.where(es_verano, np.nan, P)
+    Psdry, Pswet = np.nanmin(P_verano, axis=0), np.nanmax(P_verano, axis=0)
+    Pwdry, Pwwet = np.nanmin(P_invierno, axis=0), np.nanmax(P_invierno, axis=0)
+    fraccion_invierno = np.nansum(P_invierno, axis=0) / np.maximum(MAP, 1e-12)
+
+    Pumbral = np.select([fraccion_invierno >= 0.7, fraccion_invierno <= 0.3],
+                        [2 * MAT, 2 * MAT + 28], default=2 * MAT + 14)
+
+    # Segunda letra de C y D (0 = s, 1 = w, 2 = f) y tercera (0 = a ... 3 = d)
+    estacionalidad = np.select([(Psdry < 40) & (Psdry < Pwwet / 3), Pwdry < Pswet / 10], [0, 1], default=2)
+    temperatura_verano = np.select([Thot >= 22, Tmon10 >= 4, Tcold < -38], [0, 1, 3], default=2)
+
+    indice = CLASES_KOPPEN.index
+    clases = np.select(
+        [
+            Thot <= 0,
+            Thot <= 10,
+            MAP < 5 * Pumbral,
+            MAP < 10 * Pumbral,
+            Tcold >= 18,
+            Tcold > 0,
+        ],
+        [
+            indice('EF'),
+            indice('ET'),
+            np.where(MAT >= 18, indice('BWh'), indice('BWk')),
+            np.where(MAT >= 18, indice('BSh'), indice('BSk')),
+            np.select([Pdry >= 60, Pdry >= 100 - MAP / 25], [indice('Af'), indice('Am')], default=indice('Aw')),
+            indice('Csa') + 3 * estacionalidad + np.minimum(temperatura_verano, 2),
+        ],
+        default=indice('Dsa') + 4 * estacionalidad + temperatura_verano,
+    )
+
+    resultado = np.full(validas.shape, VALOR_RELLENO, dtype=np.int8)
+    resultado[validas] = clases
+    return resultado.reshape(forma)
+
+
+def medidas_concordancia(tabla):
+    """
+    Concordancia entre dos particiones a partir de su tabla de contingencia:
+    índice de Rand ajustado, información mutua normalizada (media aritmética
+    de las entropías), V de Cramér y pureza de las filas respecto a las columnas.
+    """
+    tabla = np.asarray(tabla, dtype=np.float64)
+    tabla = tabla[tabla.sum(axis=1) > 0][:, tabla.sum(axis=0) > 0]
+    n = tabla.sum()
+    filas, columnas = tabla.sum(axis=1), tabla.sum(axis=0)
+
+    def pares(x):
+        return x * (x - 1) / 2.0
+
+    indice = pares(tabla).sum()
+    esperado = pares(filas).sum() * pares(columnas).sum() / pares(n)
+    maximo = (pares(filas).sum() + pares(columnas).sum()) / 2.0
+    ari = (indice - esperado) / (maximo - esperado) if maximo != esperado else 1.0
+
+    esperadas = np.outer(filas, columnas) / n
+    no_nulas = tabla > 0
+    informacion = np.sum(tabla[no_nulas] / n * np.log(tabla[no_nulas] / esperadas[no_nulas]))
+    entropia_filas = -np.sum(filas / n * np.log(filas / n))
+    entropia_columnas = -np.sum(columnas / n * np.log(columnas / n))
+    media_entropias = (entropia_filas + entropia_columnas) / 2.0
+    nmi = informacion / media_entropias if media_entropias > 0 else 1.0
+
+    chi2 = np.sum((tabla - esperadas) ** 2 / esperadas)
+    grados = min(tabla.shape) - 1
+    cramer = np.sqrt(chi2 / (n * grados)) if grados > 0 else 0.0
+
+    return {'ari': ari, 'nmi': nmi, 'v_cramer': cramer, 'pureza': tabla.max(axis=1).sum() / n}
+
+
+def dibujar_mapa_koppen(clases, lats, lons, ruta_salida, vista_previa=False, huella=None):
+    """Mapa de Köppen-Geiger con la paleta estándar y una marca por clase presente."""
+    fig, axes = crear_figura_mapas(figsize=(16, 8))
+    ax = axes[0]
+    ax.set_title("Clasificación de Köppen-Geiger (climatología del ensemble)")
+    n = len(CLASES_KOPPEN)
+    malla = dibujar_campo(ax, lats, lons, np.where(clases == VALOR_RELLENO, np.nan, clases).astype(np.float32),
+                          cmap=ListedColormap(COLORES_KOPPEN), vmin=-0.5, vmax=n - 0.5)
+    presentes = np.unique(clases[clases != VALOR_RELLENO])
+    cbar = plt.colorbar(malla, ax=ax, orientation='vertical', shrink=0.8)
+    cbar.set_ticks(presentes)
+    cbar.set_ticklabels([CLASES_KOPPEN[c] for c in presentes])
+    cbar.ax.tick_params(labelsize=7)
+    cbar.set_label('Clase de Köppen-Geiger')
+    guardar_figura(fig, ruta_salida, vista_previa, huella, bbox_inches='tight')
+    return ruta_salida
+
+
+def koppen_geiger(lista_k=None, vista_previa=False, forzar=False):
+    print("==========================================================")
+    print("Clasificación de Köppen-Geiger y concordancia con K-means")
+    print("==========================================================")
+    os.makedirs(RUTA_KMEANS, exist_ok=True)
+    os.makedirs(RUTA_FIGURES, exist_ok=True)
+
+    print("\n--- 1. Clasificando las climatologías del ensemble ---")
+    try:
+        datos = cargar_climatologias()
+    except (OSError, KeyError) as e:
+        print(f"¡ERROR! No se pudieron cargar las climatologías: {e}")
+        return
+    lats, lons = datos['lat'].values, datos['lon'].values
+    clases = clasificar_koppen(*variables_koppen(datos))
+
+    mapa = xr.DataArray(clases, coords={'lat': lats, 'lon': lons}, dims=('lat', 'lon'))
+    ds = crear_dataset_clases(mapa, len(CLASES_KOPPEN), nombres_clases=CLASES_KOPPEN,
+                              descripcion="Clasificación de Köppen-Geiger (umbrales de Beck et al., 2018) "
+                                          "de la climatología del ensemble.")
+    ruta_mapa = os.path.join(RUTA_KMEANS, 'mapa_koppen_geiger.nc')
+    guardar_mapa_clases(ds, ruta_mapa)
+    print(f"Mapa guardado en: {ruta_mapa}")
+
+    validas = clases != VALOR_RELLENO
+    frecuencias = pd.Series(np.bincount(clases[validas], minlength=len(CLASES_KOPPEN)), index=CLASES_KOPPEN)
+    print("Celdas por clase:")
+    print(frecuencias[frecuencias > 0].to_string())
+
+    ruta_figura = os.path.join(RUTA_FIGURES, 'mapa_koppen_geiger.png')
+    huella = huella_figura('koppen_geiger', (clases,), vista_previa=vista_previa)
+    if not figura_al_dia(ruta_figura, huella, forzar):
+        dibujar_mapa_koppen(clases, lats, lons, ruta_figura, vista_previa, huella)
+        print(f"Figura guardada en: {ruta_figura}")
+
+    print("\n--- 2. Concordancia con los mapas K-means ---")
+    archivos = [(ruta, k) for ruta, k in encontrar_todos_los_nc() if not lista_k or k in lista_k]
+    if not archivos:
+        print(f"¡AVISO! No se encontró ningún mapa de clasificación en {RUTA_KMEANS}")
+        return
+
+    filas = []
+    for ruta, k in archivos:
+        mapa_k = leer_mapa_clases(ruta)['climate_class'].transpose('lat', 'lon')
+        if not (np.array_equal(mapa_k['lat'].values, lats) and np.array_equal(mapa_k['lon'].values, lons)):
+            print(f"¡AVISO! {os.path.basename(ruta)} no usa el grid de las climatologías; se omite.")
+            continue
+        etiquetas_k = mapa_k.values.ravel()
+        comunes = (etiquetas_k != VALOR_RELLENO) & validas.ravel()
+        kmeans = etiquetas_k[comunes].astype(np.int64)
+        koppen = clases.ravel()[comunes].astype(np.int64)
+
+        tabla = contingencia(kmeans, koppen, k, len(CLASES_KOPPEN))
+        tabla_grupos = contingencia(kmeans, GRUPO_DE_CLASE[koppen], k, len(GRUPOS_KOPPEN))
+        for nivel, t in (('clase', tabla), ('grupo', tabla_grupos)):
+            filas.append({'k': k, 'nivel': nivel, 'n_celdas': int(comunes.sum()), **medidas_concordancia(t)})
+
+        presentes = tabla.sum(axis=0) > 0
+        tabla_df = pd.DataFrame(tabla[:, presentes], columns=np.array(CLASES_KOPPEN)[presentes],
+                                index=pd.RangeIndex(k, name='clase'))
+        tabla_df.to_csv(os.path.join(RUTA_KMEANS, f'contingencia_koppen_k{k}.csv'))
+        dominante = tabla_df.idxmax(axis=1)
+        fraccion = tabla_df.max(axis=1) / np.maximum(tabla_df.sum(axis=1), 1)
+        print(f"\nk = {k}: clase de Köppen dominante en cada clúster")
+        print(', '.join(f"{c}: {dominante[c]} ({fraccion[c] * 100:.0f}%)" for c in tabla_df.index))
+
+    if not filas:
+        return
+    resumen = pd.DataFrame(filas)
+    ruta_resumen = os.path.join(RUTA_KMEANS, 'concordancia_koppen.csv')
+    resumen.to_csv(ruta_resumen, index=False, float_format='%.6g')
+    print()
+    print(resumen.to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+    print(f"Concordancia guardada en: {ruta_resumen}")
+    print("==========================================================")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Köppen-Geiger desde el ensemble y concordancia con K-means.")
+    parser.add_argument('--k', nargs='+', default=None,
+                        help="Valores de k a comparar (p. ej. 5-7 10). Por defecto, todos los mapas.")
+    parser.add_argument('--vista-previa', action='store_true',
+                        help="Guarda la figura a baja resolución (mucho más rápido).")
+    parser.add_argument('--forzar', action='store_true',
+                        help="Redibuja la figura aunque ya esté al día.")
+    args = parser.parse_args()
+    koppen_geiger(lista_k=interpretar_lista_k(args.k) if args.k else None,
+                  vista_previa=args.vista_previa, forzar=args.forzar)
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+LINAJE DE CLÚSTERES ENTRE MAPAS CON DISTINTO k
+
+Instrucciones:
+1. Se ejecuta después de generar los mapas 'mapa_clasificacion_k*.nc'
+   (con 'clasificar_multi_k.py' o 'generar_mapa_kmeans.py'), o directamente
+   desde 'clasificar_multi_k.py --linaje' sobre los ajustes en memoria,
+   antes de guardar nada (así los mapas, los centroides y las figuras salen
+   ya con los IDs nuevos).
+2. Recorre todos los k en orden creciente en una sola pasada y, para cada
+   par (k padre, k hijo), calcula la tabla de contingencia con np.bincount.
+3. Renumera las clases del hijo para que coincidan con las del padre
+   (algoritmo húngaro); las clases nuevas reciben los IDs k_padre, k_padre+1...
+   Así la clase 3 con k=7 es (casi) la misma zona que la clase 3 con k=8,
+   y los colores de las figuras son comparables.
+4. Guarda el árbol de divisiones/fusiones en '../data_kmeans/linaje_clusters.json'
+   junto con la permutación de cada k respecto a las etiquetas del ajuste
+   original (y una huella de esas etiquetas). 'guardar_resultados_k' y
+   'estabilidad_kmeans.py' la vuelven a aplicar cuando el ajuste sale de la
+   caché, así que una ejecución posterior sin --linaje no deshace los IDs.
+5. Ejecutado como script, sobrescribe los mapas (y reordena
+   'centroides_k[N].npz' y la clase de consenso de 'estabilidad_k[N].nc'
+   si existen).
+"""
+
+import glob
+import json
+import os
+import re
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from modelo_portable import cargar_centroides, guardar_centroides
+from mapas_clases import VALOR_RELLENO, leer_mapa_clases, guardar_mapa_clases
+from cache_kmeans import huella_matriz
+
+# --- CONFIGURACIÓN ---
+# Fracción mínima de una clase que debe ir a otra para contar como rama del árbol
+UMBRAL_RAMA = 0.10
+# Atributo de los NetCDF con la permutación aplicada a las etiquetas originales
+ATRIBUTO_PERMUTACION = 'permutacion_linaje'
+
+# --- RUTAS ---
+RUTA_KMEANS = "../data_kmeans"
+NOMBRE_ARBOL = 'linaje_clusters.json'
+
+
+def encontrar_mapas(ruta_kmeans=RUTA_KMEANS):
+    """Devuelve {k: ruta} de todos los 'mapa_clasificacion_k*.nc'."""
+    mapas = {}
+    for ruta in glob.glob(os.path.join(ruta_kmeans, 'mapa_clasificacion_k*.nc')):
+        match = re.search(r'mapa_clasificacion_k(\d+)\.nc$', os.path.basename(ruta))
+        if match:
+            mapas[int(match.group(1))] = ruta
+    return dict(sorted(mapas.items()))
+
+
+def leer_etiquetas(ruta):
+    """Devuelve (dataset en memoria, etiquetas enteras, máscara de celdas válidas)."""
+    ds = leer_mapa_clases(ruta)
+    valores = ds['climate_class'].values
+    validas = valores != VALOR_RELLENO
+    return ds, valores[validas].astype(np.int64), validas
+
+
+def contingencia(etiquetas_padre, etiquetas_hijo, k_padre, k_hijo):
+    """Tabla (k_padre x k_hijo) de celdas compartidas, con un único bincount."""
+    return np.bincount(etiquetas_padre * k_hijo + etiquetas_hijo,
+                       minlength=k_padre * k_hijo).reshape(k_padre, k_hijo)
+
+
+def permutacion_segun_padre(tabla):
+    """
+    Devuelve 'nuevo_id' (array de tamaño k_hijo) tal que la clase c del hijo
+    pasa a llamarse nuevo_id[c]. Las k_padre clases del hijo con más
+    solapamiento heredan el ID del padre; el resto reciben IDs nuevos,
+    ordenados por su padre dominante y por tamaño.
+    """
+    k_padre, k_hijo = tabla.shape
+    filas, columnas = linear_sum_assignment(-tabla)
+    nuevo_id = np.full(k_hijo, -1, dtype=np.int64)
+    nuevo_id[columnas] = filas
+
+    sin_asignar = np.flatnonzero(nuevo_id < 0)
+    padre_dominante = tabla[:, sin_asignar].argmax(axis=0)
+    tamanos = tabla[:, sin_asignar].sum(axis=0)
+    orden = np.lexsort((-tamanos, padre_dominante))
+    nuevo_id[sin_asignar[orden]] = np.arange(k_padre, k_padre + len(sin_asignar))
+    return nuevo_id
+
+
+def ramas_del_arbol(tabla, umbral=UMBRAL_RAMA):
+    """
+    Divisiones: una clase padre reparte >= umbral de sus celdas en varias hijas.
+    Fusiones: una clase hija recibe >= umbral de sus celdas de varios padres.
+    """
+    fraccion_padre = tabla / np.maximum(tabla.sum(axis=1, keepdims=True), 1)
+    fraccion_hijo = tabla / np.maximum(tabla.sum(axis=0, keepdims=True), 1)
+
+    hijos = {}
+    for padre in range(tabla.shape[0]):
+        destinos = np.flatnonzero(fraccion_padre[padre] >= umbral)
+        hijos[int(padre)] = {int(h): round(float(fraccion_padre[padre, h]), 3) for h in destinos}
+
+    divisiones = {p: h for p, h in hijos.items() if len(h) > 1}
+    fusiones = {}
+    for hijo in range(tabla.shape[1]):
+        origenes = np.flatnonzero(fraccion_hijo[:, hijo] >= umbral)
+        if len(origenes) > 1:
+            fusiones[int(hijo)] = {int(p): round(float(fraccion_hijo[p, hijo]), 3) for p in origenes}
+    return hijos, divisiones, fusiones
+
+
+def transicion(etiquetas_padre, etiquetas_hijo, k_padre, k_hijo, umbral=UMBRAL_RAMA):
+    """
+    Renumeración del hijo según el padre (ya renumerado). Devuelve
+    (nuevo_id, entrada del árbol) y muestra las divisiones y fusiones.
+    """
+    tabla = contingencia(etiquetas_padre, etiquetas_hijo, k_padre, k_hijo)
+    nuevo_id = permutacion_segun_padre(tabla)
+    # La tabla del árbol se expresa ya con los IDs nuevos del hijo
+    tabla_renumerada = np.zeros_like(tabla)
+    tabla_renumerada[:, nuevo_id] = tabla
+
+    hijos, divisiones, fusiones = ramas_del_arbol(tabla_renumerada, umbral)
+    print(f"\n--- k={k_padre} -> k={k_hijo} ---")
+    print(f"  Renumeración necesaria: {'sí' if not np.array_equal(nuevo_id, np.arange(k_hijo)) else 'no'}")
+    for padre, destinos in divisiones.items():
+        print(f"  División: clase {padre} -> {destinos}")
+    for hijo, origenes in fusiones.items():
+        print(f"  Fusión: {origenes} -> clase {hijo}")
+
+    return nuevo_id, {
+        'k_padre': k_padre,
+        'k_hijo': k_hijo,
+        'hijos_por_padre': hijos,
+        'divisiones': divisiones,
+        'fusiones': fusiones,
+        'contingencia': tabla_renumerada.tolist(),
+    }
+
+
+def huella_etiquetas(etiquetas):
+    return huella_matriz(np.asarray(etiquetas, dtype=np.int64))
+
+
+def renumerar_ajuste(ajuste, nuevo_id):
+    """Copia del ajuste con la clase c renombrada a nuevo_id[c] (etiquetas y centroides)."""
+    nuevo_id = np.asarray(nuevo_id, dtype=np.int64)
+    centroides = np.empty_like(ajuste['centroides'])
+    centroides[nuevo_id] = ajuste['centroides']
+    return {**ajuste, 'etiquetas': nuevo_id[ajuste['etiquetas']], 'centroides': centroides,
+            'permutacion': nuevo_id}
+
+
+def _entrada_permutacion(etiquetas_originales, nuevo_id):
+    return {'huella': huella_etiquetas(etiquetas_originales), 'nuevo_id': [int(i) for i in nuevo_id]}
+
+
+def guardar_arbol(arbol, ruta_kmeans=RUTA_KMEANS):
+    ruta_arbol = os.path.join(ruta_kmeans, NOMBRE_ARBOL)
+    with open(ruta_arbol, 'w', encoding='utf-8') as f:
+        json.dump(arbol, f, indent=2, ensure_ascii=False)
+    print(f"\nÁrbol de divisiones/fusiones guardado en: {ruta_arbol}")
+
+
+def linaje_de_ajustes(ajustes, umbral=UMBRAL_RAMA):
+    """
+    Renumera en memoria una lista de ajustes ('k', 'etiquetas', 'centroides')
+    con las mismas celdas. Devuelve (ajustes renumerados en orden de k, árbol).
+    Cada ajuste renumerado lleva su 'permutacion' respecto al original.
+    """
+    ajustes = sorted(ajustes, key=lambda a: a['k'])
+    lista_k = [a['k'] for a in ajustes]
+    arbol = {'k': lista_k, 'umbral_rama': umbral, 'transiciones': [], 'permutaciones': {}}
+
+    renumerados = [renumerar_ajuste(ajustes[0], np.arange(lista_k[0]))]
+    arbol['permutaciones'][str(lista_k[0])] = _entrada_permutacion(ajustes[0]['etiquetas'], np.arange(lista_k[0]))
+    for ajuste in ajustes[1:]:
+        padre = renumerados[-1]
+        nuevo_id, entrada = transicion(np.asarray(padre['etiquetas'], dtype=np.int64),
+                                       np.asarray(ajuste['etiquetas'], dtype=np.int64),
+                                       padre['k'], ajuste['k'], umbral)
+        renumerados.append(renumerar_ajuste(ajuste, nuevo_id))
+        arbol['transiciones'].append(entrada)
+        arbol['permutaciones'][str(ajuste['k'])] = _entrada_permutacion(ajuste['etiquetas'], nuevo_id)
+    return renumerados, arbol
+
+
+def permutacion_guardada(k, etiquetas, ruta_kmeans=RUTA_KMEANS):
+    """
+    Permutación del último linaje para k si 'etiquetas' (las del ajuste
+    original, p. ej. leído de la caché) son las mismas que se renumeraron;
+    None si no hay linaje o el ajuste es otro.
+    """
+    try:
+        with open(os.path.join(ruta_kmeans, NOMBRE_ARBOL), encoding='utf-8') as f:
+            entrada = json.load(f).get('permutaciones', {}).get(str(k))
+    except (OSError, ValueError):
+        return None
+    if not entrada or entrada['huella'] != huella_etiquetas(etiquetas):
+        return None
+    return np.asarray(entrada['nuevo_id'], dtype=np.int64)
+
+
+def renumerar_estabilidad(ruta_kmeans, k, nuevo_id):
+    """
+    Deja la clase de consenso de 'estabilidad_k[N].nc' con la permutación
+    'nuevo_id' (respecto a las etiquetas originales), deshaciendo la que tuviera.
+    """
+    ruta_estabilidad = os.path.join(ruta_kmeans, f'estabilidad_k{k}.nc')
+    if not os.path.exists(ruta_estabilidad):
+        return
+    estabilidad_ds = leer_mapa_clases(ruta_estabilidad, variable='consenso')
+    anterior = np.asarray(estabilidad_ds.attrs.get(ATRIBUTO_PERMUTACION, np.arange(k)), dtype=np.int64).ravel()
+    nuevo_id = np.asarray(nuevo_id, dtype=np.int64)
+    if np.array_equal(anterior, nuevo_id):
+        return
+    # De los IDs actuales a los originales (inversa de 'anterior') y de ahí a los nuevos
+    cambio = np.empty(k, dtype=np.int64)
+    cambio[anterior] = nuevo_id
+    consenso = estabilidad_ds['consenso'].values.copy()
+    validas = consenso != VALOR_RELLENO
+    consenso[validas] = cambio[consenso[validas]]
+    estabilidad_ds['consenso'].values = consenso
+    estabilidad_ds.attrs[ATRIBUTO_PERMUTACION] = nuevo_id.astype(np.int32)
+    guardar_mapa_clases(estabilidad_ds, ruta_estabilidad)
+
+
+def aplicar_permutacion(ruta_kmeans, k, ds, validas, etiquetas, nuevo_id, k_padre, permutacion_total):
+    """Reescribe el mapa, los centroides y la estabilidad de k con los IDs nuevos."""
+    valores = ds['climate_class'].values.copy()
+    valores[validas] = nuevo_id[etiquetas]
+    ds['climate_class'].values = valores
+    if 'centroides' in ds:
+        centroides_mapa = ds['centroides'].values.copy()
+        centroides_mapa[nuevo_id] = ds['centroides'].values
+        ds['centroides'].values = centroides_mapa
+    ds.attrs['linaje_padre_k'] = k_padre
+    ds.attrs[ATRIBUTO_PERMUTACION] = permutacion_total.astype(np.int32)
+    guardar_mapa_clases(ds, os.path.join(ruta_kmeans, f'mapa_clasificacion_k{k}.nc'))
+
+    # El centroide de la clase antigua c pasa a la posición nuevo_id[c]
+    ruta_centroides = os.path.join(ruta_kmeans, f'centroides_k{k}.npz')
+    if os.path.exists(ruta_centroides):
+        datos = cargar_centroides(ruta_centroides)
+        centroides = np.empty_like(datos['centroides'])
+        centroides[nuevo_id] = datos['centroides']
+        guardar_centroides(ruta_centroides, k, centroides, datos['inercia'],
+                           datos['semilla'], datos['algoritmo'])
+
+    renumerar_estabilidad(ruta_kmeans, k, permutacion_total)
+
+
+def calcular_linaje(ruta_kmeans=RUTA_KMEANS, umbral=UMBRAL_RAMA):
+    """Linaje sobre los mapas ya guardados (reescribe los archivos de cada k)."""
+    print("==========================================================")
+    print("Calculando el linaje de clústeres entre mapas")
+    print("==========================================================")
+    mapas = encontrar_mapas(ruta_kmeans)
+    if len(mapas) < 2:
+        print(f"¡ERROR! Se necesitan al menos dos mapas 'mapa_clasificacion_k*.nc' en {ruta_kmeans}")
+        return None
+
+    lista_k = list(mapas)
+    print(f"Mapas encontrados para k = {lista_k}")
+
+    def permutacion_actual(ds, k):
+        return np.asarray(ds.attrs.get(ATRIBUTO_PERMUTACION, np.arange(k)), dtype=np.int64).ravel()
+
+    def originales(etiquetas, permutacion):
+        inversa = np.empty_like(permutacion)
+        inversa[permutacion] = np.arange(len(permutacion))
+        return inversa[etiquetas]
+
+    arbol = {'k': lista_k, 'umbral_rama': umbral, 'transiciones': [], 'permutaciones': {}}
+    ds_padre, etiquetas_padre, validas_padre = leer_etiquetas(mapas[lista_k[0]])
+    permutacion_padre = permutacion_actual(ds_padre, lista_k[0])
+    arbol['permutaciones'][str(lista_k[0])] = _entrada_permutacion(
+        originales(etiquetas_padre, permutacion_padre), permutacion_padre)
+
+    for k_padre, k_hijo in zip(lista_k[:-1], lista_k[1:]):
+        ds_hijo, etiquetas_hijo, validas_hijo = leer_etiquetas(mapas[k_hijo])
+        if not np.array_equal(validas_padre, validas_hijo):
+            print(f"¡ERROR! Los mapas k={k_padre} y k={k_hijo} no tienen las mismas celdas válidas.")
+            return None
+
+        nuevo_id, entrada = transicion(etiquetas_padre, etiquetas_hijo, k_padre, k_hijo, umbral)
+        # Permutación respecto a las etiquetas del ajuste original
+        permutacion_previa = permutacion_actual(ds_hijo, k_hijo)
+        permutacion_total = nuevo_id[permutacion_previa]
+        if not np.array_equal(nuevo_id, np.arange(k_hijo)):
+            aplicar_permutacion(ruta_kmeans, k_hijo, ds_hijo, validas_hijo, etiquetas_hijo, nuevo_id, k_padre,
+                                permutacion_total)
+
+        arbol['transiciones'].append(entrada)
+        arbol['permutaciones'][str(k_hijo)] = _entrada_permutacion(
+            originales(etiquetas_hijo, permutacion_previa), permutacion_total)
+        etiquetas_padre = nuevo_id[etiquetas_hijo]
+
+    guardar_arbol(arbol, ruta_kmeans)
+    return arbol
+
+
+if __name__ == "__main__":
+    calcular_linaje()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+LECTURA Y ESCRITURA DE MAPAS DE CLASES COMO ENTEROS COMPACTOS
+
+Instrucciones:
+1. Las clases se guardan como int8 (int16 si k > 127) con el '_FillValue' CF
+   VALOR_RELLENO (-1) en las celdas sin datos (océano), en lugar de float64
+   con NaN: el mapa ocupa 8 veces menos y no hace falta convertir a int.
+2. Cada variable de clases lleva los metadatos CF 'flag_values' y
+   'flag_meanings', y el dataset puede incluir los centroides de cada clase.
+3. 'leer_mapa_clases' devuelve siempre enteros con -1 como relleno (también
+   para los mapas antiguos en float64 con NaN).
+"""
+
+import numpy as np
+import xarray as xr
+
+VALOR_RELLENO = -1
+VARIABLE_CLASES = 'climate_class'
+
+
+def tipo_entero(k):
+    """Tipo entero más pequeño capaz de guardar las clases 0..k-1 y el relleno."""
+    return np.int8 if k <= np.iinfo(np.int8).max else np.int16
+
+
+def crear_dataset_clases(clases, k, nombre=VARIABLE_CLASES, centroides=None,
+                         descripcion=None, nombres_clases=None):
+    """
+    Convierte un DataArray (lat x lon) de clases enteras con -1 en las
+    celdas sin datos en un Dataset con metadatos CF de banderas.
+    """
+    tipo = tipo_entero(k)
+    clases_da = clases.fillna(VALOR_RELLENO).astype(tipo) if clases.dtype.kind == 'f' else clases.astype(tipo)
+    if nombres_clases is None:
+        nombres_clases = [f"clase_{i}" for i in range(k)]
+    clases_da.attrs = {
+        'long_name': 'Clase climática',
+        'flag_values': np.arange(k, dtype=tipo),
+        'flag_meanings': ' '.join(nombres_clases),
+        'valid_range': np.array([0, k - 1], dtype=tipo),
+    }
+
+    ds = clases_da.to_dataset(name=nombre)
+    if centroides is not None:
+        centroides = np.asarray(centroides, dtype=np.float64)
+        ds['centroides'] = xr.DataArray(
+            centroides, dims=('clase', 'componente'),
+            coords={'clase': np.arange(k), 'componente': np.arange(1, centroides.shape[1] + 1)},
+            attrs={'long_name': 'Centroide de cada clase en el espacio de las CPs'},
+        )
+    ds.attrs['k'] = k
+    if descripcion:
+        ds.attrs['description'] = descripcion
+    return ds
+
+
+def variables_de_clases(ds):
+    """Variables del dataset que son mapas de clases (tienen 'flag_values')."""
+    return [nombre for nombre, variable in ds.data_vars.items() if 'flag_values' in variable.attrs]
+
+
+def guardar_mapa_clases(ds, ruta):
+    """Guarda el dataset codificando las variables de clases como enteros con _FillValue."""
+    codificacion = {}
+    for nombre in variables_de_clases(ds):
+        ds[nombre].attrs.pop('_FillValue', None)
+        ds[nombre].encoding.pop('_FillValue', None)
+        codificacion[nombre] = {'dtype': ds[nombre].dtype, '_FillValue': VALOR_RELLENO}
+    ds.to_netcdf(ruta, encoding=codificacion)
+
+
+def leer_mapa_clases(ruta, variable=VARIABLE_CLASES):
+    """
+    Carga en memoria un mapa de clases y devuelve el Dataset con 'variable'
+    como enteros (-1 = sin datos), sin desenmascarar a float.
+    """
+    with xr.open_dataset(ruta, mask_and_scale=False) as ds:
+        ds = ds.load()
+
+    clases = ds[variable]
+    if clases.dtype.kind == 'f':
+        # Formato antiguo: float64 con NaN
+        valores = clases.values
+        k = int(np.nanmax(valores)) + 1 if np.isfinite(valores).any() else 0
+        enteros = np.where(np.isnan(valores), VALOR_RELLENO, valores).astype(tipo_entero(k))
+        ds[variable] = clases.copy(data=enteros)
+        ds[variable].attrs['flag_values'] = np.arange(k, dtype=enteros.dtype)
+    return ds
+
+
+def k_del_mapa(ds, variable=VARIABLE_CLASES):
+    """Número de clases declarado en los metadatos del mapa."""
+    return len(np.atleast_1d(ds[variable].attrs['flag_values']))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+MATRIZ DE CARACTERÍSTICAS CLIMÁTICAS (12 MESES x VARIABLES) POR CELDA
+
+Instrucciones:
+1. 'cargar_climatologias' lee las climatologías del ensemble de
+   '../data_ensemble' (una por variable) y las combina en un Dataset.
+2. 'construir_matriz_features' apila lat x lon en 'punto' (el mismo orden
+   que 'cargar_matriz_pca') y devuelve la matriz puntos x (variable, mes)
+   con las celdas válidas, en las unidades originales.
+3. Lo usan 'aplicar_pca.py' (que la estandariza y le aplica el PCA) y
+   'perfil_clusters.py' (perfil climático de cada clúster).
+"""
+
+import os
+import numpy as np
+import xarray as xr
+
+VARIABLES_CLIMATICAS = ["pr", "tasmax", "tasmin"]
+RUTA_ENSEMBLE = "../data_ensemble"
+
+
+def cargar_climatologias(ruta_ensemble=RUTA_ENSEMBLE, variables=VARIABLES_CLIMATICAS):
+    """Dataset (month x lat x lon) con una variable por climatología, ordenado por lon."""
+    # Cargamos cada dataset, seleccionamos ÚNICAMENTE la variable de datos
+    # principal y descartamos el resto (como las 'bnds').
+    datasets = []
+    for var in variables:
+        ruta_archivo = os.path.join(ruta_ensemble, f"{var}_ensemble_climatologia.nc")
+        with xr.open_dataset(ruta_archivo) as ds:
+            datasets.append(ds[[var]].load())
+
+    # Fusionamos los datasets ya limpios.
+    datos_combinados = xr.merge(datasets, compat='override')
+    return datos_combinados.sortby('lon')
+
+
+def construir_matriz_features(datos_combinados):
+    """
+    Devuelve (datos_apilados, matriz_limpia, indices_validos):
+    - datos_apilados: DataArray (punto x variable x month).
+    - matriz_limpia: puntos válidos x (n_variables * 12), columnas ordenadas
+      por variable y, dentro de cada una, por mes.
+    - indices_validos: máscara de los puntos sin ningún NaN.
+    """
+    datos_apilados = datos_combinados.to_array(dim='variable').stack(punto=('lat', 'lon'))
+    datos_apilados = datos_apilados.transpose('punto', 'variable', 'month')
+
+    n_puntos, n_vars, n_meses = datos_apilados.shape
+    matriz_features = datos_apilados.values.reshape(n_puntos, n_vars * n_meses)
+
+    indices_validos = ~np.isnan(matriz_features).any(axis=1)
+    return datos_apilados, matriz_features[indices_validos], indices_validos
+
+
+def nombres_features(datos_apilados):
+    """Lista de (variable, mes) de cada columna de la matriz de características."""
+    return [(str(var), int(mes)) for var in datos_apilados['variable'].values
+            for mes in datos_apilados['month'].values]
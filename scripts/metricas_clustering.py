@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+MÉTRICAS PARA ELEGIR EL NÚMERO DE CLÚSTERES (k)
+
+Instrucciones:
+1. Todas las funciones reciben la matriz de CPs y el resultado de un ajuste
+   ya hecho (etiquetas y centroides), así que no vuelven a entrenar nada,
+   salvo el estadístico gap, que necesita ajustar datos de referencia.
+2. La silueta se calcula sobre una muestra de puntos y por bloques:
+   nunca se construye la matriz de distancias completa N x N.
+"""
+
+import numpy as np
+
+from utilidades_kmeans import SEMILLA, barrido_k
+from motor_clustering import MOTOR_POR_DEFECTO
+
+N_MUESTRA_SILUETA = 2000
+TAM_BLOQUE_SILUETA = 512
+N_REFERENCIAS_GAP = 5
+
+
+def silueta_muestreada(matriz, etiquetas, n_muestra=N_MUESTRA_SILUETA,
+                       tam_bloque=TAM_BLOQUE_SILUETA, semilla=SEMILLA):
+    """
+    Coeficiente de silueta medio estimado sobre 'n_muestra' puntos.
+    Cada bloque de la muestra calcula sus distancias a todos los puntos
+    (tam_bloque x N) y las agrega por clúster con un producto matricial.
+    """
+    n_puntos = matriz.shape[0]
+    k = int(etiquetas.max()) + 1
+    rng = np.random.default_rng(semilla)
+    muestra = rng.choice(n_puntos, size=min(n_muestra, n_puntos), replace=False)
+
+    tamanos = np.bincount(etiquetas, minlength=k).astype(np.float64)
+    pertenencia = np.zeros((n_puntos, k))
+    pertenencia[np.arange(n_puntos), etiquetas] = 1.0
+    norma = np.einsum('ij,ij->i', matriz, matriz)
+
+    siluetas = np.empty(len(muestra))
+    for inicio in range(0, len(muestra), tam_bloque):
+        indices = muestra[inicio:inicio + tam_bloque]
+        bloque = matriz[indices]
+        distancias2 = norma[indices, None] - 2.0 * (bloque @ matriz.T) + norma[None, :]
+        distancias = np.sqrt(np.maximum(distancias2, 0.0))
+        sumas = distancias @ pertenencia # (bloque x k)
+
+        propias = etiquetas[indices]
+        filas = np.arange(len(indices))
+        n_propio = tamanos[propias] - 1.0
+        a = np.where(n_propio > 0, sumas[filas, propias] / np.maximum(n_propio, 1.0), 0.0)
+
+        medias = sumas / np.maximum(tamanos, 1.0)
+        medias[filas, propias] = np.inf
+        medias[:, tamanos == 0] = np.inf
+        b = medias.min(axis=1)
+
+        s = (b - a) / np.maximum(np.maximum(a, b), 1e-12)
+        # Por convención, la silueta de un clúster unitario es 0
+        siluetas[inicio:inicio + tam_bloque] = np.where(n_propio > 0, s, 0.0)
+
+    return float(siluetas.mean())
+
+
+def calinski_harabasz(matriz, etiquetas, centroides):
+    """Cociente entre dispersión inter-clúster e intra-clúster."""
+    n_puntos, k = matriz.shape[0], centroides.shape[0]
+    tamanos = np.bincount(etiquetas, minlength=k)
+    media_global = matriz.mean(axis=0)
+    dispersion_entre = float((tamanos * ((centroides - media_global) ** 2).sum(axis=1)).sum())
+    diferencias = matriz - centroides[etiquetas]
+    dispersion_dentro = float(np.einsum('ij,ij->', diferencias, diferencias))
+    if dispersion_dentro == 0.0 or k < 2:
+        return 1.0
+    return dispersion_entre * (n_puntos - k) / (dispersion_dentro * (k - 1))
+
+
+def davies_bouldin(matriz, etiquetas, centroides):
+    """Media, para cada clúster, de su peor cociente de similitud con otro clúster."""
+    k = centroides.shape[0]
+    distancia_al_centroide = np.linalg.norm(matriz - centroides[etiquetas], axis=1)
+    tamanos = np.bincount(etiquetas, minlength=k)
+    dispersion = np.bincount(etiquetas, weights=distancia_al_centroide, minlength=k) / np.maximum(tamanos, 1)
+
+    separacion = np.linalg.norm(centroides[:, None, :] - centroides[None, :, :], axis=2)
+    np.fill_diagonal(separacion, np.inf)
+    cocientes = (dispersion[:, None] + dispersion[None, :]) / separacion
+    return float(cocientes.max(axis=1).mean())
+
+
+def estadistico_gap(matriz, inercias, k_range, n_referencias=N_REFERENCIAS_GAP,
+                    n_procesos=1, semilla=SEMILLA, modo='exacto', motor=MOTOR_POR_DEFECTO,
+                    fraccion_submuestra=0.1, latitudes=None, en_caliente=False):
+    """
+    Estadístico gap de Tibshirani. Las referencias se muestrean de forma
+    uniforme en la caja que contiene los datos (las CPs ya están alineadas
+    con los ejes principales). Devuelve (gap, desviacion) por cada k.
+    Las referencias se ajustan con el mismo modo, motor, submuestra y
+    arranque (en frío o en caliente) que el barrido de los datos (cada fila
+    de referencia conserva la latitud de la fila de datos), para que las
+    inercias sean comparables.
+    """
+    rng = np.random.default_rng(semilla)
+    minimo, maximo = matriz.min(axis=0), matriz.max(axis=0)
+
+    log_inercias_ref = []
+    for i in range(n_referencias):
+        print(f"  Referencia gap {i + 1}/{n_referencias}")
+        referencia = rng.uniform(minimo, maximo, size=matriz.shape)
+        # Las referencias son aleatorias: no tiene sentido guardarlas en caché
+        resultados = barrido_k(referencia, k_range, n_procesos=n_procesos, mostrar=False,
+                               usar_cache=False, en_caliente=en_caliente, modo=modo, motor=motor,
+                               fraccion_submuestra=fraccion_submuestra, latitudes=latitudes)
+        log_inercias_ref.append(np.log([r['inercia'] for r in resultados]))
+
+    log_inercias_ref = np.array(log_inercias_ref)
+    gap = log_inercias_ref.mean(axis=0) - np.log(np.asarray(inercias))
+    desviacion = log_inercias_ref.std(axis=0) * np.sqrt(1.0 + 1.0 / n_referencias)
+    return gap, desviacion
+
+
+def k_optimo_gap(lista_k, gap, desviacion):
+    """Menor k tal que gap(k) >= gap(k+1) - s(k+1)."""
+    for i in range(len(lista_k) - 1):
+        if gap[i] >= gap[i + 1] - desviacion[i + 1]:
+            return lista_k[i]
+    return lista_k[-1]
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+ARTEFACTOS PORTABLES DEL MODELO (PCA + K-MEANS) EN FORMATO .npz
+
+Instrucciones:
+1. 'aplicar_pca.py' guarda el scaler, el PCA y los índices de las celdas
+   válidas en '../data_pca/modelo_pca.npz'.
+2. Los scripts de K-means guardan los centroides de cada k en
+   '../data_kmeans/centroides_k[N].npz'.
+3. Cargar estos archivos solo necesita NumPy (sin sklearn ni pickle), por lo
+   que se pueden asignar datos nuevos a las clases sin volver a entrenar.
+"""
+
+import numpy as np
+
+# Versión del formato de los archivos .npz. Se incrementa si cambian las claves.
+VERSION_FORMATO = 1
+
+# Tamaño de bloque para calcular distancias sin crear matrices gigantes
+TAM_BLOQUE = 65536
+
+
+def _comprobar_version(datos, ruta):
+    version = int(datos['version_formato'])
+    if version != VERSION_FORMATO:
+        raise ValueError(
+            f"El archivo {ruta} tiene formato v{version}, "
+            f"pero se esperaba v{VERSION_FORMATO}."
+        )
+
+
+def guardar_modelo_pca(ruta, scaler_media, scaler_escala, pca_media, pca_componentes,
+                       varianza_explicada, ratio_varianza_explicada, indices_validos,
+                       forma_grid, lat, lon, variables):
+    """
+    Guarda el scaler y el PCA entrenados como arrays planos.
+    'indices_validos' es la máscara booleana de puntos (lat*lon) con datos;
+    se guarda como índices planos (mucho más pequeño que la máscara completa).
+    """
+    indices_validos = np.asarray(indices_validos)
+    if indices_validos.dtype == bool:
+        indices_validos = np.flatnonzero(indices_validos)
+
+    np.savez(
+        ruta,
+        version_formato=np.int32(VERSION_FORMATO),
+        scaler_media=np.asarray(scaler_media, dtype=np.float64),
+        scaler_escala=np.asarray(scaler_escala, dtype=np.float64),
+        pca_media=np.asarray(pca_media, dtype=np.float64),
+        pca_componentes=np.asarray(pca_componentes, dtype=np.float64),
+        varianza_explicada=np.asarray(varianza_explicada, dtype=np.float64),
+        ratio_varianza_explicada=np.asarray(ratio_varianza_explicada, dtype=np.float64),
+        indices_validos=indices_validos.astype(np.int32),
+        forma_grid=np.asarray(forma_grid, dtype=np.int32),
+        lat=np.asarray(lat, dtype=np.float64),
+        lon=np.asarray(lon, dtype=np.float64),
+        variables=np.asarray(variables, dtype=str),
+    )
+
+
+def cargar_modelo_pca(ruta):
+    """
+    Carga el modelo PCA guardado con 'guardar_modelo_pca' y lo devuelve
+    como un diccionario de arrays de NumPy.
+    """
+    with np.load(ruta, allow_pickle=False) as datos:
+        _comprobar_version(datos, ruta)
+        modelo = {clave: datos[clave] for clave in datos.files}
+
+    # Reconstruimos la máscara booleana para quien la necesite
+    mascara = np.zeros(int(np.prod(modelo['forma_grid'])), dtype=bool)
+    mascara[modelo['indices_validos']] = True
+    modelo['mascara_valida'] = mascara
+    return modelo
+
+
+def transformar_a_componentes(modelo, matriz_features):
+    """
+    Aplica el escalado y la proyección PCA a una matriz (puntos x características),
+    equivalente a 'pca.transform(scaler.transform(X))' pero solo con NumPy.
+    """
+    matriz = np.asarray(matriz_features, dtype=np.float64)
+    matriz_estandarizada = (matriz - modelo['scaler_media']) / modelo['scaler_escala']
+    return (matriz_estandarizada - modelo['pca_media']) @ modelo['pca_componentes'].T
+
+
+def componentes_a_features(modelo, matriz_pcs):
+    """
+    Inversa aproximada de 'transformar_a_componentes': devuelve puntos del
+    espacio de las CPs a las unidades originales (solo se recupera la
+    varianza que explican las CPs guardadas).
+    """
+    matriz = np.asarray(matriz_pcs, dtype=np.float64)
+    matriz_estandarizada = matriz @ modelo['pca_componentes'] + modelo['pca_media']
+    return matriz_estandarizada * modelo['scaler_escala'] + modelo['scaler_media']
+
+
+def guardar_centroides(ruta, k, centroides, inercia=np.nan, semilla=-1, algoritmo=""):
+    """
+    Guarda los centroides (en el espacio de las CPs) de un K-means con 'k' clústeres.
+    """
+    centroides = np.asarray(centroides, dtype=np.float64)
+    if centroides.shape[0] != k:
+        raise ValueError(f"Se esperaban {k} centroides, pero hay {centroides.shape[0]}.")
+
+    np.savez(
+        ruta,
+        version_formato=np.int32(VERSION_FORMATO),
+        k=np.int32(k),
+        centroides=centroides,
+        inercia=np.float64(inercia),
+        semilla=np.int64(semilla),
+        algoritmo=np.asarray(algoritmo, dtype=str),
+    )
+
+
+def cargar_centroides(ruta):
+    """
+    Carga un archivo 'centroides_k[N].npz' y devuelve un diccionario.
+    """
+    with np.load(ruta, allow_pickle=False) as datos:
+        _comprobar_version(datos, ruta)
+        return {
+            'k': int(datos['k']),
+            'centroides': datos['centroides'],
+            'inercia': float(datos['inercia']),
+            'semilla': int(datos['semilla']),
+            'algoritmo': str(datos['algoritmo']),
+        }
+
+
+def asignar_clases(matriz_pcs, centroides, tam_bloque=TAM_BLOQUE):
+    """
+    Asigna cada fila de 'matriz_pcs' al centroide más cercano (distancia euclídea).
+    Trabaja por bloques para no crear una matriz de distancias completa.
+    """
+    matriz_pcs = np.asarray(matriz_pcs, dtype=np.float64)
+    centroides = np.asarray(centroides, dtype=np.float64)
+    norma_centroides = np.einsum('ij,ij->i', centroides, centroides)
+
+    etiquetas = np.empty(matriz_pcs.shape[0], dtype=np.int64)
+    for inicio in range(0, matriz_pcs.shape[0], tam_bloque):
+        bloque = matriz_pcs[inicio:inicio + tam_bloque]
+        # ||x - c||^2 = ||x||^2 - 2 x·c + ||c||^2 ; ||x||^2 no cambia el argmin
+        distancias = norma_centroides - 2.0 * (bloque @ centroides.T)
+        etiquetas[inicio:inicio + tam_bloque] = np.argmin(distancias, axis=1)
+    return etiquetas
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+MOTORES DE CLUSTERING INTERCAMBIABLES
+
+Instrucciones:
+1. Todos los motores comparten el mismo contrato:
+   - motor.ajustar(matriz) entrena y rellena 'centroides', 'etiquetas' e 'inercia'.
+   - motor.predecir(matriz) asigna una clase a cada fila de una matriz nueva.
+   Las etiquetas son siempre las del centroide más cercano, las mismas que da
+   'modelo_portable.asignar_clases' con los centroides guardados.
+2. 'crear_motor(nombre, k)' devuelve el motor a partir de su nombre
+   (ver MOTORES). Así el codo, el mapa automático y 'clasificar_multi_k.py'
+   pueden cambiar de algoritmo sin tocar el código.
+3. 'benchmark_motores.py' compara tiempo, memoria e inercia de cada motor.
+"""
+
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans, BisectingKMeans
+from sklearn.mixture import GaussianMixture
+
+from modelo_portable import asignar_clases
+
+SEMILLA = 42
+MOTOR_POR_DEFECTO = 'lloyd'
+TAM_LOTE_MINIBATCH = 4096
+
+
+class MotorClustering:
+    """
+    Clase base. Las subclases implementan '_crear_estimador' (y, si no
+    asignan por centroide más cercano, 'predecir').
+    """
+    nombre = ''
+    # Si el motor acepta centroides iniciales (arranque en caliente)
+    admite_init = True
+    # Se sube si cambian los resultados del motor (invalida sus ajustes en caché)
+    version = 1
+
+    def __init__(self, k, semilla=SEMILLA, init=None):
+        self.k = k
+        self.semilla = semilla
+        self.init = init if self.admite_init else None
+        self.centroides = None
+        self.etiquetas = None
+        self.inercia = None
+
+    def _crear_estimador(self):
+        raise NotImplementedError
+
+    def ajustar(self, matriz):
+        estimador = self._crear_estimador().fit(matriz)
+        self.estimador = estimador
+        self.centroides = estimador.cluster_centers_
+        self.etiquetas = estimador.labels_.astype(np.int64)
+        self.inercia = float(estimador.inertia_)
+        return self
+
+    def predecir(self, matriz):
+        return asignar_clases(matriz, self.centroides)
+
+    def _reasignar_al_centroide(self, matriz):
+        """Etiquetas e inercia respecto al centroide más cercano."""
+        self.etiquetas = asignar_clases(matriz, self.centroides)
+        diferencias = matriz - self.centroides[self.etiquetas]
+        self.inercia = float(np.einsum('ij,ij->', diferencias, diferencias))
+
+
+class KMeansLloyd(MotorClustering):
+    nombre = 'lloyd'
+    algoritmo_sklearn = 'lloyd'
+
+    def _crear_estimador(self):
+        if self.init is None:
+            return KMeans(n_clusters=self.k, random_state=self.semilla, n_init='auto',
+                          algorithm=self.algoritmo_sklearn)
+        return KMeans(n_clusters=self.k, init=self.init, n_init=1, random_state=self.semilla,
+                      algorithm=self.algoritmo_sklearn)
+
+
+class KMeansElkan(KMeansLloyd):
+    nombre = 'elkan'
+    algoritmo_sklearn = 'elkan'
+
+
+class KMeansMiniBatch(MotorClustering):
+    nombre = 'minibatch'
+
+    def _crear_estimador(self):
+        if self.init is None:
+            return MiniBatchKMeans(n_clusters=self.k, random_state=self.semilla, n_init='auto',
+                                   batch_size=TAM_LOTE_MINIBATCH)
+        return MiniBatchKMeans(n_clusters=self.k, init=self.init, n_init=1, random_state=self.semilla,
+                               batch_size=TAM_LOTE_MINIBATCH)
+
+
+class KMeansBisectante(MotorClustering):
+    """
+    K-means bisectante. sklearn etiqueta según el árbol de divisiones, que no
+    siempre coincide con el centroide más cercano; se reasigna al final.
+    """
+    nombre = 'bisectante'
+    admite_init = False
+    version = 2
+
+    def _crear_estimador(self):
+        return BisectingKMeans(n_clusters=self.k, random_state=self.semilla)
+
+    def ajustar(self, matriz):
+        super().ajustar(matriz)
+        self._reasignar_al_centroide(matriz)
+        return self
+
+
+class MezclaGaussianaDiagonal(MotorClustering):
+    """
+    Mezcla de gaussianas con covarianza diagonal. Los 'centroides' son las
+    medias de cada componente; cada punto va a la media más cercana (no a la
+    de mayor probabilidad a posteriori) para que el mapa se pueda reproducir
+    solo con los centroides guardados, y la 'inercia' es comparable con la
+    de los K-means.
+    """
+    nombre = 'gmm_diagonal'
+    version = 2
+
+    def _crear_estimador(self):
+        return GaussianMixture(n_components=self.k, covariance_type='diag',
+                               random_state=self.semilla, means_init=self.init)
+
+    def ajustar(self, matriz):
+        self.estimador = self._crear_estimador().fit(matriz)
+        self.centroides = self.estimador.means_
+        self._reasignar_al_centroide(matriz)
+        return self
+
+
+MOTORES = {
+    clase.nombre: clase
+    for clase in (KMeansLloyd, KMeansElkan, KMeansMiniBatch, KMeansBisectante, MezclaGaussianaDiagonal)
+}
+
+
+def crear_motor(nombre, k, semilla=SEMILLA, init=None):
+    """Instancia el motor 'nombre' (una de las claves de MOTORES)."""
+    if nombre not in MOTORES:
+        raise ValueError(f"Motor '{nombre}' no válido. Opciones: {list(MOTORES)}")
+    return MOTORES[nombre](k, semilla=semilla, init=init)
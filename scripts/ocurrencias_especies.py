@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+INGESTA MASIVA DE REGISTROS DE OCURRENCIA DE ESPECIES (CSV / PARQUET)
+
+Instrucciones:
+1. Lee archivos de ocurrencias (una fila por registro: especie, lat, lon y,
+   opcionalmente, un peso) por bloques, sin cargarlos enteros en memoria.
+   Acepta también los nombres de columna de GBIF (species,
+   decimalLatitude, decimalLongitude).
+2. Cada bloque se asigna a las clases del mapa con una única búsqueda
+   vectorizada ('busqueda_puntos.py') y se acumula en una tabla
+   especie x clase con un solo np.bincount.
+3. 'celdas_por_especie' devuelve, en lugar de clases, las celdas (y pesos)
+   con registros de cada especie (lo usa 'idoneidad_habitat.py').
+   'frecuencias_por_k' cruza esas celdas con varios mapas (un k cada uno)
+   a la vez, leyendo el archivo una sola vez.
+4. 'zonas_por_frecuencia' decide qué clases forman el hábitat de cada
+   especie: las que reúnen al menos UMBRAL_FRACCION de sus registros.
+5. Lo usa 'analizar_y_mapear_habitats_pandaversion.py --ocurrencias archivo'.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from mapas_clases import VALOR_RELLENO
+
+# --- CONFIGURACIÓN ---
+TAM_BLOQUE = 200_000 # Registros por bloque
+UMBRAL_FRACCION = 0.10 # Fracción mínima de registros para que una clase sea hábitat
+MINIMO_REGISTROS = 5 # Especies con menos registros en tierra se descartan
+
+# Nombres aceptados para cada columna (el primero es el propio del proyecto)
+ALIAS_COLUMNAS = {
+    'especie': ('especie', 'species', 'scientificName'),
+    'lat': ('lat', 'latitud', 'latitude', 'decimalLatitude'),
+    'lon': ('lon', 'longitud', 'longitude', 'decimalLongitude'),
+    'peso': ('peso', 'weight', 'individualCount'),
+}
+
+
+def _resolver_columnas(disponibles):
+    """Devuelve {nombre_interno: nombre_en_archivo} (el peso es opcional)."""
+    columnas = {}
+    for interno, alias in ALIAS_COLUMNAS.items():
+        encontrada = next((a for a in alias if a in disponibles), None)
+        if encontrada is None and interno != 'peso':
+            raise ValueError(f"Falta la columna '{interno}' (se aceptan: {', '.join(alias)})")
+        if encontrada is not None:
+            columnas[interno] = encontrada
+    return columnas
+
+
+def leer_ocurrencias_por_bloques(ruta, tam_bloque=TAM_BLOQUE):
+    """
+    Generador de DataFrames con las columnas 'especie', 'lat', 'lon' y 'peso'
+    (1.0 si el archivo no trae pesos). Admite .csv (y .csv.gz) y .parquet.
+    Los pesos vacíos (frecuente en 'individualCount' de GBIF) cuentan como 1.0
+    y los registros con peso negativo se descartan.
+    """
+    if ruta.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        archivo = pq.ParquetFile(ruta)
+        columnas = _resolver_columnas(archivo.schema_arrow.names)
+        bloques = (lote.to_pandas() for lote in
+                   archivo.iter_batches(batch_size=tam_bloque, columns=list(columnas.values())))
+    else:
+        cabecera = pd.read_csv(ruta, nrows=0).columns
+        columnas = _resolver_columnas(cabecera)
+        bloques = pd.read_csv(ruta, usecols=list(columnas.values()), chunksize=tam_bloque)
+
+    renombrar = {archivo_col: interno for interno, archivo_col in columnas.items()}
+    n_rellenados = n_negativos = 0
+    for bloque in bloques:
+        bloque = bloque.rename(columns=renombrar)
+        if 'peso' not in bloque:
+            bloque['peso'] = 1.0
+        bloque = bloque.dropna(subset=['especie', 'lat', 'lon'])
+        # Un solo peso NaN dejaría en NaN toda la fila de la especie en np.bincount
+        peso = pd.to_numeric(bloque['peso'], errors='coerce')
+        n_rellenados += int(peso.isna().sum())
+        bloque['peso'] = peso.fillna(1.0)
+        negativos = bloque['peso'] < 0
+        n_negativos += int(negativos.sum())
+        yield bloque.loc[~negativos, ['especie', 'lat', 'lon', 'peso']]
+
+    if n_rellenados:
+        print(f"¡AVISO! {n_rellenados} registros sin peso válido en {os.path.basename(ruta)}; se cuentan con peso 1.")
+    if n_negativos:
+        print(f"¡AVISO! {n_negativos} registros con peso negativo en {os.path.basename(ruta)}; se descartan.")
+
+
+def _codificar_especies(especies, codigos):
+    """
+    Código global de la especie de cada registro. 'codigos' (especie -> código)
+    se amplía con las especies nuevas del bloque.
+    """
+    codigos_bloque, especies_bloque = pd.factorize(especies)
+    for especie in especies_bloque:
+        codigos.setdefault(especie, len(codigos))
+    return np.array([codigos[e] for e in especies_bloque], dtype=np.int64)[codigos_bloque]
+
+
+def tabla_frecuencias(ruta, localizador, k, tierra_cercana=False, distancia_maxima_km=None,
+                      tam_bloque=TAM_BLOQUE):
+    """
+    Devuelve un DataFrame (especies x clases 0..k-1) con la suma de pesos de
+    los registros en cada clase, más la columna 'sin_datos' (registros en
+    océano o fuera del mapa).
+    """
+    codigos = {} # especie -> fila de la tabla
+    acumulado = np.zeros((0, k + 1), dtype=np.float64)
+    n_registros = 0
+
+    for bloque in leer_ocurrencias_por_bloques(ruta, tam_bloque):
+        clases = localizador.clases_en_puntos(bloque['lat'].to_numpy(), bloque['lon'].to_numpy(),
+                                              tierra_cercana, distancia_maxima_km)
+        # La columna k recoge los registros sin datos
+        clases = np.where(clases == VALOR_RELLENO, k, clases).astype(np.int64)
+
+        filas = _codificar_especies(bloque['especie'], codigos)
+
+        if len(codigos) > acumulado.shape[0]:
+            acumulado = np.vstack([acumulado, np.zeros((len(codigos) - acumulado.shape[0], k + 1))])
+        acumulado += np.bincount(filas * (k + 1) + clases, weights=bloque['peso'].to_numpy(dtype=np.float64),
+                                 minlength=acumulado.size).reshape(acumulado.shape)
+        n_registros += len(bloque)
+
+    print(f"  {n_registros} registros de {len(codigos)} especies leídos de {os.path.basename(ruta)}")
+    return pd.DataFrame(acumulado, index=pd.Index(list(codigos), name='especie'),
+                        columns=[*range(k), 'sin_datos'])
+
+
+def celdas_por_especie(ruta, localizador, tierra_cercana=False, distancia_maxima_km=None,
+                       tam_bloque=TAM_BLOQUE):
+    """
+    {especie: (indices_planos, pesos)} con las celdas donde hay registros de
+    cada especie y la suma de pesos en cada una; el índice -1 agrupa los
+    registros sin datos (océano o fuera del mapa). Se acumula por pares
+    (especie, celda), sin una matriz especies x celdas.
+    """
+    codigos = {}
+    parciales = []
+    for bloque in leer_ocurrencias_por_bloques(ruta, tam_bloque):
+        celdas = localizador.indices_planos(bloque['lat'].to_numpy(), bloque['lon'].to_numpy(),
+                                            tierra_cercana, distancia_maxima_km)
+        filas = _codificar_especies(bloque['especie'], codigos)
+        parciales.append(pd.DataFrame({'fila': filas, 'celda': celdas,
+                                       'peso': bloque['peso'].to_numpy(dtype=np.float64)})
+                         .groupby(['fila', 'celda'], sort=False)['peso'].sum())
+
+    if not parciales:
+        return {}
+    totales = pd.concat(parciales).groupby(level=['fila', 'celda']).sum()
+    especies = list(codigos)
+    return {especies[fila]: (grupo.index.get_level_values('celda').to_numpy(), grupo.to_numpy())
+            for fila, grupo in totales.groupby(level='fila')}
+
+
+def frecuencias_por_k(celdas_especie, cubo_plano, lista_k):
+    """
+    {k: tabla especie x clase} (como 'tabla_frecuencias') para varios mapas a
+    la vez, a partir de 'celdas_por_especie'. 'cubo_plano' es (n_k x celdas)
+    con las clases de cada mapa; el archivo de ocurrencias se lee una sola vez.
+    La columna 'sin_datos' recoge los registros en océano o sin clase en ese mapa.
+    """
+    especies = list(celdas_especie)
+    tablas = {k: np.zeros((len(especies), k + 1), dtype=np.float64) for k in lista_k}
+    for fila, especie in enumerate(especies):
+        celdas, pesos = celdas_especie[especie]
+        # Clases de las celdas de la especie en todos los mapas a la vez
+        clases = np.where(celdas < 0, VALOR_RELLENO, cubo_plano[:, np.maximum(celdas, 0)])
+        for i, k in enumerate(lista_k):
+            indices = np.where(clases[i] == VALOR_RELLENO, k, clases[i]).astype(np.int64)
+            tablas[k][fila] = np.bincount(indices, weights=pesos, minlength=k + 1)
+    return {k: pd.DataFrame(acumulado, index=pd.Index(especies, name='especie'),
+                            columns=[*range(k), 'sin_datos'])
+            for k, acumulado in tablas.items()}
+
+
+def zonas_por_frecuencia(tabla, umbral=UMBRAL_FRACCION, minimo_registros=MINIMO_REGISTROS):
+    """
+    {especie: [clases]} con las clases que reúnen al menos 'umbral' de los
+    registros en tierra de cada especie.
+    """
+    en_tierra = tabla.drop(columns='sin_datos')
+    totales = en_tierra.sum(axis=1)
+    fracciones = en_tierra.div(totales.where(totales > 0), axis=0)
+    zonas = {}
+    for especie, fila in fracciones[totales >= minimo_registros].iterrows():
+        zonas[especie] = [int(c) for c in fila.index[fila.to_numpy() >= umbral]]
+    return zonas
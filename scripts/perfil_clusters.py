@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+PERFIL CLIMÁTICO DE CADA CLÚSTER (MEDIAS MENSUALES EN UNIDADES ORIGINALES)
+
+Instrucciones:
+1. Se ejecuta después de 'generar_mapa_kmeans.py' / 'clasificar_multi_k.py'.
+2. Reutiliza la matriz de características de 'aplicar_pca.py' (12 meses x
+   pr/tasmax/tasmin por celda, ver 'matriz_features.py') y las etiquetas de
+   cada 'mapa_clasificacion_k*.nc'.
+3. Una sola reducción agrupada (matriz dispersa clúster x celda, ponderada
+   por el área de cada celda, por [1, X, X²]) da a la vez el área, la media
+   y la desviación de las 36 características de todos los clústeres.
+4. Los centroides del K-means ('centroides_k[N].npz') se devuelven a las
+   unidades originales con el modelo PCA ('modelo_pca.npz').
+5. Guarda '../data_kmeans/perfil_clusters_k[N].csv' (clase, variable, mes,
+   media, desviación y centroide) y el climograma
+   '../figures/perfil_clusters_k[N].png' (un panel por clúster: pr en barras,
+   tasmax/tasmin en líneas con su desviación), con --vista-previa y --forzar
+   como en el resto de figuras:
+       python perfil_clusters.py            (todos los mapas)
+       python perfil_clusters.py --k 7
+"""
+
+import matplotlib
+matplotlib.use('Agg') # Modo no interactivo
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from scipy import sparse
+
+from mapas_clases import VALOR_RELLENO, leer_mapa_clases
+from matriz_features import cargar_climatologias, construir_matriz_features, nombres_features
+from modelo_portable import cargar_modelo_pca, cargar_centroides, componentes_a_features
+from estadisticas_zonales import areas_celdas
+from utilidades_kmeans import interpretar_lista_k
+from analizar_y_mapear_habitats_pandaversion import encontrar_todos_los_nc
+from cache_figuras import huella_figura, figura_al_dia
+from renderizado_mapas import colores_clases, guardar_figura
+
+# --- CONFIGURACIÓN ---
+# Conversión para la figura (la tabla queda en unidades originales, las de CMIP):
+# variable -> (factor, desplazamiento, unidades)
+CONVERSION_FIGURA = {
+    'pr': (86400.0, 0.0, 'mm/día'), # kg m-2 s-1 -> mm/día
+    'tasmax': (1.0, -273.15, '°C'), # K -> °C
+    'tasmin': (1.0, -273.15, '°C'),
+}
+PANELES_POR_FILA = 4
+
+# --- RUTAS ---
+RUTA_PCA_IN = "../data_pca"
+RUTA_KMEANS = "../data_kmeans"
+RUTA_FIGURES = "../figures"
+
+
+def perfil_por_clase(matriz, clases, k, pesos):
+    """
+    Devuelve (area, medias, desviaciones) de cada clase 0..k-1 con una única
+    reducción agrupada: (clase x celda, con el peso de cada celda) @ [1, X, X²].
+    Las celdas con clase -1 no cuentan.
+    """
+    en_clase = clases != VALOR_RELLENO
+    filas = np.flatnonzero(en_clase)
+    agrupacion = sparse.csr_matrix((pesos[filas], (clases[filas].astype(np.int64), filas)),
+                                   shape=(k, len(clases)))
+    n = matriz.shape[1]
+    sumas = agrupacion @ np.hstack([np.ones((len(matriz), 1)), matriz, matriz ** 2])
+    area = sumas[:, 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        medias = sumas[:, 1:n + 1] / area[:, np.newaxis]
+        varianzas = sumas[:, n + 1:] / area[:, np.newaxis] - medias ** 2
+    return area, medias, np.sqrt(np.maximum(varianzas, 0.0))
+
+
+def tabla_perfil(medias, desviaciones, centroides, nombres):
+    """Tabla larga (clase, variable, mes) con la media, la desviación y el centroide."""
+    k = medias.shape[0]
+    variables = [var for var, _ in nombres]
+    meses = [mes for _, mes in nombres]
+    tabla = pd.DataFrame({
+        'clase': np.repeat(np.arange(k), len(nombres)),
+        'variable': np.tile(variables, k),
+        'mes': np.tile(meses, k),
+        'media': medias.ravel(),
+        'desviacion': desviaciones.ravel(),
+        'centroide': centroides.ravel() if centroides is not None else np.nan,
+    })
+    return tabla
+
+
+def dibujar_climograma(medias, desviaciones, area, nombres, k, ruta_salida, vista_previa=False, huella=None):
+    """Un panel pequeño por clúster: pr mensual en barras y tasmax/tasmin en líneas."""
+    variables = list(dict.fromkeys(var for var, _ in nombres))
+    n_meses = len(nombres) // len(variables)
+    meses = np.arange(1, n_meses + 1)
+    columnas = {var: slice(i * n_meses, (i + 1) * n_meses) for i, var in enumerate(variables)}
+
+    def convertir(var, valores, es_desviacion=False):
+        factor, desplazamiento, _ = CONVERSION_FIGURA.get(var, (1.0, 0.0, ''))
+        return valores * factor + (0.0 if es_desviacion else desplazamiento)
+
+    ncols = min(k, PANELES_POR_FILA)
+    nrows = (k + ncols - 1) // ncols
+    fig, axes = plt.subplots(nrows, ncols, figsize=(4 * ncols, 3 * nrows), sharex=True, squeeze=False)
+    axes = axes.flatten()
+    cmap, _ = colores_clases(k)
+    fraccion = area / area.sum()
+
+    # Mismos límites en todos los paneles para poder compararlos
+    temperaturas = [var for var in variables if var != 'pr']
+    t_min = min(np.nanmin(convertir(v, medias[:, columnas[v]] - desviaciones[:, columnas[v]])) for v in temperaturas) \
+        if temperaturas else None
+    t_max = max(np.nanmax(convertir(v, medias[:, columnas[v]] + desviaciones[:, columnas[v]])) for v in temperaturas) \
+        if temperaturas else None
+    pr_max = np.nanmax(convertir('pr', medias[:, columnas['pr']])) if 'pr' in columnas else None
+
+    for c, ax in enumerate(axes):
+        if c >= k:
+            ax.set_visible(False)
+            continue
+        ax.set_title(f"Clúster {c} ({fraccion[c] * 100:.1f}% del área)", color=cmap(c), fontsize=10)
+        if 'pr' in columnas:
+            ax_pr = ax.twinx()
+            ax_pr.bar(meses, convertir('pr', medias[c, columnas['pr']]), color='tab:blue', alpha=0.35)
+            ax_pr.set_ylim(0, pr_max * 1.1 if np.isfinite(pr_max) and pr_max > 0 else 1)
+            if c % ncols == ncols - 1 or c == k - 1:
+                ax_pr.set_ylabel(f"pr ({CONVERSION_FIGURA['pr'][2]})", fontsize=8)
+            ax_pr.tick_params(labelsize=7)
+            ax.set_zorder(ax_pr.get_zorder() + 1)
+            ax.patch.set_visible(False)
+        for var, color in zip(temperaturas, ('tab:red', 'tab:orange', 'tab:green')):
+            media = convertir(var, medias[c, columnas[var]])
+            desviacion = convertir(var, desviaciones[c, columnas[var]], es_desviacion=True)
+            ax.plot(meses, media, color=color, label=var)
+            ax.fill_between(meses, media - desviacion, media + desviacion, color=color, alpha=0.15)
+        if temperaturas and np.isfinite(t_min) and np.isfinite(t_max):
+            ax.set_ylim(t_min, t_max)
+        if c % ncols == 0:
+            ax.set_ylabel(CONVERSION_FIGURA.get(temperaturas[0], (0, 0, ''))[2] if temperaturas else '', fontsize=8)
+        ax.set_xticks(meses)
+        ax.tick_params(labelsize=7)
+        ax.grid(True, linestyle='--', alpha=0.4)
+    if temperaturas:
+        axes[0].legend(fontsize=7, loc='upper left')
+
+    fig.suptitle(f"Perfil climático de los clústeres (k={k})")
+    fig.tight_layout()
+    guardar_figura(fig, ruta_salida, vista_previa, huella)
+
+
+def perfil_clusters(lista_k=None, vista_previa=False, forzar=False):
+    print("==========================================================")
+    print("Perfil climático de cada clúster")
+    print("==========================================================")
+    os.makedirs(RUTA_FIGURES, exist_ok=True)
+
+    print("\n--- 1. Construyendo la matriz de características ---")
+    datos_apilados, matriz_limpia, indices_validos = construir_matriz_features(cargar_climatologias())
+    nombres = nombres_features(datos_apilados)
+    lats = pd.unique(datos_apilados['lat'].values)
+    lons = pd.unique(datos_apilados['lon'].values)
+    pesos = areas_celdas(lats, lons).ravel()[indices_validos]
+    print(f"Matriz: {matriz_limpia.shape} (puntos x características)")
+
+    try:
+        modelo = cargar_modelo_pca(os.path.join(RUTA_PCA_IN, 'modelo_pca.npz'))
+    except (OSError, ValueError) as e:
+        print(f"¡AVISO! No se pudo cargar el modelo PCA ({e}); no se incluirán los centroides.")
+        modelo = None
+    if modelo is not None and [str(v) for v in modelo['variables']] != list(dict.fromkeys(var for var, _ in nombres)):
+        print("¡AVISO! El modelo PCA se entrenó con otro conjunto de características "
+              f"({' '.join(modelo['variables'])}); no se incluirán los centroides.")
+        modelo = None
+
+    archivos = encontrar_todos_los_nc()
+    if lista_k:
+        archivos = [(ruta, k) for ruta, k in archivos if k in lista_k]
+    if not archivos:
+        print(f"¡ERROR! No se encontró ningún mapa de clasificación en {RUTA_KMEANS}")
+        return
+
+    for ruta_mapa, k in archivos:
+        print(f"\n--- k = {k} ---")
+        mapa = leer_mapa_clases(ruta_mapa)['climate_class'].transpose('lat', 'lon')
+        if not (np.array_equal(mapa['lat'].values, lats) and np.array_equal(mapa['lon'].values, lons)):
+            print(f"¡AVISO! {os.path.basename(ruta_mapa)} no usa el grid de las climatologías; se omite.")
+            continue
+        # Mismo orden de puntos que la matriz: stack(punto=('lat', 'lon'))
+        clases = mapa.values.ravel()[indices_validos]
+        area, medias, desviaciones = perfil_por_clase(matriz_limpia, clases, k, pesos)
+
+        centroides = None
+        ruta_centroides = os.path.join(RUTA_KMEANS, f'centroides_k{k}.npz')
+        if modelo is not None and os.path.exists(ruta_centroides):
+            centroides = componentes_a_features(modelo, cargar_centroides(ruta_centroides)['centroides'])
+
+        tabla = tabla_perfil(medias, desviaciones, centroides, nombres)
+        ruta_tabla = os.path.join(RUTA_KMEANS, f"perfil_clusters_k{k}.csv")
+        tabla.to_csv(ruta_tabla, index=False, float_format='%.6g')
+        resumen = tabla.groupby(['clase', 'variable'])['media'].mean().unstack('variable')
+        print("Media anual de cada variable por clúster (unidades originales):")
+        print(resumen.to_string(float_format=lambda x: f'{x:.4g}'))
+        print(f"Tabla guardada en: {ruta_tabla}")
+
+        ruta_figura = os.path.join(RUTA_FIGURES, f"perfil_clusters_k{k}.png")
+        huella = huella_figura('perfil_clusters', (medias, desviaciones, area), k=k,
+                               conversion=CONVERSION_FIGURA, vista_previa=vista_previa)
+        if not figura_al_dia(ruta_figura, huella, forzar):
+            dibujar_climograma(medias, desviaciones, area, nombres, k, ruta_figura, vista_previa, huella)
+            print(f"Climograma guardado en: {ruta_figura}")
+    print("==========================================================")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perfil climático mensual de cada clúster.")
+    parser.add_argument('--k', nargs='+', default=None,
+                        help="Valores de k a analizar (p. ej. 5-7 10). Por defecto, todos los mapas.")
+    parser.add_argument('--vista-previa', action='store_true',
+                        help="Guarda las figuras a baja resolución (mucho más rápido).")
+    parser.add_argument('--forzar', action='store_true',
+                        help="Redibuja las figuras aunque ya estén al día.")
+    args = parser.parse_args()
+    perfil_clusters(lista_k=interpretar_lista_k(args.k) if args.k else None,
+                    vista_previa=args.vista_previa, forzar=args.forzar)
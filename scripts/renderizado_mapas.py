@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+MOTOR DE RENDERIZADO COMÚN PARA LOS MAPAS DE CLASES
+
+Instrucciones:
+1. Lo usan 'clasificacion_kmeans.py' (mapas de cada k) y
+   'analizar_y_mapear_habitats_pandaversion.py' (figura de hábitats).
+2. La proyección Robinson, las costas y la rejilla de meridianos/paralelos
+   ya proyectadas y la malla de bordes de celda ya transformada se calculan
+   una sola vez por proceso (y por grid) y se reutilizan en todos los
+   paneles y figuras (cartopy las reproyectaría en cada dibujo).
+3. Las clases se pintan con 'pcolormesh' sobre esa malla ya proyectada
+   (una celda = un cuadrilátero, sin recalcular contornos como 'contourf').
+   Los campos continuos (p. ej. la idoneidad de hábitat) usan 'dibujar_campo'.
+4. 'renderizar_en_paralelo' reparte varias figuras entre procesos.
+5. Con vista previa (--vista-previa en los scripts) se guarda a DPI_VISTA_PREVIA
+   en lugar de DPI_FINAL.
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import PathCollection
+from matplotlib.colors import BoundaryNorm
+from matplotlib.path import Path
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+from cartopy.mpl.path import shapely_to_path
+
+from mapas_clases import VALOR_RELLENO
+from cache_figuras import metadatos_huella
+
+# --- CONFIGURACIÓN ---
+DPI_FINAL = 300
+DPI_VISTA_PREVIA = 72
+MAPA_COLORES = 'tab20' # Colores bien diferenciados para hasta 20 clases
+RESOLUCION_COSTAS = '110m'
+PASO_MERIDIANOS = 60 # grados
+PASO_PARALELOS = 30 # grados
+PUNTOS_POR_LINEA = 181 # Resolución de cada línea de la rejilla
+
+# Cachés por proceso
+_PROYECCION = {}
+_MALLAS = {}
+_COSTAS = {}
+_REJILLA = {}
+
+
+def proyeccion():
+    """Proyección Robinson compartida por todos los mapas del proceso."""
+    if 'robinson' not in _PROYECCION:
+        _PROYECCION['robinson'] = ccrs.Robinson()
+    return _PROYECCION['robinson']
+
+
+def _bordes(centros, minimo, maximo):
+    """Bordes de celda a partir de los centros, recortados al rango válido."""
+    centros = np.asarray(centros, dtype=np.float64)
+    medios = (centros[:-1] + centros[1:]) / 2
+    primero = centros[0] - (medios[0] - centros[0])
+    ultimo = centros[-1] + (centros[-1] - medios[-1])
+    return np.clip(np.concatenate([[primero], medios, [ultimo]]), minimo, maximo)
+
+
+def malla_proyectada(lats, lons):
+    """
+    Devuelve (x, y) de los bordes de las celdas (n_lat+1 x n_lon+1) ya en
+    coordenadas Robinson. Se calcula una vez por grid.
+    """
+    lats = np.asarray(lats)
+    lons = np.asarray(lons)
+    clave = (lats.tobytes(), lons.tobytes())
+    if clave not in _MALLAS:
+        # Los bordes se recortan a +-180 / +-90 para que ninguna celda cruce el antimeridiano
+        lon_bordes, lat_bordes = np.meshgrid(_bordes(lons, -180, 180), _bordes(lats, -90, 90))
+        puntos = proyeccion().transform_points(ccrs.PlateCarree(), lon_bordes, lat_bordes)
+        _MALLAS[clave] = (puntos[..., 0], puntos[..., 1])
+    return _MALLAS[clave]
+
+
+def trazos_costa():
+    """
+    Trazos (Paths de matplotlib) de las costas ya proyectados a Robinson.
+    Devuelve None si no se pueden cargar (p. ej. sin conexión para
+    descargar Natural Earth); en ese caso los mapas se pintan sin costas.
+    """
+    if 'trazos' not in _COSTAS:
+        try:
+            costa = cfeature.NaturalEarthFeature('physical', 'coastline', RESOLUCION_COSTAS)
+            _COSTAS['trazos'] = [
+                shapely_to_path(proyeccion().project_geometry(geometria, costa.crs))
+                for geometria in costa.geometries()
+            ]
+        except Exception as e:
+            print(f"¡AVISO! No se pudieron cargar las costas; los mapas se pintan sin ellas: {e}")
+            _COSTAS['trazos'] = None
+    return _COSTAS['trazos']
+
+
+def trazos_rejilla():
+    """Meridianos y paralelos ya proyectados a Robinson, como Paths de matplotlib."""
+    if 'trazos' not in _REJILLA:
+        recorrido = np.linspace(-1, 1, PUNTOS_POR_LINEA)
+        lineas = [np.column_stack([np.full_like(recorrido, lon), 90 * recorrido])
+                  for lon in np.arange(-180, 180 + 1, PASO_MERIDIANOS)]
+        lineas += [np.column_stack([180 * recorrido, np.full_like(recorrido, lat)])
+                   for lat in np.arange(-90 + PASO_PARALELOS, 90, PASO_PARALELOS)]
+        _REJILLA['trazos'] = [
+            Path(proyeccion().transform_points(ccrs.PlateCarree(), linea[:, 0], linea[:, 1])[:, :2])
+            for linea in lineas
+        ]
+    return _REJILLA['trazos']
+
+
+def crear_figura_mapas(nrows=1, ncols=1, figsize=(15, 8)):
+    """Figura con nrows x ncols ejes en proyección Robinson. Devuelve (fig, lista de ejes)."""
+    fig, axes = plt.subplots(nrows=nrows, ncols=ncols, figsize=figsize,
+                             subplot_kw={'projection': proyeccion()}, squeeze=False)
+    return fig, list(axes.flatten())
+
+
+def dibujar_costas(ax, alpha=1.0):
+    """Añade las costas cacheadas al eje (sin volver a proyectarlas)."""
+    trazos = trazos_costa()
+    if trazos:
+        ax.add_collection(PathCollection(trazos, facecolor='none', edgecolor='black',
+                                         linewidth=0.75, alpha=alpha, transform=ax.transData))
+
+
+def dibujar_rejilla(ax, alpha=0.5):
+    """Añade la rejilla cacheada (equivalente a ax.gridlines(linestyle='--'))."""
+    ax.add_collection(PathCollection(trazos_rejilla(), facecolor='none', edgecolor='gray',
+                                     linewidth=0.5, linestyle='--', alpha=alpha, transform=ax.transData))
+
+
+def colores_clases(k):
+    """Mapa de colores discreto y su normalización para las clases 0..k-1."""
+    cmap = plt.get_cmap(MAPA_COLORES, k)
+    norm = BoundaryNorm(np.arange(-0.5, k, 1), cmap.N)
+    return cmap, norm
+
+
+def enmascarar_clases(valores):
+    """Enmascara el relleno entero (-1) y los NaN de los mapas filtrados en float."""
+    valores = np.asarray(valores)
+    sin_datos = valores == VALOR_RELLENO
+    if valores.dtype.kind == 'f':
+        sin_datos |= ~np.isfinite(valores)
+    return np.ma.masked_array(valores, mask=sin_datos)
+
+
+def dibujar_clases(ax, lats, lons, clases, k, alpha_costas=1.0, rejilla_alpha=0.5):
+    """
+    Pinta un mapa de clases (lat x lon) en un eje Robinson con pcolormesh
+    sobre la malla cacheada. Devuelve el QuadMesh (para la barra de color).
+    """
+    x, y = malla_proyectada(lats, lons)
+    cmap, norm = colores_clases(k)
+    malla = ax.pcolormesh(x, y, enmascarar_clases(clases), cmap=cmap, norm=norm, shading='flat')
+    dibujar_costas(ax, alpha_costas)
+    dibujar_rejilla(ax, rejilla_alpha)
+    ax.set_global()
+    return malla
+
+
+def dibujar_campo(ax, lats, lons, valores, cmap='viridis', vmin=None, vmax=None,
+                  alpha_costas=1.0, rejilla_alpha=0.5):
+    """
+    Pinta un campo continuo (lat x lon, NaN = sin datos) sobre la misma malla
+    cacheada. Devuelve el QuadMesh (para la barra de color).
+    """
+    x, y = malla_proyectada(lats, lons)
+    malla = ax.pcolormesh(x, y, np.ma.masked_invalid(valores), cmap=cmap, vmin=vmin, vmax=vmax, shading='flat')
+    dibujar_costas(ax, alpha_costas)
+    dibujar_rejilla(ax, rejilla_alpha)
+    ax.set_global()
+    return malla
+
+
+def barra_clases(malla, ax, k, etiqueta='Zona Climática', **kwargs):
+    """Barra de color con una marca centrada en cada clase."""
+    cbar = plt.colorbar(malla, ax=ax, orientation='vertical', **kwargs)
+    cbar.set_ticks(np.arange(k))
+    cbar.set_ticklabels(np.arange(k))
+    cbar.set_label(etiqueta)
+    return cbar
+
+
+def guardar_figura(fig, ruta, vista_previa=False, huella=None, **kwargs):
+    """
+    Guarda la figura a DPI_FINAL (o DPI_VISTA_PREVIA) y la cierra. Si se pasa
+    'huella', queda guardada en el PNG (ver 'cache_figuras.py').
+    """
+    fig.savefig(ruta, dpi=DPI_VISTA_PREVIA if vista_previa else DPI_FINAL,
+                metadata=metadatos_huella(huella), **kwargs)
+    plt.close(fig)
+
+
+def _ejecutar_tarea(tarea):
+    funcion, argumentos = tarea
+    return funcion(**argumentos)
+
+
+def renderizar_en_paralelo(tareas, n_procesos=1):
+    """
+    Ejecuta una lista de tareas de dibujo [(funcion, {argumentos}), ...].
+    Las funciones deben estar definidas a nivel de módulo para poder
+    enviarse a otros procesos. Cada proceso mantiene sus propias cachés.
+    """
+    if n_procesos <= 1 or len(tareas) <= 1:
+        return [_ejecutar_tarea(tarea) for tarea in tareas]
+    with ProcessPoolExecutor(max_workers=min(n_procesos, len(tareas))) as ejecutor:
+        return list(ejecutor.map(_ejecutar_tarea, tareas))
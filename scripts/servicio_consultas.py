@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+SERVICIO LOCAL DE CONSULTAS: CLASE CLIMÁTICA Y HÁBITAT DE PUNTOS (LAT, LON)
+
+Instrucciones:
+1. Se ejecuta después de generar los mapas ('clasificar_multi_k.py' o
+   'generar_mapa_kmeans.py'):
+       python servicio_consultas.py --puerto 8765
+2. Al arrancar carga UNA vez en memoria todos los 'mapa_clasificacion_k*.nc'
+   (cubo k x lat x lon), sus centroides, el modelo PCA y los hábitats de
+   cada especie en cada k (PUNTOS_MUESTRA + filtros geográficos). Cada
+   consulta es solo indexación de arrays, sin leer archivos.
+3. Peticiones (JSON; solo con la biblioteca estándar, http.server):
+   - GET  /clase?lat=42.7&lon=1.0[&k=7]       -> un punto.
+   - POST /puntos  {"lat": [...], "lon": [...], "k": [7, 8], "tierra_cercana": false}
+         -> clase de cada punto en cada k y si cae en el hábitat de cada especie.
+   - POST /clasificar  {"vectores": [[...], ...], "k": [7]}
+         -> clase de climatologías nuevas con el scaler/PCA y centroides
+            guardados. Cada vector tiene las columnas del conjunto con el que
+            se entrenó el PCA ('variables' de 'modelo_pca.npz', ver
+            'features_derivados.py'); con el conjunto 'base', 36 valores
+            (12 meses x pr/tasmax/tasmin).
+   - GET  /estadisticas -> peticiones, puntos, latencias (p50/p99) y
+         rendimiento (puntos/s) de cada tipo de consulta.
+4. Con --medir N se mide la latencia por punto sin arrancar el servidor.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from mapas_clases import VALOR_RELLENO
+from busqueda_puntos import LocalizadorClases
+from modelo_portable import cargar_modelo_pca, cargar_centroides, transformar_a_componentes, asignar_clases
+from filtros_habitat import RUTA_FILTROS, cargar_filtros, compilar_mascaras, aplicar_habitats
+from analizar_y_mapear_habitats_pandaversion import (encontrar_todos_los_nc, cargar_cubo_clases,
+                                                     zonas_todos_k_desde_puntos, DISTANCIA_MAXIMA_TIERRA_KM)
+
+# --- CONFIGURACIÓN ---
+HOST = "127.0.0.1" # Solo accesible desde esta máquina
+PUERTO = 8765
+MAX_PUNTOS_POR_PETICION = 1_000_000
+LATENCIAS_GUARDADAS = 10_000 # Últimas latencias por tipo de consulta (para los percentiles)
+
+# --- RUTAS ---
+RUTA_PCA_IN = "../data_pca"
+RUTA_KMEANS = "../data_kmeans"
+
+
+class ErrorConsulta(ValueError):
+    """Petición mal formada (se responde con un 400)."""
+
+
+class Contadores:
+    """Contadores de peticiones, puntos y latencias por tipo de consulta (seguros entre hilos)."""
+
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self._inicio = time.perf_counter()
+        self._datos = {}
+
+    def registrar(self, consulta, n_puntos, segundos):
+        with self._bloqueo:
+            datos = self._datos.setdefault(consulta, {'peticiones': 0, 'puntos': 0, 'segundos': 0.0,
+                                                      'latencias': deque(maxlen=LATENCIAS_GUARDADAS)})
+            datos['peticiones'] += 1
+            datos['puntos'] += n_puntos
+            datos['segundos'] += segundos
+            datos['latencias'].append(segundos)
+
+    def resumen(self):
+        with self._bloqueo:
+            resumen = {'segundos_activo': round(time.perf_counter() - self._inicio, 3), 'consultas': {}}
+            for consulta, datos in self._datos.items():
+                latencias_us = np.asarray(datos['latencias']) * 1e6
+                resumen['consultas'][consulta] = {
+                    'peticiones': datos['peticiones'],
+                    'puntos': datos['puntos'],
+                    'latencia_p50_us': round(float(np.percentile(latencias_us, 50)), 1),
+                    'latencia_p99_us': round(float(np.percentile(latencias_us, 99)), 1),
+                    'us_por_punto': round(datos['segundos'] * 1e6 / max(datos['puntos'], 1), 3),
+                    'puntos_por_segundo': round(datos['puntos'] / datos['segundos'], 1) if datos['segundos'] else None,
+                }
+            return resumen
+
+
+class ServicioClasificacion:
+    """Mapas, centroides, modelo PCA y hábitats en memoria; responde consultas sin E/S."""
+
+    def __init__(self, lista_k=None, ruta_filtros=RUTA_FILTROS, tierra_cercana=False):
+        archivos = encontrar_todos_los_nc()
+        if lista_k:
+            archivos = [(ruta, k) for ruta, k in archivos if k in lista_k]
+        if not archivos:
+            raise FileNotFoundError(f"No se encontró ningún mapa de clasificación en {RUTA_KMEANS}")
+
+        self.cubo, self.lats, self.lons, self.lista_k = cargar_cubo_clases(archivos)
+        self.posicion_k = {k: i for i, k in enumerate(self.lista_k)}
+        self.cubo_plano = self.cubo.reshape(len(self.lista_k), -1)
+        self.tierra_cercana = tierra_cercana
+        self.localizador = LocalizadorClases.desde_mascara(self.lats, self.lons,
+                                                           (self.cubo != VALOR_RELLENO).any(axis=0))
+
+        # Hábitats: para cada k, máscara plana especies x celdas
+        zonas_por_k = zonas_todos_k_desde_puntos(self.cubo, self.lats, self.lons, self.lista_k)
+        mascaras = compilar_mascaras(cargar_filtros(ruta_filtros), self.lats, self.lons)
+        self.especies = np.array(list(zonas_por_k[self.lista_k[0]]))
+        self.habitats = np.stack([
+            aplicar_habitats(self.cubo[i], zonas_por_k[k], mascaras, k).reshape(len(self.especies), -1)
+            != VALOR_RELLENO
+            for i, k in enumerate(self.lista_k)
+        ])
+
+        # Modelo PCA y centroides (para clasificar climatologías nuevas)
+        ruta_modelo = os.path.join(RUTA_PCA_IN, 'modelo_pca.npz')
+        self.modelo = cargar_modelo_pca(ruta_modelo) if os.path.exists(ruta_modelo) else None
+        self.centroides = {}
+        for k in self.lista_k:
+            ruta = os.path.join(RUTA_KMEANS, f'centroides_k{k}.npz')
+            if os.path.exists(ruta):
+                self.centroides[k] = cargar_centroides(ruta)['centroides']
+
+    def _lista_k(self, valores):
+        if valores is None:
+            return list(self.lista_k)
+        valores = [int(k) for k in np.atleast_1d(valores)]
+        faltan = [k for k in valores if k not in self.posicion_k]
+        if faltan:
+            raise ErrorConsulta(f"k no disponible: {faltan} (disponibles: {self.lista_k})")
+        return valores
+
+    def consultar_puntos(self, lat, lon, lista_k=None, tierra_cercana=None):
+        """
+        {'clases': {k: [...]}, 'habitats': {k: {especie: [True/False, ...]}}, 'sin_datos': n}
+        para arrays de lat/lon: una búsqueda de celdas y una indexación por k.
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        if lat.shape != lon.shape or lat.ndim != 1:
+            raise ErrorConsulta("'lat' y 'lon' deben ser listas de la misma longitud.")
+        if not (np.isfinite(lat).all() and np.isfinite(lon).all()):
+            raise ErrorConsulta("'lat' y 'lon' deben ser números finitos.")
+        if np.abs(lat).max(initial=0.0) > 90.0:
+            raise ErrorConsulta("'lat' debe estar entre -90 y 90.")
+        if len(lat) > MAX_PUNTOS_POR_PETICION:
+            raise ErrorConsulta(f"Máximo {MAX_PUNTOS_POR_PETICION} puntos por petición.")
+        lista_k = self._lista_k(lista_k)
+        tierra_cercana = self.tierra_cercana if tierra_cercana is None else bool(tierra_cercana)
+
+        celdas = self.localizador.indices_planos(lat, lon, tierra_cercana, DISTANCIA_MAXIMA_TIERRA_KM)
+        sin_datos = celdas < 0
+        filas = [self.posicion_k[k] for k in lista_k]
+        indices = np.maximum(celdas, 0)
+        clases = self.cubo_plano[np.ix_(filas, indices)] # n_k x n_puntos
+        clases[:, sin_datos] = VALOR_RELLENO
+        en_habitat = self.habitats[np.ix_(filas, np.arange(len(self.especies)), indices)] # n_k x especies x n_puntos
+        en_habitat[:, :, sin_datos] = False
+
+        return {
+            'clases': {str(k): clases[i].tolist() for i, k in enumerate(lista_k)},
+            'habitats': {str(k): {especie: en_habitat[i, j].tolist() for j, especie in enumerate(self.especies)}
+                         for i, k in enumerate(lista_k)},
+            'sin_datos': int(sin_datos.sum()),
+        }
+
+    def clasificar_vectores(self, vectores, lista_k=None):
+        """
+        Clase de cada climatología con el scaler/PCA y los centroides. Cada fila
+        tiene una columna por característica del modelo (ver 'variables').
+        """
+        if self.modelo is None:
+            raise ErrorConsulta("No hay modelo PCA cargado (falta modelo_pca.npz).")
+        matriz = np.asarray(vectores, dtype=np.float64)
+        if matriz.ndim == 1:
+            matriz = matriz[np.newaxis]
+        n_features = len(self.modelo['scaler_media'])
+        if matriz.ndim != 2 or matriz.shape[1] != n_features:
+            variables = ' '.join(str(v) for v in self.modelo['variables'])
+            raise ErrorConsulta(f"Cada vector debe tener {n_features} valores (variables del modelo: {variables}).")
+        if not np.isfinite(matriz).all():
+            raise ErrorConsulta("Los vectores no pueden tener NaN ni infinitos.")
+        if len(matriz) > MAX_PUNTOS_POR_PETICION:
+            raise ErrorConsulta(f"Máximo {MAX_PUNTOS_POR_PETICION} vectores por petición.")
+        lista_k = [k for k in self._lista_k(lista_k) if k in self.centroides]
+
+        componentes = transformar_a_componentes(self.modelo, matriz)
+        return {
+            'componentes': np.round(componentes, 6).tolist(),
+            'clases': {str(k): asignar_clases(componentes, self.centroides[k]).tolist() for k in lista_k},
+        }
+
+
+def crear_manejador(servicio, contadores):
+    """Clase de manejador HTTP ligada a un servicio y sus contadores."""
+
+    class Manejador(BaseHTTPRequestHandler):
+        def _responder(self, codigo, contenido):
+            cuerpo = json.dumps(contenido, ensure_ascii=False).encode('utf-8')
+            self.send_response(codigo)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def _atender(self, consulta, funcion, n_puntos):
+            try:
+                inicio = time.perf_counter()
+                resultado = funcion()
+                contadores.registrar(consulta, n_puntos(resultado), time.perf_counter() - inicio)
+                self._responder(200, resultado)
+            except (ErrorConsulta, ValueError, TypeError, KeyError) as e:
+                self._responder(400, {'error': str(e)})
+
+        def _leer_json(self):
+            longitud = int(self.headers.get('Content-Length', 0))
+            try:
+                return json.loads(self.rfile.read(longitud) or b'{}')
+            except json.JSONDecodeError as e:
+                raise ErrorConsulta(f"JSON no válido: {e}")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/estadisticas':
+                self._responder(200, contadores.resumen())
+            elif url.path == '/clase':
+                parametros = parse_qs(url.query)
+                self._atender('clase', lambda: servicio.consultar_puntos(
+                    [float(parametros['lat'][0])], [float(parametros['lon'][0])],
+                    parametros.get('k')), lambda r: 1)
+            else:
+                self._responder(404, {'error': f"Ruta desconocida: {url.path}"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            try:
+                peticion = self._leer_json()
+            except ErrorConsulta as e:
+                self._responder(400, {'error': str(e)})
+                return
+            if url.path == '/puntos':
+                self._atender('puntos', lambda: servicio.consultar_puntos(
+                    peticion['lat'], peticion['lon'], peticion.get('k'), peticion.get('tierra_cercana')),
+                    lambda r: int(np.size(peticion['lat'])))
+            elif url.path == '/clasificar':
+                self._atender('clasificar', lambda: servicio.clasificar_vectores(
+                    peticion['vectores'], peticion.get('k')), lambda r: len(r['componentes']))
+            else:
+                self._responder(404, {'error': f"Ruta desconocida: {url.path}"})
+
+        def log_message(self, formato, *args):
+            pass # Sin una línea por petición; las cifras están en /estadisticas
+
+    return Manejador
+
+
+def medir_latencia(servicio, n_puntos, semilla=0):
+    """Mide (sin HTTP) el tiempo por punto de una consulta de n_puntos aleatorios."""
+    rng = np.random.default_rng(semilla)
+    lat = rng.uniform(-90, 90, n_puntos)
+    lon = rng.uniform(-180, 180, n_puntos)
+    servicio.consultar_puntos(lat[:10], lon[:10]) # Calentamiento
+    inicio = time.perf_counter()
+    servicio.consultar_puntos(lat, lon)
+    segundos = time.perf_counter() - inicio
+    print(f"{n_puntos} puntos x {len(servicio.lista_k)} k: {segundos * 1e3:.1f} ms "
+          f"({segundos * 1e6 / n_puntos:.2f} µs por punto, {n_puntos / segundos:,.0f} puntos/s)")
+
+
+def iniciar_servicio(host=HOST, puerto=PUERTO, lista_k=None, tierra_cercana=False, ruta_filtros=RUTA_FILTROS,
+                     medir=None):
+    print("==========================================================")
+    print("Servicio de consultas de clases climáticas y hábitats")
+    print("==========================================================")
+    print("\n--- Cargando mapas, centroides, modelo PCA y hábitats en memoria ---")
+    try:
+        servicio = ServicioClasificacion(lista_k, ruta_filtros, tierra_cercana)
+    except Exception as e:
+        print(f"¡ERROR! No se pudo cargar el servicio: {e}")
+        return
+    print(f"k disponibles: {servicio.lista_k} | especies: {servicio.especies.tolist()}")
+    if servicio.modelo is None:
+        print("¡AVISO! No se encontró modelo_pca.npz; /clasificar no estará disponible.")
+
+    if medir:
+        medir_latencia(servicio, medir)
+        return
+
+    servidor = ThreadingHTTPServer((host, puerto), crear_manejador(servicio, Contadores()))
+    print(f"\nEscuchando en http://{host}:{puerto} (Ctrl+C para terminar)")
+    print(f"  Ejemplo: curl 'http://{host}:{puerto}/clase?lat=42.7&lon=1.0'")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServicio detenido.")
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio HTTP local de consultas de clase climática y hábitat.")
+    parser.add_argument('--host', default=HOST, help="Dirección en la que escuchar.")
+    parser.add_argument('--puerto', type=int, default=PUERTO, help="Puerto en el que escuchar.")
+    parser.add_argument('--k', type=int, nargs='+', default=None,
+                        help="Valores de k a cargar. Por defecto, todos los mapas.")
+    parser.add_argument('--tierra-cercana', action='store_true',
+                        help="Asigna los puntos en océano a la celda de tierra más cercana (por defecto, -1).")
+    parser.add_argument('--filtros', default=RUTA_FILTROS,
+                        help="Archivo JSON con los filtros geográficos de hábitat de cada especie.")
+    parser.add_argument('--medir', type=int, default=None, metavar='N',
+                        help="Mide la latencia con N puntos aleatorios y termina (sin servidor).")
+    args = parser.parse_args()
+    iniciar_servicio(args.host, args.puerto, args.k, args.tierra_cercana, args.filtros, args.medir)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+UTILIDADES COMPARTIDAS PARA EL K-MEANS
+
+Instrucciones:
+1. 'cargar_matriz_pca' lee '../data_pca/componentes_principales.nc' y devuelve
+   la matriz (puntos válidos x componentes) lista para el clustering.
+2. 'barrido_k' ajusta un K-means para cada k de un rango, repartiendo los
+   ajustes entre varios procesos o, en modo "en caliente", inicializando cada
+   k con los centroides del k anterior más una división.
+3. Para grids grandes, 'barrido_k' admite los modos 'minibatch' (MiniBatchKMeans)
+   y 'submuestra' (ajuste sobre una submuestra estratificada por latitud).
+   En ambos, la inercia se evalúa sobre la matriz completa por bloques.
+4. Los ajustes pasan por la caché persistente de 'cache_kmeans.py', de modo
+   que el mismo (matriz, k, semilla, algoritmo) solo se entrena una vez.
+5. El algoritmo se elige con el parámetro 'motor' (ver 'motor_clustering.py').
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xarray as xr
+
+from modelo_portable import TAM_BLOQUE, asignar_clases
+from cache_kmeans import ajustar_con_cache, huella_matriz
+from motor_clustering import SEMILLA, MOTOR_POR_DEFECTO, TAM_LOTE_MINIBATCH, MOTORES, crear_motor
+
+MODOS_BARRIDO = ('exacto', 'minibatch', 'submuestra')
+# Anchura (grados) de las bandas de latitud usadas como estratos
+ANCHO_BANDA_LATITUD = 10.0
+
+# Estado compartido por cada proceso trabajador (se envía una sola vez)
+_ESTADO_TRABAJADOR = {}
+
+
+def cargar_matriz_pca(ruta_pca_in):
+    """
+    Carga los componentes principales y devuelve:
+    (datos_apilados, indices_validos, matriz_limpia)
+    """
+    pca_ds = xr.open_dataset(os.path.join(ruta_pca_in, 'componentes_principales.nc'))
+    datos_apilados = pca_ds.to_array(dim='componente').stack(punto=('lat', 'lon')).transpose('punto', 'componente')
+    indices_validos = ~np.isnan(datos_apilados.values).any(axis=1)
+    matriz_limpia = datos_apilados.values[indices_validos]
+    return datos_apilados, indices_validos, matriz_limpia
+
+
+def desapilar_a_mapa(datos_apilados, indices_validos, valores_validos, relleno=np.nan):
+    """
+    Coloca los valores de los puntos válidos en su celda y devuelve un
+    DataArray (lat x lon); el resto de celdas toma el valor 'relleno'.
+    """
+    valores_validos = np.asarray(valores_validos)
+    tipo = np.result_type(valores_validos.dtype, np.min_scalar_type(relleno))
+    array_completo = np.full(datos_apilados.shape[0], relleno, dtype=tipo)
+    array_completo[indices_validos] = valores_validos
+    return xr.DataArray(array_completo, coords={'punto': datos_apilados.coords['punto']},
+                        dims=('punto',)).unstack('punto')
+
+
+def interpretar_lista_k(valores):
+    """
+    Convierte argumentos como ['5', '7-9', '12'] en [5, 7, 8, 9, 12].
+    """
+    lista_k = set()
+    for valor in valores:
+        for parte in str(valor).split(','):
+            parte = parte.strip()
+            if not parte:
+                continue
+            if '-' in parte:
+                inicio, fin = (int(x) for x in parte.split('-', 1))
+                lista_k.update(range(inicio, fin + 1))
+            else:
+                lista_k.add(int(parte))
+    if not lista_k or min(lista_k) < 2:
+        raise ValueError(f"Lista de k no válida: {valores} (todos los k deben ser >= 2)")
+    return sorted(lista_k)
+
+
+def submuestra_estratificada(latitudes, fraccion, semilla=SEMILLA):
+    """
+    Devuelve índices (ordenados) de una submuestra con la misma proporción de
+    puntos en cada banda de latitud que la matriz completa.
+    """
+    rng = np.random.default_rng(semilla)
+    bandas = np.floor((np.asarray(latitudes) + 90.0) / ANCHO_BANDA_LATITUD).astype(np.int64)
+    seleccion = []
+    for banda in np.unique(bandas):
+        miembros = np.flatnonzero(bandas == banda)
+        n_banda = max(1, int(round(len(miembros) * fraccion)))
+        seleccion.append(rng.choice(miembros, size=n_banda, replace=False))
+    return np.sort(np.concatenate(seleccion))
+
+
+def inercia_por_bloques(matriz, centroides, etiquetas=None, tam_bloque=TAM_BLOQUE):
+    """
+    Suma de distancias al cuadrado de cada punto a su centroide, calculada por
+    bloques. Si no se dan 'etiquetas', cada punto se asigna al centroide más
+    cercano con 'asignar_clases'. Devuelve (inercia, etiquetas).
+    """
+    if etiquetas is None:
+        etiquetas = asignar_clases(matriz, centroides, tam_bloque)
+    etiquetas = np.asarray(etiquetas, dtype=np.int64)
+    inercia = 0.0
+    for inicio in range(0, matriz.shape[0], tam_bloque):
+        diferencias = matriz[inicio:inicio + tam_bloque] - centroides[etiquetas[inicio:inicio + tam_bloque]]
+        inercia += float(np.einsum('ij,ij->', diferencias, diferencias))
+    return inercia, etiquetas
+
+
+def _motor_efectivo(modo, motor):
+    # El modo 'minibatch' se mantiene como atajo del motor del mismo nombre
+    return 'minibatch' if modo == 'minibatch' else motor
+
+
+def _ajustar(matriz, k, modo, motor, indices_submuestra, init=None):
+    """
+    Ajusta un modelo para 'k'. En los modos escalables, la inercia y las
+    etiquetas se recalculan sobre la matriz completa.
+    """
+    matriz_ajuste = matriz if indices_submuestra is None else matriz[indices_submuestra]
+    modelo = crear_motor(motor, k, init=init).ajustar(matriz_ajuste)
+
+    if modo == 'exacto':
+        inercia, etiquetas = modelo.inercia, modelo.etiquetas
+    else:
+        inercia, etiquetas = inercia_por_bloques(matriz, modelo.centroides, modelo.predecir(matriz))
+
+    return {'k': k, 'inercia': inercia, 'centroides': modelo.centroides, 'etiquetas': etiquetas,
+            'algoritmo': motor}
+
+
+def nombre_algoritmo(modo, fraccion_submuestra=None, en_caliente=False, motor=MOTOR_POR_DEFECTO):
+    """Identificador del algoritmo usado como parte de la clave de la caché."""
+    if motor == 'minibatch':
+        nombre = f"minibatch-lote{TAM_LOTE_MINIBATCH}"
+    else:
+        nombre = motor
+    if MOTORES[motor].version > 1:
+        nombre = f"{nombre}-v{MOTORES[motor].version}"
+    if modo == 'submuestra':
+        nombre = f"{nombre}-submuestra-{fraccion_submuestra}-banda{ANCHO_BANDA_LATITUD}"
+    return f"caliente-{nombre}" if en_caliente else nombre
+
+
+def _ajustar_con_cache(matriz, k, modo, motor, indices_submuestra, algoritmo, huella, init=None):
+    if huella is None:
+        return _ajustar(matriz, k, modo, motor, indices_submuestra, init=init)
+    resultado = ajustar_con_cache(
+        matriz, k, SEMILLA, algoritmo,
+        lambda: _ajustar(matriz, k, modo, motor, indices_submuestra, init=init),
+        huella=huella,
+    )
+    resultado['algoritmo'] = motor
+    return resultado
+
+
+def ajustar_kmeans(matriz, k, motor=MOTOR_POR_DEFECTO, usar_cache=True):
+    """
+    Ajuste de referencia (el mismo que el barrido exacto) con el motor
+    indicado, pasando por la caché: si el codo ya ajustó este k, no se
+    vuelve a entrenar.
+    """
+    huella = huella_matriz(matriz) if usar_cache else None
+    return _ajustar_con_cache(matriz, k, 'exacto', motor, None,
+                              nombre_algoritmo('exacto', motor=motor), huella)
+
+
+def _inicializar_trabajador(matriz, modo, motor, indices_submuestra, algoritmo, huella):
+    _ESTADO_TRABAJADOR['matriz'] = matriz
+    _ESTADO_TRABAJADOR['modo'] = modo
+    _ESTADO_TRABAJADOR['motor'] = motor
+    _ESTADO_TRABAJADOR['indices_submuestra'] = indices_submuestra
+    _ESTADO_TRABAJADOR['algoritmo'] = algoritmo
+    _ESTADO_TRABAJADOR['huella'] = huella
+
+
+def _ajustar_k_trabajador(k):
+    return _ajustar_con_cache(_ESTADO_TRABAJADOR['matriz'], k, _ESTADO_TRABAJADOR['modo'],
+                              _ESTADO_TRABAJADOR['motor'], _ESTADO_TRABAJADOR['indices_submuestra'],
+                              _ESTADO_TRABAJADOR['algoritmo'], _ESTADO_TRABAJADOR['huella'])
+
+
+def dividir_cluster(matriz, centroides, etiquetas):
+    """
+    Genera k+1 centroides iniciales a partir de k: el clúster con mayor
+    inercia se divide en dos a lo largo de su dirección principal.
+    """
+    diferencias = matriz - centroides[etiquetas]
+    inercia_por_cluster = np.bincount(
+        etiquetas, weights=np.einsum('ij,ij->i', diferencias, diferencias),
+        minlength=len(centroides)
+    )
+    peor = int(np.argmax(inercia_por_cluster))
+    miembros = diferencias[etiquetas == peor]
+
+    if len(miembros) < 2:
+        desplazamiento = np.zeros(matriz.shape[1])
+    else:
+        # Primer vector singular = dirección de máxima varianza del clúster
+        _, valores_singulares, vectores = np.linalg.svd(miembros, full_matrices=False)
+        desviacion = valores_singulares[0] / np.sqrt(len(miembros))
+        desplazamiento = vectores[0] * desviacion
+
+    nuevos = centroides.copy()
+    nuevos[peor] = centroides[peor] + desplazamiento
+    return np.vstack([nuevos, centroides[peor] - desplazamiento])
+
+
+def _barrido_en_caliente(matriz, lista_k, modo, motor, indices_submuestra, algoritmo, huella, mostrar):
+    resultados = []
+    anterior = None
+    cadena = []
+    for k in lista_k:
+        if anterior is None or anterior['k'] >= k:
+            anterior = _ajustar_con_cache(matriz, k, modo, motor, indices_submuestra,
+                                          algoritmo.replace('caliente-', '', 1), huella)
+            cadena = [k]
+        else:
+            # El ajuste depende de toda la cadena de k desde el último arranque en frío
+            # (p. ej. 5>6>7 no es lo mismo que 5>7 ni que 2>...>7), así que va en la clave
+            cadena.append(k)
+            centroides, etiquetas = anterior['centroides'], anterior['etiquetas']
+            # Si el rango salta varios k, dividimos varias veces
+            for _ in range(k - anterior['k']):
+                centroides = dividir_cluster(matriz, centroides, etiquetas)
+                etiquetas = asignar_clases(matriz, centroides)
+            anterior = _ajustar_con_cache(matriz, k, modo, motor, indices_submuestra,
+                                          f"{algoritmo}-cadena{'>'.join(map(str, cadena))}", huella,
+                                          init=centroides)
+        resultados.append(anterior)
+        if mostrar:
+            print(f"  k={k:2d} -> inercia {anterior['inercia']:.2f}")
+    return resultados
+
+
+def barrido_k(matriz, k_range, n_procesos=1, en_caliente=False, modo='exacto',
+              fraccion_submuestra=0.1, latitudes=None, mostrar=True, usar_cache=True,
+              motor=MOTOR_POR_DEFECTO):
+    """
+    Ajusta un modelo para cada k de 'k_range' y devuelve una lista de
+    diccionarios con 'k', 'inercia', 'centroides', 'etiquetas' y 'algoritmo'.
+
+    - n_procesos > 1: los k se reparten entre procesos (ajustes independientes).
+    - en_caliente: cada k parte de los centroides del k anterior más una
+      división. Es secuencial por definición, así que ignora 'n_procesos'.
+    - modo: 'exacto' (ajuste sobre todos los puntos), 'minibatch' (atajo para
+      el motor MiniBatchKMeans) o 'submuestra' (ajuste sobre una submuestra
+      estratificada por 'latitudes').
+    - motor: nombre del motor de 'motor_clustering.MOTORES'.
+    - usar_cache: lee y guarda cada ajuste en la caché persistente.
+    """
+    if modo not in MODOS_BARRIDO:
+        raise ValueError(f"Modo '{modo}' no válido. Opciones: {MODOS_BARRIDO}")
+    if motor not in MOTORES:
+        raise ValueError(f"Motor '{motor}' no válido. Opciones: {list(MOTORES)}")
+    motor = _motor_efectivo(modo, motor)
+    lista_k = list(k_range)
+
+    indices_submuestra = None
+    if modo == 'submuestra':
+        if latitudes is None:
+            raise ValueError("El modo 'submuestra' necesita las latitudes de cada punto.")
+        indices_submuestra = submuestra_estratificada(latitudes, fraccion_submuestra)
+        if mostrar:
+            print(f"Submuestra estratificada: {len(indices_submuestra)} de {len(matriz)} puntos.")
+
+    algoritmo = nombre_algoritmo(modo, fraccion_submuestra, en_caliente, motor)
+    # La huella se calcula una sola vez y se comparte con los trabajadores
+    huella = huella_matriz(matriz) if usar_cache else None
+
+    if en_caliente:
+        return _barrido_en_caliente(matriz, lista_k, modo, motor, indices_submuestra, algoritmo, huella, mostrar)
+
+    if n_procesos <= 1:
+        _inicializar_trabajador(matriz, modo, motor, indices_submuestra, algoritmo, huella)
+        resultados = [_ajustar_k_trabajador(k) for k in lista_k]
+    else:
+        with ProcessPoolExecutor(max_workers=n_procesos,
+                                 initializer=_inicializar_trabajador,
+                                 initargs=(matriz, modo, motor, indices_submuestra, algoritmo, huella)) as ejecutor:
+            resultados = list(ejecutor.map(_ajustar_k_trabajador, lista_k))
+
+    for resultado in resultados if mostrar else []:
+        print(f"  k={resultado['k']:2d} -> inercia {resultado['inercia']:.2f}")
+    return resultados